@@ -0,0 +1,146 @@
+"""JSON API for Warbler's front end, version 1 (mounted at /api/v1).
+
+Requests are authenticated by the session cookie, like the HTML views.
+Anything that isn't a GET must carry the page's CSRF token in an
+X-CSRFToken header (see static/like.js).
+
+- GET /api/v1/timeline?before=<cursor>: a page of the home timeline
+- PUT / DELETE /api/v1/messages/<id>/like: like / unlike a message
+- PUT / DELETE /api/v1/users/<id>/follow: follow / unfollow a user
+
+Writes answer 204 No Content. Message ids are 64-bit (see ids.py), more
+than a JavaScript number holds exactly, so ids and cursors are strings.
+"""
+
+import orjson
+from flask import Blueprint, abort, current_app, g, request
+from flask_wtf.csrf import validate_csrf
+from werkzeug.exceptions import HTTPException
+from wtforms import ValidationError
+
+import following
+from following import CannotFollow
+from models import db, Like, User
+from pagination import InvalidCursor
+import timeline
+from trending import trending
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+def json_response(data, status=200):
+    """Response with `data` serialized by orjson (datetimes as UTC)."""
+
+    return current_app.response_class(
+        orjson.dumps(data, option=orjson.OPT_NAIVE_UTC),
+        status=status,
+        mimetype='application/json')
+
+
+def error(status, message):
+    return json_response({"error": message}, status)
+
+
+def no_content():
+    return current_app.response_class(status=204)
+
+
+@api.before_request
+def check_auth():
+    """Require a logged-in user, and a CSRF token for writes."""
+
+    if not g.user:
+        return error(401, "Log in first.")
+
+    if (request.method != 'GET'
+            and current_app.config.get('WTF_CSRF_ENABLED', True)):
+        try:
+            validate_csrf(request.headers.get('X-CSRFToken'))
+        except ValidationError as e:
+            return error(400, str(e))
+
+
+@api.errorhandler(HTTPException)
+@api.errorhandler(404)
+def http_error(e):
+    # 404 is listed on its own so it wins over the app's HTML 404 page
+    return error(e.code, e.description)
+
+
+@api.errorhandler(InvalidCursor)
+def bad_cursor(e):
+    return error(400, "Invalid pagination cursor.")
+
+
+def serialize_message(message, liked):
+    user = message.user
+    return {
+        "id": str(message.id),
+        "text": message.text,
+        "timestamp": message.timestamp,
+        "user": {
+            "id": user.id,
+            "username": user.username,
+            "image_url": user.image_url,
+        },
+        "liked": liked,
+    }
+
+
+@api.route('/timeline')
+def get_timeline():
+    """A page of the logged-in user's home timeline, newest first."""
+
+    page = timeline.home_timeline(g.user.id, before=request.args.get('before'))
+    liked_ids = Like.message_ids_liked_by(
+        g.user.id, [message.id for message in page.items])
+
+    return json_response({
+        "messages": [serialize_message(message, message.id in liked_ids)
+                     for message in page.items],
+        "next": page.next_cursor,
+    })
+
+
+@api.route('/messages/<int:message_id>/like', methods=['PUT'])
+def like(message_id):
+    """Like a message. Liking it again changes nothing."""
+
+    added = Like.add(g.user.id, message_id)
+    if added is None:
+        abort(404)
+    db.session.commit()
+    if added:
+        trending.record_like(message_id)
+    return no_content()
+
+
+@api.route('/messages/<int:message_id>/like', methods=['DELETE'])
+def unlike(message_id):
+    """Unlike a message. Unliking it again changes nothing."""
+
+    if Like.remove(g.user.id, message_id):
+        db.session.commit()
+        trending.record_like(message_id, -1)
+    return no_content()
+
+
+@api.route('/users/<int:user_id>/follow', methods=['PUT'])
+def follow(user_id):
+    """Follow a user (and copy their recent messages into the timeline)."""
+
+    followed_user = User.query.get_or_404(user_id)
+    try:
+        following.follow(g.user, followed_user)
+    except CannotFollow as e:
+        return error(400, str(e))
+    return no_content()
+
+
+@api.route('/users/<int:user_id>/follow', methods=['DELETE'])
+def unfollow(user_id):
+    """Stop following a user."""
+
+    followed_user = User.query.get_or_404(user_id)
+    following.unfollow(g.user, followed_user)
+    return no_content()
@@ -1,54 +1,251 @@
+import hashlib
 import os
+import time
+from functools import cached_property
 
-from flask import Flask, render_template, request, flash, redirect, session, g
-from flask_debugtoolbar import DebugToolbarExtension
-from sqlalchemy.exc import IntegrityError
+import click
 
+from flask import (
+    Blueprint, Flask, current_app, render_template, request, flash, redirect, session, g, url_for,
+    has_request_context, jsonify, abort, make_response, send_from_directory)
+from flask.ctx import _AppCtxGlobals
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+
+from api import api
+from assets import MAX_AGE, asset_url, content_hash, split_hashed_name
+from database import engine_options, read_only
+from follow_graph import follow_graph
+import following
+from following import CannotFollow
+from fragment_cache import CSRF_PLACEHOLDER, fragment_cache, stitch
 from forms import UserAddForm, LoginForm, LogoutForm, MessageForm, UserEditForm, LikeForm
-from models import db, connect_db, User, Message, Like
+from hashing import HashingBusy, password_hasher
+from ids import check_worker_id_config
+from instrumentation import metrics
+from live import live
+from models import db, connect_db, User, Message, Like, Follows
+from pagination import (
+    MESSAGES_PER_PAGE, InvalidCursor, Page, paginate_by_id, paginate_ids)
+import recommendations
+from search import message_search, user_search
+import timeline
+from trending import MESSAGE_LIKES, USER_FOLLOWERS, trending
 
 CURR_USER_KEY = "curr_user"
 
-app = Flask(__name__)
+# Retry-After for requests turned away while password hashing is backed up
+RETRY_AFTER_SECONDS = 5
+
+# Every page, form and command-line task of the site; `create_app()` puts
+# them together with the JSON API (api.py) into the app.
+views = Blueprint('views', __name__, cli_group=None)
+
+
+def create_app(config=None):
+    """Create the Warbler app.
 
-# Get DB_URI from environ variable (useful for production/testing) or,
-# if not set there, use development local db.
-app.config['SQLALCHEMY_DATABASE_URI'] = (
-    os.environ.get('DATABASE_URL', 'postgres:///warbler'))
+    Settings come from the environment, then from the `config` dict, so
+    tests and scripts can point an app at their own database:
 
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = False
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
-toolbar = DebugToolbarExtension(app)
+        app = create_app({'SQLALCHEMY_DATABASE_URI': "postgresql:///other"})
 
-connect_db(app)
+    Nothing connects to the database until the app handles a request.
+    """
+
+    app = Flask(__name__)
+
+    # Get DB_URI from environ variable (useful for production/testing) or,
+    # if not set there, use development local db.
+    app.config['SQLALCHEMY_DATABASE_URI'] = (
+        os.environ.get('DATABASE_URL', 'postgres:///warbler'))
+
+    # Read replicas and connection pool settings (see database.py)
+    app.config['DATABASE_REPLICA_URLS'] = os.environ.get(
+        'DATABASE_REPLICA_URLS')
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(os.environ)
+
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ECHO'] = False
+    app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
+    app.config['BCRYPT_LOG_ROUNDS'] = int(
+        os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    if 'PASSWORD_HASH_WORKERS' in os.environ:
+        app.config['PASSWORD_HASH_WORKERS'] = int(
+            os.environ['PASSWORD_HASH_WORKERS'])
+
+    app.config.update(config or {})
+    check_worker_id_config(app)
+
+    app.app_ctx_globals_class = RequestGlobals
+
+    # The debug toolbar is for development only: it slows every request
+    # down and shows far too much. In production, see /metrics
+    # (instrumentation.py).
+    if app.debug:
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
+
+    connect_db(app)
+    metrics.init_app(app)
+    app.register_blueprint(views)
+    app.register_blueprint(api)
+
+    return app
+
+
+@metrics.collector
+def cache_and_hashing_metrics():
+    """Fragment cache hit rate and password hashing times, for /metrics."""
+
+    yield ('warbler_fragment_cache_hits_total', 'counter',
+           "Message fragments served from the cache.", {},
+           fragment_cache.hits)
+    yield ('warbler_fragment_cache_misses_total', 'counter',
+           "Message fragments rendered.", {}, fragment_cache.misses)
+
+    for op, timings in password_hasher.stats().items():
+        labels = {'op': op}
+        yield ('warbler_password_hash_calls_total', 'counter',
+               "Password hashes and checks.", labels, timings['calls'])
+        yield ('warbler_password_hash_seconds_total', 'counter',
+               "Time spent hashing and checking passwords.", labels,
+               timings['seconds'])
+        yield ('warbler_password_hash_queued_seconds_total', 'counter',
+               "Time hashes and checks waited for a worker.", labels,
+               timings['queued_seconds'])
 
 
 ##############################################################################
 # Custom Error handler: 404
 
-@app.errorhandler(404)
+@views.app_errorhandler(404)
 def page_not_found(e):
     # note that we set the 404 status explicitly
     return render_template('404.html'), 404
 
+
+@views.app_errorhandler(InvalidCursor)
+def bad_cursor(e):
+    return "Invalid pagination cursor.", 400
+
+
+@views.app_errorhandler(HashingBusy)
+def hashing_busy(e):
+    return ("Too busy checking passwords; please try again in a moment.",
+            503, {'Retry-After': RETRY_AFTER_SECONDS})
+
 ##############################################################################
 # User signup/login/logout
 
 
-@app.before_request
-def add_user_to_g():
-    """If we're logged in, add curr user to Flask global."""
+class RequestGlobals(_AppCtxGlobals):
+    """Flask global that loads the logged-in user on first use.
+
+    Pages that never touch `g.user` (and static files) don't query for it,
+    and the forms only logged-in pages need are built on demand too.
+
+    Which messages the user likes and which users they follow are not
+    loaded here: views call `load_like_state()` / `load_follow_state()` for
+    just the messages or users they render.
+    """
+
+    @cached_property
+    def user_id(self):
+        """Id of the logged-in user (from the session, no query), or None."""
+
+        if has_request_context():
+            return session.get(CURR_USER_KEY)
+        return None
+
+    @cached_property
+    def user(self):
+        """The logged-in User, or None."""
+
+        if self.user_id is None:
+            return None
+        return User.query.get(self.user_id)
+
+    @cached_property
+    def liked_ids(self):
+        """Ids of the rendered messages the user likes (see
+        `load_like_state()`)."""
+
+        return set()
+
+    @cached_property
+    def following_ids(self):
+        """Ids of the rendered users the user follows (see
+        `load_follow_state()`)."""
+
+        return set()
+
+    @cached_property
+    def logout_form(self):
+        return LogoutForm()
+
+    @cached_property
+    def like_form(self):
+        return LikeForm()
+
+    @cached_property
+    def message_form(self):
+        return MessageForm()
+
+
+def load_like_state(messages):
+    """Remember which of `messages` the logged-in user likes, for _like.html.
+
+    This is one query on `likes` for the ids of the messages being rendered,
+    rather than loading everything the user ever liked.
+    """
+
+    if g.user_id is not None:
+        g.liked_ids = Like.message_ids_liked_by(
+            g.user_id, [message.id for message in messages])
+
+
+def load_follow_state(users):
+    """Remember which of `users` the logged-in user follows, for _users.html.
+
+    Answered from the follow graph (see follow_graph.py): at most one query
+    on `follows`, for the user's whole following list, which later pages
+    reuse until the user's version changes.
+    """
+
+    if g.user_id is not None:
+        g.following_ids = follow_graph.following_ids_among(
+            g.user_id, [user.id for user in users], g.user.version)
+
+
+@views.app_template_global()
+def like_state(message):
+    """How _like.html renders for the logged-in user: "own", "liked",
+    "not-liked" or "anon"."""
+
+    if g.user_id is None:
+        return "anon"
+    if message.user_id == g.user_id:
+        return "own"
+    return "liked" if message.id in g.liked_ids else "not-liked"
 
-    if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
-        g.logout_form = LogoutForm()
-        g.like_form = LikeForm()
-        g.liked_messages = set(g.user.liked_messages)
-        g.message_form = MessageForm()
-    else:
-        g.user = None
+
+@views.app_template_global()
+def message_fragments(messages):
+    """The _message.html fragments for `messages`, from the fragment cache
+    (see fragment_cache.py). Call `load_like_state()` first."""
+
+    fragments = fragment_cache.render_messages(
+        messages,
+        {message.id: like_state(message) for message in messages},
+        lambda message: render_template('_message.html',
+                                        message=message,
+                                        user=message.user,
+                                        like_form_fields=CSRF_PLACEHOLDER))
+
+    return stitch(fragments, lambda: g.like_form.hidden_tag())
 
 
 def do_login(user):
@@ -64,7 +261,18 @@ def do_logout():
         del session[CURR_USER_KEY]
 
 
-@app.route('/signup', methods=["GET", "POST"])
+def busy_form(template, form):
+    """Re-present a login or signup form whose password couldn't be hashed
+    in time, asking the user to submit it again."""
+
+    db.session.rollback()
+    flash("We're very busy right now; please try again in a moment.",
+          'warning')
+    return (render_template(template, form=form), 503,
+            {'Retry-After': RETRY_AFTER_SECONDS})
+
+
+@views.route('/signup', methods=["GET", "POST"])
 def signup():
     """Handle user signup.
 
@@ -92,6 +300,9 @@ def signup():
             flash("Username already taken", 'danger')
             return render_template('users/signup.html', form=form)
 
+        except HashingBusy:
+            return busy_form('users/signup.html', form)
+
         do_login(user)
 
         return redirect("/")
@@ -100,17 +311,22 @@ def signup():
         return render_template('users/signup.html', form=form)
 
 
-@app.route('/login', methods=["GET", "POST"])
+@views.route('/login', methods=["GET", "POST"])
 def login():
     """Handle user login."""
 
     form = LoginForm()
 
     if form.validate_on_submit():
-        user = User.authenticate(form.username.data,
-                                 form.password.data)
+        try:
+            user = User.authenticate(form.username.data,
+                                     form.password.data)
+        except HashingBusy:
+            return busy_form('users/login.html', form)
 
         if user:
+            # saves the password hash if authenticate() upgraded it
+            db.session.commit()
             do_login(user)
             flash(f"Hello, {user.username}!", "success")
             return redirect("/")
@@ -120,7 +336,7 @@ def login():
     return render_template('users/login.html', form=form)
 
 
-@app.route('/logout', methods=["POST"])
+@views.route('/logout', methods=["POST"])
 def logout():
     """Handle logout of user."""
     if g.logout_form.validate_on_submit():
@@ -129,36 +345,198 @@ def logout():
         return redirect('/login')
     return redirect('/')
 
+##############################################################################
+# HTTP caching
+#
+# Pages are sent with a strong ETag computed from the rows they show, before
+# rendering; when the browser already has that version it gets a 304 and the
+# template never runs. Pages hold per-session content (the viewer's follow
+# and like state, CSRF tokens), so they are cached privately and always
+# revalidated.
+
+# Cached pages get fresh CSRF tokens at least this often (well within
+# WTF_CSRF_TIME_LIMIT, an hour by default).
+CSRF_REFRESH_SECONDS = 30 * 60
+
+
+def versions_of(part):
+    """What `part` contributes to an ETag: users their version, messages
+    their id and their author's version, lists each of their items."""
+
+    if isinstance(part, User):
+        return ('user', part.id, part.version)
+    if isinstance(part, Message):
+        return ('message', part.id, part.user.version)
+    if isinstance(part, (list, tuple)):
+        return [versions_of(item) for item in part]
+    return part
+
+
+def page_etag(*parts):
+    """Strong ETag for this request's page, built from `parts` (rows,
+    lists of rows, cursors) as seen by the logged-in user.
+
+    Call after `load_like_state()` / `load_follow_state()`.
+    """
+
+    viewer = (g.user_id,
+              g.user.version if g.user else None,
+              sorted(g.liked_ids),
+              sorted(g.following_ids),
+              session.get('csrf_token'),
+              int(time.time() // CSRF_REFRESH_SECONDS))
+    key = repr((request.full_path, versions_of(parts), viewer))
+
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def render_cached(etag, render):
+    """Respond with `render()`, or with 304 Not Modified if the browser
+    already has the page tagged `etag`."""
+
+    if '_flashes' in session:
+        # flashed messages are shown once, on whatever page renders next
+        return render()
+
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(render())
+
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+views.add_app_template_global(asset_url)
+
+
+@views.route('/assets/<path:filename>')
+def asset(filename):
+    """A file from static/, by its content-hashed name (see assets.py).
+
+    The name changes with the contents, so it is cached for good.
+    """
+
+    name = split_hashed_name(filename)
+    try:
+        if name is None or content_hash(name[0]) != name[1]:
+            abort(404)
+    except (FileNotFoundError, IsADirectoryError):
+        abort(404)
+
+    response = send_from_directory(current_app.static_folder, name[0],
+                                   max_age=MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+##############################################################################
+# Paginated listings
+
+
+def render_page(template, fragment_template, page, **context):
+    """Render one page of a keyset-paginated listing.
+
+    If the request has `fragment=1` (sent by static/infinite_scroll.js),
+    only `fragment_template` is rendered: the items of this page followed
+    by a marker linking to the next one.
+
+    Sent with an ETag built from the page's rows and `context` (see
+    `render_cached()`).
+    """
+
+    next_url = None
+    if page.next_cursor:
+        args = request.args.to_dict()
+        args.pop('fragment', None)
+        args['before'] = page.next_cursor
+        next_url = url_for(request.endpoint, **request.view_args, **args)
+
+    if request.args.get('fragment'):
+        template = fragment_template
+
+    etag = page_etag(page.items, page.next_cursor, sorted(context.items()))
+    return render_cached(
+        etag,
+        lambda: render_template(template, page=page, next_url=next_url,
+                                **context))
+
+
 ##############################################################################
 # General user routes:
 
-@app.route('/users')
+@views.route('/users')
+@read_only
 def list_users():
     """Page with listing of users.
 
-    Can take a 'q' param in querystring to search by that username.
+    Can take a 'q' param in querystring to search usernames, bios and
+    locations (see search.py); search results are ranked and limited
+    rather than paginated.
     """
 
-    search = request.args.get('q')
+    query = request.args.get('q')
 
-    if not search:
-        users = User.query.all()
+    if not query:
+        page = paginate_by_id(User.query, User.id,
+                              before=request.args.get('before'))
     else:
-        users = User.query.filter(User.username.like(f"%{search}%")).all()
+        page = Page(user_search.search(query), None)
+
+    load_follow_state(page.items)
 
-    return render_template('users/index.html', users=users)
+    return render_page('users/index.html', '_user_list.html', page)
 
 
-@app.route('/users/<int:user_id>')
+@views.route('/users/typeahead')
+def users_typeahead():
+    """JSON list of users whose username starts with the 'q' param."""
+
+    query = request.args.get('q', '')
+    users = user_search.typeahead(query) if query else []
+
+    return jsonify([
+        {"id": user.id, "username": user.username, "image_url": user.image_url}
+        for user in users
+    ])
+
+
+@views.route('/users/suggestions')
+@read_only
+def users_suggestions():
+    """The logged-in user's "Who to follow": an HTML fragment that
+    static/suggestions.js puts in the home page aside (see
+    recommendations.py)."""
+
+    if g.user_id is None:
+        return jsonify(error="Access unauthorized."), 401
+
+    users = recommendations.suggestions_for(g.user_id, g.user.version)
+    return render_template('_suggestions.html', users=users)
+
+
+@views.route('/users/<int:user_id>')
+@read_only
 def users_show(user_id):
     """Show user profile."""
 
     user = User.query.get_or_404(user_id)
+    page = paginate_by_id(Message.query.filter_by(user_id=user_id),
+                          Message.id,
+                          before=request.args.get('before'),
+                          per_page=MESSAGES_PER_PAGE)
+    load_like_state(page.items)
+    load_follow_state([user])
 
-    return render_template('users/show.html', user=user)
+    return render_page('users/show.html', '_message_list.html', page,
+                       user=user)
 
 
-@app.route('/users/<int:user_id>/likes')
+@views.route('/users/<int:user_id>/likes')
+@read_only
 def show_likes(user_id):
     """Show list of warbles this user has liked."""
 
@@ -167,10 +545,24 @@ def show_likes(user_id):
         return redirect("/")
 
     user = User.query.get_or_404(user_id)
-    return render_template('likes/show.html', user=user)
-
-
-@app.route('/users/<int:user_id>/following')
+    liked = (Message
+             .query
+             .join(Like, Like.msg_id == Message.id)
+             .filter(Like.user_id == user_id)
+             .options(joinedload(Message.user)))
+    page = paginate_by_id(liked,
+                          Message.id,
+                          before=request.args.get('before'),
+                          per_page=MESSAGES_PER_PAGE)
+    load_like_state(page.items)
+    load_follow_state([user])
+
+    return render_page('likes/show.html', '_message_list.html', page,
+                       user=user)
+
+
+@views.route('/users/<int:user_id>/following')
+@read_only
 def show_following(user_id):
     """Show list of people this user is following."""
 
@@ -179,10 +571,15 @@ def show_following(user_id):
         return redirect("/")
 
     user = User.query.get_or_404(user_id)
-    return render_template('users/following.html', user=user)
+    page = users_page(follow_graph.following(user_id, user.version))
+    load_follow_state(page.items + [user])
 
+    return render_page('users/following.html', '_user_list.html', page,
+                       user=user)
 
-@app.route('/users/<int:user_id>/followers')
+
+@views.route('/users/<int:user_id>/followers')
+@read_only
 def users_followers(user_id):
     """Show list of followers of this user."""
 
@@ -191,10 +588,26 @@ def users_followers(user_id):
         return redirect("/")
 
     user = User.query.get_or_404(user_id)
-    return render_template('users/followers.html', user=user)
+    page = users_page(follow_graph.followers(user_id, user.version))
+    load_follow_state(page.items + [user])
+
+    return render_page('users/followers.html', '_user_list.html', page,
+                       user=user)
+
+
+def users_page(user_ids):
+    """A Page of the users with `user_ids` (sorted ids from the follow
+    graph), newest first, from the 'before' param."""
+
+    page = paginate_ids(user_ids, before=request.args.get('before'))
+    users = (User.query
+             .filter(User.id.in_(page.items))
+             .order_by(User.id.desc())
+             .all()) if page.items else []
+    return Page(users, page.next_cursor)
 
 
-@app.route('/users/follow/<int:follow_id>', methods=['POST'])
+@views.route('/users/follow/<int:follow_id>', methods=['POST'])
 def add_follow(follow_id):
     """Add a follow for the currently-logged-in user."""
 
@@ -203,13 +616,15 @@ def add_follow(follow_id):
         return redirect("/")
 
     followed_user = User.query.get_or_404(follow_id)
-    g.user.following.append(followed_user)
-    db.session.commit()
+    try:
+        following.follow(g.user, followed_user)
+    except CannotFollow as e:
+        flash(str(e), "danger")
 
     return redirect(f"/users/{g.user.id}/following")
 
 
-@app.route('/users/stop-following/<int:follow_id>', methods=['POST'])
+@views.route('/users/stop-following/<int:follow_id>', methods=['POST'])
 def stop_following(follow_id):
     """Have currently-logged-in-user stop following this user."""
 
@@ -217,14 +632,13 @@ def stop_following(follow_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get(follow_id)
-    g.user.following.remove(followed_user)
-    db.session.commit()
+    followed_user = User.query.get_or_404(follow_id)
+    following.unfollow(g.user, followed_user)
 
     return redirect(f"/users/{g.user.id}/following")
 
 
-@app.route('/users/profile', methods=["GET", "POST"])
+@views.route('/users/profile', methods=["GET", "POST"])
 def profile():
     """Update profile for current user."""
 
@@ -235,7 +649,7 @@ def profile():
     form = UserEditForm(obj=g.user)
 
     if form.validate_on_submit():
-        if User.authenticate(g.user.username, form.password.data):
+        if g.user.check_password(form.password.data):
             g.user.username = form.username.data
             g.user.email = form.email.data
             g.user.image_url = form.image_url.data
@@ -252,7 +666,7 @@ def profile():
     return render_template("users/edit.html", form=form, user=g.user)
 
 
-@app.route('/users/delete', methods=["POST"])
+@views.route('/users/delete', methods=["POST"])
 def delete_user():
     """Delete user."""
 
@@ -260,21 +674,34 @@ def delete_user():
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-
-    if (len(g.user.messages) > 1):
+    if (g.user.messages_count > 1):
         flash("You can't delete your account while you still have warbles!!!", "danger")
         return redirect("/")
     else:
         do_logout()
+        # the follows rows go with the user, so fix up the counts of
+        # everyone on the other end of them
+        User.adjust_counters(
+            select(Follows.user_being_followed_id)
+            .where(Follows.user_following_id == g.user.id),
+            followers_count=-1)
+        User.adjust_counters(
+            select(Follows.user_following_id)
+            .where(Follows.user_being_followed_id == g.user.id),
+            following_count=-1)
+        # and their messages' likes go too
+        Like.uncount(select(Message.id).where(Message.user_id == g.user.id))
+        user_id = g.user.id
         db.session.delete(g.user)
         db.session.commit()
+        follow_graph.remove_user(user_id)
         return redirect("/signup")
 
 
 ##############################################################################
 # Messages routes:
 
-@app.route('/messages/new', methods=["GET", "POST"])
+@views.route('/messages/new', methods=["GET", "POST"])
 def messages_add():
     """Add a message:
 
@@ -290,22 +717,78 @@ def messages_add():
     if form.validate_on_submit():
         msg = Message(text=form.text.data)
         g.user.messages.append(msg)
+        db.session.flush()
+        timeline.fan_out(msg)
+        User.adjust_counters(g.user.id, messages_count=1)
         db.session.commit()
+        publish_to_followers(msg)
 
         return render_template(f"_message.html", message=msg, user=g.user)
 
     return render_template('messages/new.html', form=form)
 
 
-@app.route('/messages/<int:message_id>', methods=["GET"])
+def publish_to_followers(message):
+    """Push a new message onto the home pages its author's followers have
+    open (see live.py).
+
+    Followers can't have liked it yet, so they all get the same fragment,
+    which also goes into the fragment cache for their next page view.
+    """
+
+    follower_ids = follow_graph.followers(message.user_id,
+                                          message.user.version)
+    if not follower_ids:
+        return
+
+    [fragment] = fragment_cache.render_messages(
+        [message],
+        {message.id: "not-liked"},
+        lambda message: render_template('_message.html',
+                                        message=message,
+                                        user=message.user,
+                                        like_form_fields=CSRF_PLACEHOLDER,
+                                        state="not-liked"))
+    live.publish(follower_ids, message.id, fragment)
+
+
+@views.route('/messages/search')
+def messages_search():
+    """Full-text search over warbles, with the query in the 'q' param.
+
+    Results are ranked by relevance and paginated (see search.py).
+    """
+
+    query = request.args.get('q', '')
+    if query:
+        page = message_search.search(query, before=request.args.get('before'))
+    else:
+        page = Page([], None)
+    load_like_state(page.items)
+
+    return render_page('messages/search.html', '_message_list.html', page,
+                       query=query)
+
+
+@views.route('/messages/<int:message_id>', methods=["GET"])
+@read_only
 def messages_show(message_id):
     """Show a message."""
 
-    msg = Message.query.get_or_404(message_id)
-    return render_template('messages/show.html', message=msg)
+    msg = (Message
+           .query
+           .options(joinedload(Message.user))
+           .filter_by(id=message_id)
+           .first_or_404())
+    load_like_state([msg])
+    load_follow_state([msg.user])
+
+    return render_cached(
+        page_etag(msg),
+        lambda: render_template('messages/show.html', message=msg))
 
 
-@app.route('/messages/<int:message_id>/delete', methods=["POST"])
+@views.route('/messages/<int:message_id>/delete', methods=["POST"])
 def messages_destroy(message_id):
     """Delete a message."""
 
@@ -319,19 +802,23 @@ def messages_destroy(message_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
     else:
+        timeline.remove_message(msg.id)
+        User.adjust_counters(g.user.id, messages_count=-1)
+        Like.uncount([msg.id])
+        fragment_cache.invalidate_message(msg)
         db.session.delete(msg)
         db.session.commit()
     return redirect(f"/users/{g.user.id}")
 
 
-@app.route("/messages/<int:message_id>/like", methods=["POST"])
+@views.route("/messages/<int:message_id>/like", methods=["POST"])
 def messages_like(message_id):
     """ like a message, pass liked=false to the helper function"""
 
     return change_like(liked=False, message_id=message_id)
 
 
-@app.route("/messages/<int:message_id>/unlike", methods=["POST"])
+@views.route("/messages/<int:message_id>/unlike", methods=["POST"])
 def messages_unlike(message_id):
     """ unlike a message pass=true to the helper function"""
 
@@ -341,62 +828,143 @@ def messages_unlike(message_id):
 def change_like(liked, message_id):
     """ validate user, if liked is true, unlike the message.
     if liked is false, like the message
-    redirect to home page"""
-    if not g.user:
-        flash("Access unauthorized.", "danger")
-        return redirect("/")
 
-    if g.like_form.validate_on_submit():
-        message = Message.query.get_or_404(message_id)
-        if liked:
-            g.user.liked_messages.remove(message)
-        else:
-            g.user.liked_messages.append(message)
+    Both are idempotent and answer with a small JSON body:
+    {"liked": <bool>, "likes": <the message's like count>}"""
+    if g.user_id is None:
+        return jsonify(error="Access unauthorized."), 401
 
-        db.session.commit()
+    if not g.like_form.validate_on_submit():
+        return jsonify(error="Invalid form."), 400
+
+    if liked:
+        change = -1 if Like.remove(g.user_id, message_id) else 0
+    else:
+        added = Like.add(g.user_id, message_id)
+        if added is None:
+            abort(404)
+        change = 1 if added else 0
 
-    return redirect("/")
+    likes = Like.count_for(message_id)
+    db.session.commit()
+    if change:
+        trending.record_like(message_id, change)
+
+    return jsonify(liked=not liked, likes=likes)
+
+
+##############################################################################
+# Trending
+
+
+@views.route('/trending')
+def trending_page():
+    """Messages with the most likes and users with the most new followers
+    over the last hour or so (see trending.py)."""
+
+    message_ranks = [id for id, count in trending.top(MESSAGE_LIKES)]
+    user_ranks = [id for id, count in trending.top(USER_FOLLOWERS)]
+
+    # ranked ids may have been deleted since; they just drop out
+    messages = (Message.query
+                .options(joinedload(Message.user))
+                .filter(Message.id.in_(message_ranks))
+                .all()) if message_ranks else []
+    messages.sort(key=lambda message: message_ranks.index(message.id))
+    users = (User.query
+             .filter(User.id.in_(user_ranks))
+             .all()) if user_ranks else []
+    users.sort(key=lambda user: user_ranks.index(user.id))
+
+    load_like_state(messages)
+    load_follow_state(users)
+
+    return render_template('trending.html', messages=messages, users=users)
 
 
 ##############################################################################
 # Homepage and error pages
 
 
-@app.route('/')
+@views.route('/')
+@read_only
 def homepage():
     """Show homepage:
 
     - anon users: no messages
-    - logged in: 100 most recent messages of followed_users
+    - logged in: most recent messages in the user's home timeline
+      (their own messages and those of followed users, see timeline.py),
+      one page at a time
     """
 
     if g.user:
-        following_ids = [user.id for user in g.user.following]
-        following_ids.append(g.user.id)
-        messages = (Message
-                    .query
-                    .filter(Message.user_id.in_(following_ids))
-                    .order_by(Message.timestamp.desc())
-                    .limit(100)
-                    .all())
+        page = timeline.home_timeline(g.user.id,
+                                      before=request.args.get('before'))
+        load_like_state(page.items)
 
-        return render_template('home.html', messages=messages)
+        return render_page('home.html', '_message_list.html', page)
 
     else:
         return render_template('home-anon.html')
 
 
+@views.route('/timeline/stream')
+def timeline_stream():
+    """Server-Sent Events of new messages for the logged-in user's home
+    timeline (see live.py)."""
+
+    if g.user_id is None:
+        return jsonify(error="Access unauthorized."), 401
+
+    return live.stream(g.user_id, g.like_form.hidden_tag())
+
+
 ##############################################################################
-# Turn off all caching in Flask
-#   (useful for dev; in production, this kind of stuff is typically
-#   handled elsewhere)
+# Turn off caching for everything that doesn't set its own policy
 #
-# https://stackoverflow.com/questions/34066804/disabling-caching-in-flask
+# Cached pages set theirs in `render_cached()` and hashed assets in
+# `asset()`; plain /static/ files keep Flask's default (cached, but
+# revalidated with their ETag / Last-Modified).
 
-@app.after_request
+@views.after_app_request
 def add_header(response):
-    """Add non-caching headers on every request."""
+    """Add non-caching headers to responses without a caching policy."""
 
     # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Cache-Control
-    response.cache_control.no_store = True
+    if request.endpoint != 'static' and 'Cache-Control' not in response.headers:
+        response.cache_control.no_store = True
     return response
+
+
+##############################################################################
+# Command-line maintenance tasks (run with `flask <command>`)
+
+
+@views.cli.command('reconcile-counters')
+def reconcile_counters():
+    """Recompute users' message/follower/following/like counters."""
+
+    drifted = User.reconcile_counters()
+    db.session.commit()
+    print(f"Fixed counters for {drifted} user(s).")
+
+
+@views.cli.command('trim-timelines')
+@click.option('--size', type=int, default=timeline.TIMELINE_SIZE,
+              show_default=True, help="Messages kept per timeline.")
+def trim_timelines(size):
+    """Drop all but the newest messages of each home timeline."""
+
+    dropped = timeline.trim(size=size)
+    db.session.commit()
+    print(f"Dropped {dropped} timeline row(s).")
+
+
+@views.cli.command('refresh-suggestions')
+@click.option('--full', is_flag=True,
+              help="Recompute everyone's, not just stale ones.")
+def refresh_suggestions(full):
+    """Recompute "Who to follow" suggestions (see recommendations.py)."""
+
+    refreshed = recommendations.refresh(full=full)
+    print(f"Refreshed suggestions for {refreshed} user(s).")
@@ -0,0 +1,65 @@
+"""Content-hashed URLs for the files in static/.
+
+`asset_url('like.js')` is `/assets/like.3f2a9c1b0d.js`: the file's name with
+a hash of its contents. The URL changes whenever the file does, so browsers
+and proxies may keep it for a year without revalidating (see the `asset`
+view in app.py).
+"""
+
+import hashlib
+import os
+import re
+
+from flask import current_app, url_for
+
+HASH_LENGTH = 10
+
+# how long hashed assets may be cached: a year, the longest RFC 9111 allows
+MAX_AGE = 365 * 24 * 60 * 60
+
+HASHED_NAME = re.compile(rf"^(.*)\.([0-9a-f]{{{HASH_LENGTH}}})(\.[^./]*)?$")
+
+# {path: (mtime, hash)}, so each file is read once per change
+_hashes = {}
+
+
+def content_hash(filename):
+    """Hash of the contents of static/`filename`.
+
+    Raises FileNotFoundError if there is no such file.
+    """
+
+    path = os.path.join(current_app.static_folder, filename)
+    mtime = os.stat(path).st_mtime
+
+    cached = _hashes.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:HASH_LENGTH]
+        cached = _hashes[path] = (mtime, digest)
+    return cached[1]
+
+
+def hashed_name(filename, digest):
+    """'like.js', '3f2a9c1b0d' -> 'like.3f2a9c1b0d.js'"""
+
+    base, ext = os.path.splitext(filename)
+    return f"{base}.{digest}{ext}"
+
+
+def split_hashed_name(name):
+    """'like.3f2a9c1b0d.js' -> ('like.js', '3f2a9c1b0d'), or None if `name`
+    has no hash in it."""
+
+    match = HASHED_NAME.match(name)
+    if match is None:
+        return None
+    base, digest, ext = match.groups()
+    return base + (ext or ''), digest
+
+
+def asset_url(filename):
+    """URL of static/`filename` under its content-hashed name."""
+
+    return url_for('views.asset',
+                   filename=hashed_name(filename, content_hash(filename)))
@@ -0,0 +1,74 @@
+"""Benchmark password checks: logins/sec, and logins/sec per core used.
+
+Runs a burst of concurrent password checks (what a login does) through the
+hashing service, for each pool size given:
+
+    python benchmarks/bench_login.py --rounds 12 --workers 0 1 2 4
+
+`--workers 0` checks in the calling threads, as the views used to.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hashing import PasswordHasher  # noqa: E402
+
+
+def run(workers, rounds, logins, threads):
+    """Time `logins` checks from `threads` request threads; returns a
+    (seconds, stats) tuple.
+    """
+
+    hasher = PasswordHasher(rounds=rounds, workers=workers)
+    hashed = hasher.hash("benchmark password")
+    # start the worker processes before timing
+    hasher.check(hashed, "benchmark password")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as request_threads:
+        list(request_threads.map(
+            lambda _: hasher.check(hashed, "benchmark password"),
+            range(logins)))
+    seconds = time.perf_counter() - start
+
+    stats = hasher.stats()['check']
+    hasher.shutdown()
+    return seconds, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=12,
+                        help="bcrypt cost (default 12)")
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 1],
+                        help="pool sizes to compare (0 = no pool)")
+    parser.add_argument('--logins', type=int, default=40)
+    parser.add_argument('--threads', type=int, default=8,
+                        help="concurrent request threads")
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    print(f"bcrypt cost {args.rounds}, {args.logins} logins from "
+          f"{args.threads} threads, {cpus} CPU(s)")
+    print(f"{'workers':>8} {'logins/s':>9} {'per core':>9} "
+          f"{'mean ms':>8} {'max ms':>8} {'queued':>7}")
+
+    for workers in args.workers:
+        seconds, stats = run(workers, args.rounds, args.logins, args.threads)
+        # with no pool, every request thread can hash at once
+        cores = min(workers or args.threads, cpus)
+        rate = args.logins / seconds
+        calls = stats['calls']
+        print(f"{workers:>8} {rate:>9.1f} {rate / cores:>9.1f} "
+              f"{stats['seconds'] / calls * 1000:>8.0f} "
+              f"{stats['max_seconds'] * 1000:>8.0f} "
+              f"{stats['queued_seconds'] / stats['seconds']:>7.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,415 @@
+"""Load-test the Warbler routes: latency, queries and rows per request.
+
+Seeds a synthetic dataset (see seed.py), then runs each scenario through
+the Flask test client and through a real WSGI server on a local port:
+
+    createdb warbler-bench
+    python benchmarks/bench_routes.py --users 1000 --messages 20000
+    python benchmarks/bench_routes.py --reuse-data --scenarios home_timeline
+
+Scenarios:
+
+- home_timeline: GET / as a random user
+- profile: GET /users/<id> of a (mostly popular) user
+- like_storm: PUT/DELETE likes on a handful of hot messages
+- signup: POST /signup of new users
+- login: POST /login of existing users (a bcrypt check each)
+- user_search: GET /users?q=<word>
+
+For each it reports p50/p99 latency, requests per second, and the mean SQL
+queries and rows fetched per request. The queries, rows and errors are
+compared with the baseline file (benchmarks/baseline.json), and the run
+fails if any scenario got worse; `--save-baseline` records a new one after
+a change that is meant to alter them. Latencies depend on the machine, so
+they are only reported, never recorded or compared.
+
+The database (DATABASE_URL, default postgresql:///warbler-bench) is
+dropped and recreated unless --reuse-data is given. CSRF checks are turned
+off, as in the tests. Signup and login are bound by bcrypt; set
+BCRYPT_LOG_ROUNDS to change its cost.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+from app import create_app, CURR_USER_KEY  # noqa: E402
+from generator import synthetic  # noqa: E402
+from models import db, Message, User  # noqa: E402
+from seed import seed_database, synthetic_tables  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'baseline.json')
+
+# Password of every synthetic user (see generator/synthetic.py).
+PASSWORD = "password"
+
+HOT_MESSAGES = 5
+
+Request = namedtuple('Request', ['method', 'path', 'data', 'user_id'])
+
+# What a scenario needs to know about the seeded data.
+Dataset = namedtuple('Dataset', ['num_users', 'hot_message_ids'])
+
+
+##############################################################################
+# Scenarios: each returns the next request to send, picked with `rng`.
+
+def random_user(rng, dataset):
+    return rng.randint(1, dataset.num_users)
+
+
+def home_timeline(rng, dataset):
+    return Request('GET', '/', None, random_user(rng, dataset))
+
+
+def profile(rng, dataset):
+    profile_id = synthetic.pick_user(rng, dataset.num_users)
+    return Request('GET', f'/users/{profile_id}', None,
+                   random_user(rng, dataset))
+
+
+def like_storm(rng, dataset):
+    msg_id = rng.choice(dataset.hot_message_ids)
+    return Request(rng.choice(['PUT', 'DELETE']),
+                   f'/api/v1/messages/{msg_id}/like', None,
+                   random_user(rng, dataset))
+
+
+def signup(rng, dataset):
+    # unique across runs, since signups stay in the database
+    name = f"bench{uuid.uuid4().hex[:16]}"
+    return Request('POST', '/signup',
+                   {'username': name,
+                    'email': f"{name}@example.com",
+                    'password': PASSWORD},
+                   None)
+
+
+def login(rng, dataset):
+    username = (db.session.query(User.username)
+                .filter_by(id=random_user(rng, dataset))
+                .scalar())
+    return Request('POST', '/login',
+                   {'username': username, 'password': PASSWORD},
+                   None)
+
+
+def user_search(rng, dataset):
+    query = urlencode({'q': rng.choice(synthetic.WORDS)})
+    return Request('GET', f'/users?{query}', None, random_user(rng, dataset))
+
+
+SCENARIOS = {
+    'home_timeline': home_timeline,
+    'profile': profile,
+    'like_storm': like_storm,
+    'signup': signup,
+    'login': login,
+    'user_search': user_search,
+}
+
+
+##############################################################################
+# Drivers: send a Request through the test client or over HTTP.
+
+def session_cookie(app, user_id):
+    """A signed Flask session cookie logging in `user_id`."""
+
+    serializer = app.session_interface.get_signing_serializer(app)
+    return serializer.dumps({CURR_USER_KEY: user_id})
+
+
+class TestClientDriver:
+    """Calls the app in-process through Flask's test client."""
+
+    name = 'test-client'
+    concurrent = False
+
+    def __init__(self, app):
+        self.app = app
+        self.client = app.test_client()
+
+    def send(self, request):
+        """Send `request`; returns (status, seconds)."""
+
+        self.client.delete_cookie('localhost', 'session')
+        if request.user_id:
+            self.client.set_cookie('localhost', 'session',
+                                   session_cookie(self.app, request.user_id))
+
+        start = time.perf_counter()
+        response = self.client.open(request.path,
+                                    method=request.method,
+                                    data=request.data)
+        response.get_data()
+        return response.status_code, time.perf_counter() - start
+
+    def close(self):
+        pass
+
+
+class ServerDriver:
+    """Sends HTTP requests to the app running in a threaded WSGI server."""
+
+    name = 'wsgi-server'
+    concurrent = True
+
+    def __init__(self, app):
+        self.app = app
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+    def send(self, request):
+        headers = {}
+        body = None
+        if request.user_id:
+            cookie = session_cookie(self.app, request.user_id)
+            headers['Cookie'] = f"session={cookie}"
+        if request.data:
+            body = urlencode(request.data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        connection = HTTPConnection('127.0.0.1', self.server.server_port)
+        try:
+            start = time.perf_counter()
+            connection.request(request.method, request.path, body, headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status, time.perf_counter() - start
+        finally:
+            connection.close()
+
+    def close(self):
+        self.server.shutdown()
+        self.thread.join()
+
+
+DRIVERS = {
+    'test-client': TestClientDriver,
+    'wsgi-server': ServerDriver,
+}
+
+
+##############################################################################
+# Measurement
+
+class QueryCounter:
+    """Counts SQL statements and the rows they return, from any thread."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.rows = 0
+
+    def after_cursor_execute(self, conn, cursor, statement, *args):
+        rows = cursor.rowcount if cursor.description is not None else 0
+        with self.lock:
+            self.queries += 1
+            self.rows += max(rows, 0)
+
+    def __enter__(self):
+        event.listen(db.engine, "after_cursor_execute",
+                     self.after_cursor_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, "after_cursor_execute",
+                     self.after_cursor_execute)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[round(percent / 100 * (len(values) - 1))]
+
+
+def run_scenario(driver, scenario, dataset, requests, warmup, threads, seed):
+    """Send `requests` requests from `scenario` through `driver`; returns
+    the scenario's results.
+    """
+
+    rng = random.Random(seed)
+    for _ in range(warmup):
+        driver.send(scenario(rng, dataset))
+    batch = [scenario(rng, dataset) for _ in range(requests)]
+
+    with QueryCounter() as counter:
+        start = time.perf_counter()
+        if driver.concurrent and threads > 1:
+            with ThreadPoolExecutor(threads) as pool:
+                results = list(pool.map(driver.send, batch))
+        else:
+            results = [driver.send(request) for request in batch]
+        seconds = time.perf_counter() - start
+
+    latencies = [latency for status, latency in results]
+    return {
+        "requests": requests,
+        "errors": sum(status >= 400 for status, latency in results),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "requests_per_second": round(requests / seconds, 2),
+        "queries": round(counter.queries / requests, 2),
+        "rows": round(counter.rows / requests, 2),
+    }
+
+
+##############################################################################
+# Baselines
+
+# metric: absolute slack on top of --tolerance, which keeps small numbers
+# (a query or two) from flapping. Only metrics that don't depend on the
+# machine are recorded and compared.
+COMPARED = {
+    "queries": 0.5,
+    "rows": 1.0,
+}
+RECORDED = ["requests", "errors", *COMPARED]
+
+
+def regressions(results, baseline, args):
+    """Messages for each metric in `results` worse than in `baseline`."""
+
+    found = []
+    for driver, scenarios in results.items():
+        for name, result in scenarios.items():
+            before = baseline.get(driver, {}).get(name)
+            if before is None:
+                continue
+            if result["errors"] > before["errors"]:
+                found.append(f"{driver} {name}: {result['errors']} errors")
+            for metric, slack in COMPARED.items():
+                limit = max(before[metric] * (1 + args.tolerance),
+                            before[metric] + slack)
+                if result[metric] > limit:
+                    found.append(f"{driver} {name}: {metric} "
+                                 f"{result[metric]:.1f} > {limit:.1f} "
+                                 f"(baseline {before[metric]:.1f})")
+    return found
+
+
+##############################################################################
+
+def dataset_settings(args):
+    return {"users": args.users,
+            "messages": args.messages,
+            "follows_per_user": args.follows_per_user,
+            "seed": args.seed,
+            "requests": args.requests,
+            "threads": args.threads}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--follows-per-user', type=float, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--reuse-data', action='store_true',
+                        help="don't reseed; the database must already hold "
+                             "the dataset described by the other options")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS,
+                        default=list(SCENARIOS))
+    parser.add_argument('--drivers', nargs='+', choices=DRIVERS,
+                        default=list(DRIVERS))
+    parser.add_argument('--requests', type=int, default=50,
+                        help="requests per scenario")
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=4,
+                        help="concurrent clients of the WSGI server")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="record these results as the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="allowed growth of queries/rows per request")
+    args = parser.parse_args()
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': os.environ.get(
+            'DATABASE_URL', "postgresql:///warbler-bench"),
+        'WTF_CSRF_ENABLED': False,
+    })
+
+    with app.app_context():
+        if not args.reuse_data:
+            seed_database(synthetic_tables(args.users, args.messages,
+                                           args.follows_per_user, args.seed))
+
+        hot_message_ids = [msg_id for (msg_id,) in
+                           db.session.query(Message.id)
+                           .order_by(Message.id.desc())
+                           .limit(HOT_MESSAGES)]
+    dataset = Dataset(args.users, hot_message_ids)
+
+    print(f"{'driver':<12} {'scenario':<14} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'req/s':>7} {'queries':>8} {'rows':>7} {'errors':>7}")
+
+    results = {}
+    for driver_name in args.drivers:
+        driver = DRIVERS[driver_name](app)
+        try:
+            for name in args.scenarios:
+                result = run_scenario(driver, SCENARIOS[name], dataset,
+                                      args.requests, args.warmup,
+                                      args.threads, args.seed)
+                results.setdefault(driver_name, {})[name] = result
+                print(f"{driver_name:<12} {name:<14} "
+                      f"{result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+                      f"{result['requests_per_second']:>7.1f} "
+                      f"{result['queries']:>8.1f} {result['rows']:>7.1f} "
+                      f"{result['errors']:>7}")
+        finally:
+            driver.close()
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            recorded = {
+                driver: {name: {metric: result[metric]
+                                for metric in RECORDED}
+                         for name, result in scenarios.items()}
+                for driver, scenarios in results.items()}
+            json.dump({"settings": dataset_settings(args), **recorded},
+                      f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Saved baseline to {args.baseline}.")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare with (see --save-baseline).")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.pop("settings", None) != dataset_settings(args):
+        print("The baseline was recorded with different settings; "
+              "not comparing.")
+        return
+
+    found = regressions(results, baseline, args)
+    for message in found:
+        print(f"REGRESSION {message}")
+    if found:
+        sys.exit(1)
+    print("No regressions against the baseline.")
+
+
+if __name__ == '__main__':
+    main()
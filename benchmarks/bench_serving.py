@@ -0,0 +1,195 @@
+"""Compare the sync and gevent serving modes (see serve.py) under slow clients.
+
+For each mode, starts `serve.py` on a local port, opens a crowd of slow
+clients that send their request headers a little at a time over a few
+seconds (as clients on bad mobile connections do), and meanwhile sends
+ordinary requests to the read-heavy pages:
+
+    python benchmarks/bench_serving.py --slow-clients 2000 --hold 3
+
+It reports how many slow clients were served and the latency of the
+ordinary requests; a sync server whose workers are all tied up by slow
+clients makes everyone else wait. Requests go to the database in
+DATABASE_URL (default postgresql:///warbler-bench, as seeded by
+bench_routes.py).
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault('DATABASE_URL', "postgresql:///warbler-bench")
+
+from app import create_app, CURR_USER_KEY  # noqa: E402
+from models import Message, User  # noqa: E402
+
+HOST = '127.0.0.1'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, port, workers):
+    server = subprocess.Popen(
+        [sys.executable, 'serve.py', mode, '--port', str(port),
+         '--workers', str(workers)],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError(f"{mode} server didn't start")
+
+
+def sample_paths(app, count):
+    """Paths of read-heavy pages, with a session cookie for each."""
+
+    with app.app_context():
+        user_ids = [id for (id,) in User.query.with_entities(User.id)
+                    .order_by(User.id).limit(1000)]
+        message_ids = [id for (id,) in Message.query
+                       .with_entities(Message.id)
+                       .order_by(Message.id.desc()).limit(1000)]
+
+    serializer = app.session_interface.get_signing_serializer(app)
+    rng = random.Random(0)
+    requests = []
+    for _ in range(count):
+        path = rng.choice([
+            '/',
+            f'/users/{rng.choice(user_ids)}',
+            '/users',
+            f'/messages/{rng.choice(message_ids)}',
+        ])
+        cookie = serializer.dumps({CURR_USER_KEY: rng.choice(user_ids)})
+        requests.append((path, cookie))
+    return requests
+
+
+async def http_get(port, path, cookie=None, hold=0, steps=1):
+    """GET `path`; returns the status. With `hold`, the headers are sent
+    in `steps` pieces spread over `hold` seconds."""
+
+    reader, writer = await asyncio.open_connection(HOST, port)
+    try:
+        headers = (f"GET {path} HTTP/1.1\r\nHost: {HOST}\r\n"
+                   "Connection: close\r\n")
+        if cookie:
+            headers += f"Cookie: session={cookie}\r\n"
+        headers += "\r\n"
+
+        size = -(-len(headers) // steps)
+        for i in range(0, len(headers), size):
+            writer.write(headers[i:i + size].encode())
+            await writer.drain()
+            if hold and i + size < len(headers):
+                await asyncio.sleep(hold / steps)
+
+        status_line = await reader.readline()
+        await reader.read()
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def timed(request, timeout):
+    start = time.perf_counter()
+    try:
+        status = await asyncio.wait_for(request, timeout)
+    except (asyncio.TimeoutError, OSError, IndexError, ValueError):
+        status = None
+    return status, time.perf_counter() - start
+
+
+async def run_load(port, probes, slow_clients, hold, timeout, concurrency):
+    slow = [asyncio.ensure_future(
+                timed(http_get(port, '/login', hold=hold, steps=10),
+                      hold + timeout))
+            for _ in range(slow_clients)]
+    # let the slow clients get connected first
+    await asyncio.sleep(min(hold / 4, 1) if slow_clients else 0)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def probe(path, cookie):
+        async with semaphore:
+            return await timed(http_get(port, path, cookie), timeout)
+
+    start = time.perf_counter()
+    probe_results = await asyncio.gather(
+        *(probe(path, cookie) for path, cookie in probes))
+    probe_seconds = time.perf_counter() - start
+
+    slow_results = await asyncio.gather(*slow)
+    return probe_results, probe_seconds, slow_results
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[round(percent / 100 * (len(values) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', default=['sync', 'gevent'],
+                        choices=['sync', 'gevent'])
+    parser.add_argument('--slow-clients', type=int, default=1000)
+    parser.add_argument('--hold', type=float, default=3,
+                        help="seconds each slow client takes to send its "
+                             "request")
+    parser.add_argument('--probes', type=int, default=200,
+                        help="ordinary requests sent meanwhile")
+    parser.add_argument('--concurrency', type=int, default=10,
+                        help="ordinary requests in flight at once")
+    parser.add_argument('--timeout', type=float, default=10,
+                        help="seconds before a request counts as failed")
+    parser.add_argument('--workers', type=int, default=8,
+                        help="worker threads of the sync server")
+    args = parser.parse_args()
+
+    probes = sample_paths(create_app(), args.probes)
+
+    print(f"{args.slow_clients} slow clients holding {args.hold:g}s each, "
+          f"{args.probes} page views ({args.concurrency} at a time)")
+    print(f"{'mode':<8} {'slow ok':>8} {'views ok':>9} {'views/s':>8} "
+          f"{'p50 ms':>8} {'p99 ms':>8}")
+
+    for mode in args.modes:
+        port = free_port()
+        server = start_server(mode, port, args.workers)
+        try:
+            probe_results, probe_seconds, slow_results = asyncio.run(
+                run_load(port, probes, args.slow_clients, args.hold,
+                         args.timeout, args.concurrency))
+        finally:
+            server.terminate()
+            server.wait()
+
+        slow_ok = sum(status == 200 for status, seconds in slow_results)
+        served = [seconds for status, seconds in probe_results
+                  if status == 200]
+        latencies = [seconds for status, seconds in probe_results]
+        print(f"{mode:<8} {slow_ok:>8} {len(served):>9} "
+              f"{len(served) / probe_seconds:>8.1f} "
+              f"{percentile(latencies, 50) * 1000:>8.0f} "
+              f"{percentile(latencies, 99) * 1000:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
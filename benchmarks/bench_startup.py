@@ -0,0 +1,86 @@
+"""Benchmark worker startup: importing the app, creating it, first request.
+
+Each run starts a fresh interpreter, as a new web worker or test process
+would:
+
+    python benchmarks/bench_startup.py --runs 10
+    python benchmarks/bench_startup.py --imports 15
+
+`--imports N` also lists the N slowest modules to import (from Python's
+-X importtime), to see what to defer next.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter; /login needs no database to render.
+STARTUP = """
+import json, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+app.test_client().get('/login')
+served = time.perf_counter()
+print(json.dumps({"import": imported - start,
+                  "create_app": created - imported,
+                  "first_request": served - created}))
+"""
+
+
+def run_once():
+    output = subprocess.run([sys.executable, '-c', STARTUP], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.splitlines()[-1])
+
+
+def slowest_imports(count):
+    """(module, cumulative seconds) of the `count` slowest imports."""
+
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             'import app'],
+                            cwd=ROOT, capture_output=True, text=True,
+                            check=True)
+    timings = []
+    for line in output.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, cumulative, module = line[len('import time:'):].split('|')
+        timings.append((module.strip(), int(cumulative) / 1e6))
+    return sorted(timings, key=lambda timing: -timing[1])[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--imports', type=int, default=0,
+                        help="list this many of the slowest imports")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+
+    print(f"{'phase':<14} {'median ms':>10} {'max ms':>8}")
+    for phase in ("import", "create_app", "first_request"):
+        times = [run[phase] * 1000 for run in runs]
+        print(f"{phase:<14} {statistics.median(times):>10.1f} "
+              f"{max(times):>8.1f}")
+    total = [sum(run.values()) * 1000 for run in runs]
+    print(f"{'total':<14} {statistics.median(total):>10.1f} "
+          f"{max(total):>8.1f}")
+
+    if args.imports:
+        print()
+        print(f"{'module':<40} {'cumulative ms':>14}")
+        for module, seconds in slowest_imports(args.imports):
+            print(f"{module:<40} {seconds * 1000:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Streaming bulk loads into the Warbler database.
+
+`load()` takes any iterable of rows (a CSV reader, a generator from
+generator/synthetic.py) and writes it a chunk at a time, committing after
+each chunk, so neither Python nor the database ever holds more than one
+chunk of a load. On PostgreSQL chunks are sent with COPY, which is many
+times faster than INSERTs; elsewhere they are inserted with executemany.
+"""
+
+import csv
+import io
+from itertools import islice
+
+from sqlalchemy import text
+
+from models import db
+
+CHUNK_SIZE = 50000
+
+
+def chunked(rows, size):
+    """Lists of up to `size` rows from the iterable `rows`."""
+
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def copy_chunk(table, columns, chunk):
+    """Send `chunk` with COPY ... FROM STDIN (PostgreSQL only)."""
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # in COPY's CSV format an unquoted empty field is NULL
+    writer.writerows(["" if value is None else value for value in row]
+                     for row in chunk)
+    buffer.seek(0)
+
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(
+        f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+        buffer)
+
+
+def insert_chunk(table, columns, chunk):
+    db.session.execute(table.insert(),
+                       [dict(zip(columns, row)) for row in chunk])
+
+
+def load(model, columns, rows, chunk_size=CHUNK_SIZE, progress=None):
+    """Insert `rows` (tuples in `columns` order) into `model`'s table.
+
+    Commits after every chunk. `progress(total)` is called after each one.
+    Returns the number of rows loaded.
+    """
+
+    table = model.__table__
+    write = (copy_chunk if db.engine.dialect.name == 'postgresql'
+             else insert_chunk)
+
+    total = 0
+    for chunk in chunked(rows, chunk_size):
+        write(table, columns, chunk)
+        db.session.commit()
+        total += len(chunk)
+        if progress:
+            progress(total)
+    return total
+
+
+def reset_id_sequence(model):
+    """Point `model`'s id sequence past the largest id, after loading rows
+    with explicit ids (PostgreSQL only; elsewhere there is nothing to do).
+    """
+
+    if db.engine.dialect.name != 'postgresql':
+        return
+
+    table = model.__tablename__
+    db.session.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+        f"coalesce((SELECT max(id) FROM {table}), 0) + 1, false)"))
+    db.session.commit()
@@ -0,0 +1,134 @@
+"""Database connections for Warbler: pool settings and read replicas.
+
+Pool
+----
+
+The connection pool is sized from the environment; unset variables keep
+SQLAlchemy's defaults (see `create_engine()`):
+
+- DATABASE_POOL_SIZE: connections kept open per process
+- DATABASE_MAX_OVERFLOW: extra connections allowed under load
+- DATABASE_POOL_TIMEOUT: seconds to wait for a free connection
+- DATABASE_POOL_RECYCLE: reconnect connections older than this many seconds
+- DATABASE_POOL_PRE_PING: test connections before use ("1" / "true")
+
+Replicas
+--------
+
+DATABASE_REPLICA_URLS is a comma-separated list of read replicas of
+DATABASE_URL. Views decorated with `@read_only` read from one of them
+(picked per request); everything else, and every write, goes to the
+primary.
+
+Replicas lag behind the primary, so after a user sends a write (any POST,
+PUT or DELETE) their reads stay on the primary for READ_YOUR_WRITES_SECONDS
+(default 5): the page a form redirects to shows what was just saved.
+`wrote_recently()` tells whether the current request is in that window.
+"""
+
+import random
+import time
+
+from flask import g, has_app_context, has_request_context, request, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy, get_state
+from sqlalchemy import orm
+
+REPLICA_BIND_PREFIX = 'replica'
+
+# (environment variable, create_engine() option, type)
+POOL_SETTINGS = [
+    ('DATABASE_POOL_SIZE', 'pool_size', int),
+    ('DATABASE_MAX_OVERFLOW', 'max_overflow', int),
+    ('DATABASE_POOL_TIMEOUT', 'pool_timeout', float),
+    ('DATABASE_POOL_RECYCLE', 'pool_recycle', int),
+    ('DATABASE_POOL_PRE_PING', 'pool_pre_ping',
+     lambda value: value.lower() in ('1', 'true', 'yes')),
+]
+
+SAFE_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+# session key: until when (a time.time()) the user reads from the primary
+PRIMARY_UNTIL_KEY = 'db_primary_until'
+
+
+def engine_options(environ):
+    """SQLALCHEMY_ENGINE_OPTIONS for the pool settings in `environ`."""
+
+    return {option: cast(environ[variable])
+            for variable, option, cast in POOL_SETTINGS
+            if variable in environ}
+
+
+def replica_binds(urls):
+    """SQLALCHEMY_BINDS entries for a comma-separated list of replica URLs."""
+
+    urls = [url.strip() for url in (urls or '').split(',') if url.strip()]
+    return {f"{REPLICA_BIND_PREFIX}{i}": url for i, url in enumerate(urls)}
+
+
+def wrote_recently():
+    """Did the current user send a write in the last
+    READ_YOUR_WRITES_SECONDS? Their reads then go to the primary."""
+
+    return (has_request_context()
+            and session.get(PRIMARY_UNTIL_KEY, 0) >= time.time())
+
+
+def read_only(view):
+    """Mark `view` as safe to serve from a read replica."""
+
+    view.read_only = True
+    return view
+
+
+class RoutingSession(SignallingSession):
+    """Session that sends the reads of read-only views to a replica."""
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = g.get('db_replica') if has_app_context() else None
+        if (replica is not None
+                and not self._flushing
+                and not getattr(clause, 'is_dml', False)):
+            return get_state(self.app).db.get_engine(self.app, bind=replica)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with a RoutingSession."""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def replicas_of(app):
+    return sorted(key for key in app.config.get('SQLALCHEMY_BINDS') or {}
+                  if key.startswith(REPLICA_BIND_PREFIX))
+
+
+def init_app(app):
+    """Add the replicas from DATABASE_REPLICA_URLS to the app's binds and
+    route read-only views to them. Call before `db.init_app(app)`.
+    """
+
+    app.config.setdefault('DATABASE_REPLICA_URLS', None)
+    app.config.setdefault('READ_YOUR_WRITES_SECONDS', 5)
+    binds = replica_binds(app.config['DATABASE_REPLICA_URLS'])
+    if binds:
+        app.config['SQLALCHEMY_BINDS'] = {
+            **(app.config.get('SQLALCHEMY_BINDS') or {}), **binds}
+
+    @app.before_request
+    def choose_database():
+        replicas = replicas_of(app)
+        view = app.view_functions.get(request.endpoint)
+        if (replicas
+                and getattr(view, 'read_only', False)
+                and not wrote_recently()):
+            g.db_replica = random.choice(replicas)
+
+    @app.after_request
+    def stick_to_primary(response):
+        if request.method not in SAFE_METHODS:
+            session[PRIMARY_UNTIL_KEY] = (
+                time.time() + app.config['READ_YOUR_WRITES_SECONDS'])
+        return response
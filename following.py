@@ -0,0 +1,52 @@
+"""Following and unfollowing, for the HTML views and the API alike.
+
+Besides the `follows` row and the counters (`User.follow()`), a follow
+copies the followed user's recent messages into the follower's home
+timeline, updates this process's follow graph (see follow_graph.py) and
+counts towards /trending; an unfollow undoes all three. Both commit.
+"""
+
+from follow_graph import follow_graph
+from models import db
+import timeline
+from trending import trending
+
+
+class CannotFollow(ValueError):
+    """The follow isn't allowed (users can't follow themselves)."""
+
+
+def follow(user, other_user):
+    """Have `user` follow `other_user`.
+
+    Returns False (and changes nothing) if already following. Raises
+    CannotFollow if `other_user` is `user`.
+    """
+
+    if other_user.id == user.id:
+        raise CannotFollow("You can't follow yourself.")
+
+    if not user.follow(other_user):
+        return False
+
+    timeline.backfill(user.id, other_user.id)
+    db.session.commit()
+    follow_graph.add(user.id, other_user.id)
+    trending.record_follow(other_user.id)
+    return True
+
+
+def unfollow(user, other_user):
+    """Have `user` stop following `other_user`.
+
+    Returns False (and changes nothing) if not following.
+    """
+
+    if not user.unfollow(other_user):
+        return False
+
+    timeline.prune(user.id, other_user.id)
+    db.session.commit()
+    follow_graph.remove(user.id, other_user.id)
+    trending.record_follow(other_user.id, -1)
+    return True
@@ -26,7 +26,6 @@ class LoginForm(FlaskForm):
 
 class LogoutForm(FlaskForm):
     """Empty form for passing CSRF token."""
-    print("Logout!")
 
 class UserEditForm(FlaskForm):
     """  Form for editing user info."""
@@ -0,0 +1,197 @@
+"""Cache of rendered message fragments (_message.html).
+
+Timelines, profiles and like lists render the same messages over and over.
+Each message's <li> is rendered once per like state and kept as HTML, so
+pages are stitched together from cached fragments instead of running Jinja
+(and strftime) for every message on every view.
+
+A fragment is keyed by
+
+- the message id,
+- a digest of what the fragment shows of its author, their username and
+  avatar (`author_key()`), so after either changes every process misses
+  the fragments rendered before, with nothing to invalidate, and
+- the viewer's like state: "own" (no like button), "liked", "not-liked" or
+  "anon".
+
+Fragments are rendered with a placeholder instead of the like form's CSRF
+token, which is per session; `stitch()` swaps the real one in.
+
+There are two interchangeable backends:
+
+- MemoryFragmentBackend, an LRU dict of at most FRAGMENT_CACHE_SIZE
+  fragments per process (the default).
+- RedisFragmentBackend, shared between processes, used when
+  FRAGMENT_CACHE_URL is set (needs the `redis` package).
+
+Views talk to `fragment_cache`, which picks a backend on first use.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+from markupsafe import Markup
+
+DEFAULT_SIZE = 10000
+
+# Shared fragments expire eventually, so orphaned ones don't pile up.
+REDIS_TTL = 24 * 60 * 60
+
+CSRF_PLACEHOLDER = Markup('<!--csrf-->')
+
+LIKE_STATES = ("own", "liked", "not-liked", "anon")
+
+
+def author_key(user):
+    """Digest of the author details a fragment shows. Comes from the
+    message's (already loaded) author, so every process agrees on it."""
+
+    shown = f"{user.username}\0{user.image_url}".encode('utf-8')
+    return hashlib.blake2b(shown, digest_size=8).hexdigest()
+
+
+def fragment_key(message, like_state):
+    return f"msg:{message.id}:{author_key(message.user)}:{like_state}"
+
+
+class MemoryFragmentBackend:
+    """Least-recently-used cache in this process."""
+
+    def __init__(self, size=DEFAULT_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        with self.lock:
+            for key in keys:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    found[key] = self.entries[key]
+        return found
+
+    def set_many(self, mapping):
+        with self.lock:
+            self.entries.update(mapping)
+            for key in mapping:
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def reset(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class RedisFragmentBackend:
+    """Cache shared by every process, in Redis."""
+
+    def __init__(self, url):
+        import redis
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.redis.mget([f"warbler:fragment:{key}" for key in keys])
+        return {key: value for key, value in zip(keys, values)
+                if value is not None}
+
+    def set_many(self, mapping):
+        pipe = self.redis.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipe.set(f"warbler:fragment:{key}", value, ex=REDIS_TTL)
+        pipe.execute()
+
+    def delete_many(self, keys):
+        keys = [f"warbler:fragment:{key}" for key in keys]
+        if keys:
+            self.redis.delete(*keys)
+
+    def reset(self):
+        keys = list(self.redis.scan_iter("warbler:fragment:*"))
+        if keys:
+            self.redis.delete(*keys)
+
+
+class FragmentCache:
+    """Front for the fragment cache backends; picks one on first use."""
+
+    def __init__(self):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+
+    def _backend(self):
+        if self.backend is None:
+            url = current_app.config.get('FRAGMENT_CACHE_URL')
+            if url:
+                self.backend = RedisFragmentBackend(url)
+            else:
+                self.backend = MemoryFragmentBackend(
+                    current_app.config.get('FRAGMENT_CACHE_SIZE',
+                                           DEFAULT_SIZE))
+        return self.backend
+
+    def render_messages(self, messages, like_states, render):
+        """HTML for each of `messages`, from the cache where possible.
+
+        `like_states` maps message ids to the viewer's like state and
+        `render(message)` renders a fragment on a miss.
+        """
+
+        keys = [fragment_key(m, like_states[m.id]) for m in messages]
+        found = self._backend().get_many(keys)
+
+        rendered = {}
+        fragments = []
+        for message, key in zip(messages, keys):
+            if key in found:
+                fragments.append(found[key])
+            else:
+                rendered[key] = render(message)
+                fragments.append(rendered[key])
+        if rendered:
+            self._backend().set_many(rendered)
+
+        self.hits += len(keys) - len(rendered)
+        self.misses += len(rendered)
+        return fragments
+
+    def invalidate_message(self, message):
+        """Drop the fragments of a deleted message."""
+
+        self._backend().delete_many(fragment_key(message, state)
+                                    for state in LIKE_STATES)
+
+    def reset(self):
+        if self.backend is not None:
+            self.backend.reset()
+        self.hits = self.misses = 0
+
+
+fragment_cache = FragmentCache()
+
+
+def stitch(fragments, csrf_fields):
+    """Join cached fragments into one Markup string, filling in the like
+    forms' CSRF fields.
+
+    `csrf_fields()` returns the fields; it is only called if some fragment
+    has a like form.
+    """
+
+    html = "".join(fragments)
+    if CSRF_PLACEHOLDER in html:
+        html = html.replace(CSRF_PLACEHOLDER, csrf_fields())
+    return Markup(html)
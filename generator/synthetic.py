@@ -0,0 +1,163 @@
+"""Synthetic Warbler data, generated as streams of rows.
+
+Nothing here builds a list of all users, messages or follows, so memory use
+stays flat whether you ask for 300 users or 1M users with 100M messages, and
+nothing needs the network. Rows are tuples in the order of the *_COLUMNS
+lists, ready for bulk_load.py or a CSV writer.
+
+Activity is skewed the way real social networks are: low user ids (the
+"early adopters") write more messages and collect far more followers than
+the rest, and how many people each user follows is power-law distributed.
+
+Pass the same `seed` to get the same data again.
+"""
+
+import random
+from datetime import datetime, timedelta
+from itertools import count
+
+from ids import MAX_SEQUENCE, MAX_WORKER_ID, SEQUENCE_BITS, make_id
+
+USERS_COLUMNS = ['id', 'email', 'username', 'image_url', 'password', 'bio',
+                 'header_image_url', 'location']
+MESSAGES_COLUMNS = ['id', 'text', 'timestamp', 'user_id']
+FOLLOWS_COLUMNS = ['user_being_followed_id', 'user_following_id']
+
+MAX_WARBLE_LENGTH = 140
+
+# bcrypt hash of "password", shared by every synthetic user
+PASSWORD_HASH = '$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe'
+
+# served by the app itself, so load tests don't fetch images from the web
+IMAGE_URL = '/static/images/default-pic.png'
+HEADER_IMAGE_URL = '/static/images/warbler-hero.jpg'
+
+# How strongly activity favours low user ids: a user is picked as
+# floor(num_users * random() ** SKEW) + 1, so with SKEW 3 the first 1% of
+# users write ~21% of messages and receive ~21% of follows.
+SKEW = 3
+
+# Shape of the out-degree (number of users followed) distribution: a Pareto
+# tail with exponent FOLLOWS_SHAPE, so the mean is twice the minimum.
+FOLLOWS_SHAPE = 2
+
+WORDS = """
+    able about above across act add after again against age ago agree air
+    all almost alone along already always among animal answer any apple
+    arm around art ask away baby back bad bag ball bank bar base be bear
+    beat bed before begin behind bell best better big bird black blood
+    blue board boat body bone book born both box boy bread break bright
+    bring brother brown build burn busy buy call calm camp can car care
+    carry case cat catch cause cell center chair chance change charge
+    check child city class clean clear climb clock close cloud coast cold
+    color come common cook cool corn corner cost could count country
+    course cover cow crowd cry cup current cut dance dark day dead deal
+    dear deep desert design develop did die different dinner direct do
+    doctor dog door double down draw dream dress drink drive drop dry
+    during each ear early earth east easy eat edge egg else end enemy
+    enough enter even evening ever every exact example eye face fact fair
+    fall family far farm fast father fear feather feed feel few field
+    fight fill final find fine finger finish fire first fish fit five
+    flat floor flower fly follow food foot force forest forget form free
+    fresh friend front fruit full game garden gather gentle get gift girl
+    give glad glass go gold good grass gray great green ground group grow
+    guess guide hair half hand happy hard hat have head hear heart heat
+    heavy help here high hill history hold hole home hope horse hot hour
+    house huge hunt idea ink iron island job join joy jump just keep key
+    kind king kitchen knee know lake land large last late laugh lead leaf
+    learn leave left leg letter level lie life lift light like line lion
+    list listen little live long look lost loud love low lucky main make
+    man many map mark market may meet melody metal middle might mile milk
+    mind minute miss moon morning mother mountain mouth move music name
+    nature near neck need never new next night noise north nose note now
+    number ocean offer often old open orange order other out over paint
+    paper park party pass path pay peace pen people piano pick picture
+    piece place plain plan plant play please pocket poem point poor
+    """.split()
+
+CITIES = """
+    Amsterdam Atlanta Austin Berlin Boston Cairo Chicago Denver Dublin
+    Helsinki Houston Lagos Lima Lisbon London Madrid Melbourne Miami
+    Montreal Mumbai Nairobi Oakland Osaka Oslo Paris Portland Prague Quito
+    Rome Santiago Seattle Seoul Sydney Taipei Tokyo Toronto Vienna Warsaw
+    """.split()
+
+
+def pick_user(rng, num_users, skew=SKEW):
+    """A user id in 1..num_users, favouring low ids."""
+
+    return int(num_users * rng.random() ** skew) + 1
+
+
+def sentence(rng, min_words, max_words):
+    words = rng.choices(WORDS, k=rng.randint(min_words, max_words))
+    return " ".join(words).capitalize() + "."
+
+
+def users(num_users, seed=0):
+    """Rows for users 1..num_users."""
+
+    rng = random.Random(f"users-{seed}")
+
+    for user_id in range(1, num_users + 1):
+        # the id keeps usernames and emails unique without remembering them
+        name = f"{rng.choice(WORDS)}{rng.choice(WORDS)}{user_id}"
+        yield (user_id,
+               f"{name}@example.com",
+               name,
+               IMAGE_URL,
+               PASSWORD_HASH,
+               sentence(rng, 4, 12),
+               HEADER_IMAGE_URL,
+               rng.choice(CITIES))
+
+
+def messages(num_messages, num_users, start=None, end=None, seed=0):
+    """Rows for `num_messages` messages by users 1..num_users, in
+    chronological (and so id) order, spread between `start` and `end`
+    (default: the last two years).
+    """
+
+    rng = random.Random(f"messages-{seed}")
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=730)
+    span = (end - start) / max(num_messages, 1)
+
+    for i in range(num_messages):
+        timestamp = start + span * (i + rng.random())
+        # the row number fills the worker and sequence bits, so messages
+        # from the same millisecond still get distinct ids
+        msg_id = make_id(timestamp,
+                         sequence=i & MAX_SEQUENCE,
+                         worker_id=(i >> SEQUENCE_BITS) & MAX_WORKER_ID)
+        text = sentence(rng, 3, 25)[:MAX_WARBLE_LENGTH]
+        yield (msg_id, text, timestamp, pick_user(rng, num_users))
+
+
+def follows(num_users, follows_per_user, seed=0):
+    """Rows for a follow graph among users 1..num_users where users follow
+    `follows_per_user` others on average.
+
+    Each user's follows are drawn on their own (no self-follows, no
+    duplicates), so only one user's follows are held at a time.
+    """
+
+    rng = random.Random(f"follows-{seed}")
+    minimum = follows_per_user * (FOLLOWS_SHAPE - 1) / FOLLOWS_SHAPE
+
+    for follower in range(1, num_users + 1):
+        degree = int(minimum * rng.paretovariate(FOLLOWS_SHAPE))
+        degree = min(degree, num_users - 1)
+
+        # popular users get drawn again and again, so give up on a user
+        # with a huge degree rather than loop until the rare ids come up
+        followed = set()
+        for attempt in count():
+            if len(followed) == degree or attempt > 10 * degree:
+                break
+            user_id = pick_user(rng, num_users)
+            if user_id != follower:
+                followed.add(user_id)
+
+        for user_id in sorted(followed):
+            yield (user_id, follower)
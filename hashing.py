@@ -0,0 +1,180 @@
+"""Password hashing for Warbler, off the request threads.
+
+bcrypt is deliberately slow (~250ms of CPU per hash at cost 12). Hashing in
+the request thread lets a burst of logins occupy every core the web workers
+have, so hashes and checks run in a small pool of worker processes instead:
+at most PASSWORD_HASH_WORKERS of them run at once, and the rest queue while
+timeline traffic keeps the remaining cores.
+
+Configuration (Flask config keys):
+
+- BCRYPT_LOG_ROUNDS: bcrypt cost for new hashes (default 12). Hashes made
+  with a different cost are upgraded the next time their owner logs in.
+- PASSWORD_HASH_WORKERS: size of the process pool; 0 hashes in the calling
+  thread (default: half the CPUs, at least 1).
+- PASSWORD_HASH_TIMEOUT: seconds to wait for a result (default 10). A hash
+  or check still queued by then is cancelled and raises HashingBusy; the
+  views answer 503 and ask the user to try again.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+DEFAULT_ROUNDS = 12
+
+# bcrypt only looks at the first 72 bytes of a password; older versions of
+# the bcrypt package dropped the rest silently, newer ones raise instead.
+MAX_PASSWORD_BYTES = 72
+
+
+class HashingBusy(Exception):
+    """The pool didn't finish a hash or check within the timeout."""
+
+
+def default_workers():
+    """Half the CPUs, so logins can never take every core."""
+
+    return max(1, (os.cpu_count() or 1) // 2)
+
+
+def _encode(password):
+    return password.encode('utf-8')[:MAX_PASSWORD_BYTES]
+
+
+def _hash(password, rounds):
+    """Hash `password`; returns (hash, seconds spent hashing)."""
+
+    start = time.perf_counter()
+    hashed = bcrypt.hashpw(_encode(password), bcrypt.gensalt(rounds))
+    return hashed.decode('utf-8'), time.perf_counter() - start
+
+
+def _check(hashed, password):
+    """Check `password` against `hashed`; returns (ok, seconds spent)."""
+
+    start = time.perf_counter()
+    ok = bcrypt.checkpw(_encode(password), hashed.encode('utf-8'))
+    return ok, time.perf_counter() - start
+
+
+def rounds_of(hashed):
+    """The bcrypt cost a hash was made with ("$2b$12$..." -> 12)."""
+
+    return int(hashed.split('$')[2])
+
+
+class PasswordHasher:
+    """Hashes and checks passwords in a pool of worker processes.
+
+    Keeps per-operation timings; see `stats()`.
+    """
+
+    def __init__(self, rounds=DEFAULT_ROUNDS, workers=0, timeout=10):
+        self.rounds = rounds
+        self.workers = workers
+        self.timeout = timeout
+        self._pool = None
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def init_app(self, app):
+        """Read the pool size and bcrypt cost from `app.config`."""
+
+        self.rounds = app.config.setdefault('BCRYPT_LOG_ROUNDS',
+                                            DEFAULT_ROUNDS)
+        self.workers = app.config.setdefault('PASSWORD_HASH_WORKERS',
+                                             default_workers())
+        self.timeout = app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+        self.shutdown()
+
+    def hash(self, password):
+        """Return a bcrypt hash of `password` at the configured cost."""
+
+        return self._run('hash', _hash, password, self.rounds)
+
+    def check(self, hashed, password):
+        """Does `password` match `hashed`?"""
+
+        return self._run('check', _check, hashed, password)
+
+    def needs_rehash(self, hashed):
+        """Was `hashed` made with a cost other than the configured one?"""
+
+        return rounds_of(hashed) != self.rounds
+
+    def stats(self):
+        """Timings so far, per operation: the number of calls, total and
+        slowest wall time, and how much of the total was spent queued
+        waiting for a free worker.
+        """
+
+        with self._lock:
+            return {op: dict(timings) for op, timings in self._stats.items()}
+
+    def shutdown(self):
+        """Stop the worker processes; they restart on the next call."""
+
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None and self.workers > 0:
+                # spawn, not fork: forking a threaded web server can copy
+                # locks held by other threads into the child
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def _run(self, op, fn, *args):
+        start = time.perf_counter()
+
+        pool = self._get_pool()
+        if pool is None:
+            result, busy = fn(*args)
+        else:
+            future = pool.submit(fn, *args)
+            try:
+                result, busy = future.result(self.timeout)
+            except TimeoutError:
+                # don't leave it queued behind the backlog; one already
+                # running can't be stopped and finishes unseen
+                future.cancel()
+                raise HashingBusy(op) from None
+            except BrokenProcessPool:
+                # a worker died (e.g. OOM-killed); start a fresh pool next
+                # time and do this one here
+                self.shutdown()
+                result, busy = fn(*args)
+
+        self._record(op, time.perf_counter() - start, busy)
+        return result
+
+    def _record(self, op, seconds, busy):
+        with self._lock:
+            timings = self._stats.setdefault(
+                op, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                     'queued_seconds': 0.0})
+            timings['calls'] += 1
+            timings['seconds'] += seconds
+            timings['max_seconds'] = max(timings['max_seconds'], seconds)
+            timings['queued_seconds'] += max(0.0, seconds - busy)
+
+    def _after_fork(self):
+        self._pool = None
+        self._lock = threading.Lock()
+
+
+password_hasher = PasswordHasher()
+
+# A forked child (gunicorn --preload) can't use its parent's pool.
+os.register_at_fork(after_in_child=password_hasher._after_fork)
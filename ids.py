@@ -0,0 +1,260 @@
+"""Time-ordered 64-bit ids for messages ("snowflake" ids).
+
+An id is built from, high bits to low:
+
+- 41 bits: milliseconds since EPOCH (good for ~69 years)
+- 10 bits: worker id, so processes never hand out the same id
+- 12 bits: sequence number within the millisecond
+
+Ids are generated in-process, without a database round trip, and sorting by
+id sorts by creation time. That lets timelines, pagination cursors and the
+timelines table order on the primary key alone.
+
+Two processes with the same worker id can hand out the same id in the same
+millisecond, so each process gets its own (see `default_worker_id()`):
+
+- WARBLER_WORKER_ID, if set: one value per process, assigned by whatever
+  starts them.
+- Otherwise, on PostgreSQL, a worker id leased with an advisory lock held
+  on a connection of its own for the life of the process; it frees up
+  when the process exits. If that connection drops, the lock goes with it
+  and another process may lease the same id, so `next_id()` checks the
+  lease every LEASE_CHECK_SECONDS and leases an id again (or, if it can't,
+  hands out no ids) once it is lost.
+- Otherwise, in debug and testing only, the pid's low bits. `create_app()`
+  refuses to start in production where that would be the only choice.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+# 2010-01-01T00:00:00Z, in milliseconds since the Unix epoch; early enough
+# for the 2017 sample data in generator/
+EPOCH = 1262304000000
+
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+TIMESTAMP_SHIFT = WORKER_BITS + SEQUENCE_BITS
+
+# Leases are advisory locks on (LEASE_LOCK_KEY, worker id).
+LEASE_LOCK_KEY = 0x57524253
+
+# How often a lease is checked to still be held.
+LEASE_CHECK_SECONDS = 10
+
+
+class IdGenerator:
+    """Hands out increasing snowflake ids for one worker. Thread-safe."""
+
+    def __init__(self, worker_id, clock=time.time):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"worker id must be 0-{MAX_WORKER_ID}")
+
+        self.worker_id = worker_id
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.last_ms = -1
+        self.sequence = 0
+
+    def next_id(self):
+        """Return a new id, larger than every id returned before."""
+
+        with self.lock:
+            ms = int(self.clock() * 1000) - EPOCH
+
+            # If the clock went backwards, keep counting from the last
+            # millisecond used rather than handing out smaller ids.
+            if ms <= self.last_ms:
+                ms = self.last_ms
+                self.sequence = (self.sequence + 1) & MAX_SEQUENCE
+                if self.sequence == 0:
+                    # sequence exhausted: borrow the next millisecond
+                    ms += 1
+            else:
+                self.sequence = 0
+
+            self.last_ms = ms
+            return ((ms << TIMESTAMP_SHIFT)
+                    | (self.worker_id << SEQUENCE_BITS)
+                    | self.sequence)
+
+
+def make_id(when, sequence=0, worker_id=0):
+    """The id for a naive UTC datetime `when`.
+
+    Used to give rows that were created elsewhere (e.g. seed data) ids that
+    sort by their timestamps; `sequence` tells apart rows from the same
+    millisecond.
+    """
+
+    ms = int(when.replace(tzinfo=timezone.utc).timestamp() * 1000) - EPOCH
+    if ms < 0:
+        raise ValueError(f"{when} is before the id epoch")
+    return (ms << TIMESTAMP_SHIFT) | (worker_id << SEQUENCE_BITS) | sequence
+
+
+def timestamp_of(id):
+    """The naive UTC datetime at which `id` was generated."""
+
+    ms = (id >> TIMESTAMP_SHIFT) + EPOCH
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).replace(tzinfo=None)
+
+
+def lease_worker_id(engine):
+    """Lease a worker id that no other live process holds, by taking the
+    first free advisory lock on (LEASE_LOCK_KEY, id) on a connection of its
+    own, outside `engine`'s pool.
+
+    Returns (worker_id, connection). The lease lasts until the connection
+    is closed; keep it open as long as the id is in use.
+    """
+
+    connection = engine.raw_connection()
+    connection.detach()
+    try:
+        cursor = connection.cursor()
+        for worker_id in range(MAX_WORKER_ID + 1):
+            cursor.execute("SELECT pg_try_advisory_lock(%s, %s)",
+                           (LEASE_LOCK_KEY, worker_id))
+            if cursor.fetchone()[0]:
+                # session locks outlive the transaction; don't sit idle in
+                # one for the life of the process
+                connection.commit()
+                return worker_id, connection
+    except Exception:
+        connection.close()
+        raise
+
+    connection.close()
+    raise RuntimeError(f"all {MAX_WORKER_ID + 1} worker ids are leased")
+
+
+def lease_held(connection, worker_id):
+    """Does `connection`, from `lease_worker_id()`, still hold the lease on
+    `worker_id`? False if the connection has dropped."""
+
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT 1 FROM pg_locks WHERE locktype = 'advisory'"
+            " AND pid = pg_backend_pid() AND classid = %s AND objid = %s"
+            " AND objsubid = 2 AND granted",
+            (LEASE_LOCK_KEY, worker_id))
+        held = cursor.fetchone() is not None
+        connection.commit()
+        return held
+    except Exception:
+        return False
+
+
+def check_worker_id_config(app):
+    """Refuse to start an app whose processes would fall back to pid-based
+    worker ids, which can collide, outside debug and testing."""
+
+    from sqlalchemy.engine import make_url
+
+    worker_id = os.environ.get('WARBLER_WORKER_ID')
+    if worker_id is not None:
+        if not 0 <= int(worker_id) <= MAX_WORKER_ID:
+            raise RuntimeError(
+                f"WARBLER_WORKER_ID must be 0-{MAX_WORKER_ID}")
+        return
+
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if (url.get_backend_name() != 'postgresql'
+            and not (app.debug or app.testing)):
+        raise RuntimeError(
+            "Set WARBLER_WORKER_ID (a different 0-1023 value per process): "
+            "worker ids can only be leased on PostgreSQL")
+
+
+def default_worker_id():
+    """Worker id for this process: WARBLER_WORKER_ID, or else one leased
+    through the database, or else (in debug and testing) from the pid."""
+
+    global _lease
+
+    worker_id = os.environ.get('WARBLER_WORKER_ID')
+    if worker_id is not None:
+        return int(worker_id)
+
+    from flask import current_app
+    from models import db
+
+    if db.engine.dialect.name == 'postgresql':
+        worker_id, _lease = lease_worker_id(db.engine)
+        return worker_id
+    if current_app.debug or current_app.testing:
+        return os.getpid() & MAX_WORKER_ID
+    raise RuntimeError("Set WARBLER_WORKER_ID: no worker id can be leased")
+
+
+_generator = None
+_lease = None
+_lease_checked_at = 0.0
+_generator_lock = threading.Lock()
+# Leases inherited from a parent process (see _forget_generator)
+_inherited_leases = []
+
+
+def _lease_due():
+    return (_lease is not None
+            and time.monotonic() - _lease_checked_at >= LEASE_CHECK_SECONDS)
+
+
+def next_id():
+    """Return a new id from this process's generator, after making sure its
+    worker id is still leased, if it was due a check."""
+
+    if _generator is None or _lease_due():
+        with _generator_lock:
+            _check_generator()
+    return _generator.next_id()
+
+
+def _check_generator():
+    """Set up the generator, or replace it if its lease has been lost."""
+
+    global _generator, _lease, _lease_checked_at
+
+    last_ms = -1
+    if _generator is not None and _lease_due():
+        if lease_held(_lease, _generator.worker_id):
+            _lease_checked_at = time.monotonic()
+        else:
+            from flask import current_app
+            current_app.logger.warning(
+                "Lost the lease on worker id %d; leasing another",
+                _generator.worker_id)
+            try:
+                _lease.close()
+            except Exception:
+                pass
+            # keep ids increasing across the change of worker id
+            last_ms = _generator.last_ms
+            _generator = _lease = None
+
+    if _generator is None:
+        generator = IdGenerator(default_worker_id())
+        generator.last_ms = last_ms
+        _lease_checked_at = time.monotonic()
+        _generator = generator
+
+
+def _forget_generator():
+    global _generator, _lease
+    # Closing the parent's lease connection here would end its session, and
+    # its lease with it, so it is kept, unused, for the life of the child.
+    if _lease is not None:
+        _inherited_leases.append(_lease)
+    _generator = _lease = None
+
+
+# Pre-forked workers (gunicorn --preload) must not share the parent's
+# worker id.
+os.register_at_fork(after_in_child=_forget_generator)
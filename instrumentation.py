@@ -0,0 +1,286 @@
+"""Always-on request instrumentation for Warbler.
+
+Every request counts its SQL statements, the time spent waiting on the
+database, the ORM objects it loaded and the time spent rendering templates.
+The totals go out with the response in a Server-Timing header (shown by
+browser dev tools) and into per-route histograms served in the Prometheus
+text format at /metrics. All of it is a few counter updates per statement
+and per request, so it stays on in production.
+
+Configuration (Flask config keys):
+
+- SERVER_TIMING: send the Server-Timing header (default True).
+- METRICS_TOKEN: if set, /metrics requires `Authorization: Bearer <token>`.
+
+Other parts of the app add their own numbers to /metrics with
+`@metrics.collector` (see app.py).
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+from flask import (
+    abort, before_render_template, current_app, g, has_app_context,
+    request, template_rendered)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from models import db
+
+# Upper bounds of the histogram buckets.
+SECONDS_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+
+class RequestStats:
+    """What one request has done so far."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.objects_loaded = 0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+        self.template_start = None
+
+
+def request_stats():
+    """The current request's RequestStats, or None outside a request."""
+
+    if not has_app_context():
+        return None
+    return g.get('_request_stats')
+
+
+class Histogram:
+    """A Prometheus histogram, with a series per set of label values."""
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values: [count per bucket, ..., count above the last, sum]
+        self.series = {}
+
+    def observe(self, label_values, value):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def lines(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for label_values, series in sorted(self.series.items()):
+            labels = format_labels(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series):
+                cumulative += count
+                yield (f"{self.name}_bucket{{{labels},le=\"{bound}\"}} "
+                       f"{cumulative}")
+            yield f"{self.name}_sum{{{labels}}} {series[-1]}"
+            yield f"{self.name}_count{{{labels}}} {cumulative}"
+
+
+class Counter:
+    """A Prometheus counter, with a series per set of label values."""
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = {}
+
+    def inc(self, label_values, amount=1):
+        self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def lines(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in sorted(self.series.items()):
+            labels = format_labels(zip(self.labels, label_values))
+            yield f"{self.name}{{{labels}}} {value}"
+
+
+def format_labels(pairs):
+    def escape(value):
+        return (str(value).replace("\\", "\\\\").replace('"', '\\"')
+                .replace("\n", "\\n"))
+    return ",".join(f'{name}="{escape(value)}"' for name, value in pairs)
+
+
+class Metrics:
+    """Per-route request metrics, kept in memory by each process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collectors = []
+        self.reset()
+
+    def reset(self):
+        route = ('endpoint', 'method')
+        with self._lock:
+            self.requests = Counter(
+                'warbler_requests_total',
+                "Requests handled.", route + ('status',))
+            self.duration = Histogram(
+                'warbler_request_duration_seconds',
+                "Time to handle a request.", route, SECONDS_BUCKETS)
+            self.db_time = Histogram(
+                'warbler_request_db_seconds',
+                "Time per request spent running SQL.", route,
+                SECONDS_BUCKETS)
+            self.statements = Histogram(
+                'warbler_request_sql_statements',
+                "SQL statements run per request.", route, COUNT_BUCKETS)
+            self.objects_loaded = Histogram(
+                'warbler_request_orm_objects_loaded',
+                "ORM objects loaded per request.", route, COUNT_BUCKETS)
+            self.template_time = Histogram(
+                'warbler_request_template_seconds',
+                "Time per request spent rendering templates.", route,
+                SECONDS_BUCKETS)
+
+    def init_app(self, app):
+        app.config.setdefault('SERVER_TIMING', True)
+        app.config.setdefault('METRICS_TOKEN', None)
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        before_render_template.connect(_template_started, app)
+        template_rendered.connect(_template_finished, app)
+        app.add_url_rule('/metrics', 'metrics', self._metrics_view)
+
+    def collector(self, fn):
+        """Register `fn` to add samples to /metrics.
+
+        `fn()` returns (name, type, help, labels, value) tuples, where
+        labels is a dict; use it as a decorator.
+        """
+
+        self._collectors.append(fn)
+        return fn
+
+    def record(self, endpoint, method, status, stats, seconds):
+        route = (endpoint, method)
+        with self._lock:
+            self.requests.inc(route + (status,))
+            self.duration.observe(route, seconds)
+            self.db_time.observe(route, stats.db_seconds)
+            self.statements.observe(route, stats.statements)
+            self.objects_loaded.observe(route, stats.objects_loaded)
+            self.template_time.observe(route, stats.template_seconds)
+
+    def render(self):
+        """All metrics in the Prometheus text format."""
+
+        with self._lock:
+            lines = [line
+                     for metric in (self.requests, self.duration,
+                                    self.db_time, self.statements,
+                                    self.objects_loaded, self.template_time)
+                     for line in metric.lines()]
+
+        described = set()
+        for collector in self._collectors:
+            for name, type, help, labels, value in collector():
+                if name not in described:
+                    described.add(name)
+                    lines.append(f"# HELP {name} {help}")
+                    lines.append(f"# TYPE {name} {type}")
+                labels = format_labels(labels.items())
+                lines.append(f"{name}{{{labels}}} {value}" if labels
+                             else f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def _start_request(self):
+        g._request_stats = RequestStats()
+
+    def _finish_request(self, response):
+        stats = request_stats()
+        if stats is None:
+            return response
+
+        seconds = time.perf_counter() - stats.start
+        self.record(request.endpoint or 'none', request.method,
+                    response.status_code, stats, seconds)
+
+        if current_app.config['SERVER_TIMING']:
+            response.headers['Server-Timing'] = ", ".join([
+                f'db;dur={stats.db_seconds * 1000:.1f};'
+                f'desc="{stats.statements} queries"',
+                f'orm;desc="{stats.objects_loaded} objects"',
+                f'tpl;dur={stats.template_seconds * 1000:.1f}',
+                f'app;dur={seconds * 1000:.1f}',
+            ])
+        return response
+
+    def _metrics_view(self):
+        token = current_app.config['METRICS_TOKEN']
+        if token and request.headers.get('Authorization') != f"Bearer {token}":
+            abort(401)
+
+        return current_app.response_class(
+            self.render(), mimetype='text/plain; version=0.0.4')
+
+
+metrics = Metrics()
+
+
+##############################################################################
+# Hooks: these run for every statement / object / template, so they only
+# bump the current request's counters.
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _statement_started(conn, cursor, statement, parameters, context,
+                       executemany):
+    conn.info.setdefault('_statement_starts', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _statement_finished(conn, cursor, statement, parameters, context,
+                        executemany):
+    start = conn.info['_statement_starts'].pop()
+    stats = request_stats()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_seconds += time.perf_counter() - start
+
+
+@event.listens_for(Engine, 'handle_error')
+def _statement_failed(context):
+    # after_cursor_execute doesn't run for a statement that failed
+    if context.connection is not None and context.cursor is not None:
+        starts = context.connection.info.get('_statement_starts')
+        if starts:
+            starts.pop()
+
+
+@event.listens_for(db.Model, 'load', propagate=True)
+def _object_loaded(target, context):
+    stats = request_stats()
+    if stats is not None:
+        stats.objects_loaded += 1
+
+
+def _template_started(app, template, context):
+    stats = request_stats()
+    if stats is not None:
+        # nested renders (fragments inside a page) are counted once
+        if stats.template_depth == 0:
+            stats.template_start = time.perf_counter()
+        stats.template_depth += 1
+
+
+def _template_finished(app, template, context):
+    stats = request_stats()
+    if stats is not None and stats.template_depth:
+        stats.template_depth -= 1
+        if stats.template_depth == 0:
+            stats.template_seconds += (time.perf_counter()
+                                       - stats.template_start)
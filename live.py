@@ -0,0 +1,206 @@
+"""Live home timelines over Server-Sent Events.
+
+A logged-in home page keeps an EventSource open on /timeline/stream
+(static/live_timeline.js). When someone posts, `messages_add()` publishes
+the new message's fragment to each of the author's followers, and every
+stream those followers have open sends it on as a "warble" event, so home
+pages grow without being reloaded.
+
+Streams are fed by one of two interchangeable brokers:
+
+- LocalBroker, queues in this process (the default). Enough when the site
+  runs in one process, and for tests.
+- RedisBroker, Redis pub/sub, used when LIVE_BROKER_URL is set (needs the
+  `redis` package), so a post reaches streams held by other processes.
+
+Views talk to `live`, which picks a broker on first use.
+
+A stream holds its connection open (and, under a sync server, a worker
+thread) for as long as the page is open, but no database connection. Serve
+with `python serve.py gevent` (see serve.py) when many people sit on their
+home pages.
+"""
+
+import queue
+import threading
+from collections import defaultdict
+
+from flask import current_app
+
+from fragment_cache import CSRF_PLACEHOLDER
+
+# Seconds between keepalive comments on an idle stream. They keep proxies
+# from timing the connection out, and are how a stream notices that its
+# client has gone away.
+DEFAULT_KEEPALIVE = 15
+
+# How long browsers wait before reconnecting a dropped stream.
+RETRY_MILLISECONDS = 5000
+
+# Events a stream may fall behind by; more are dropped rather than let a
+# stuck client's queue grow without bound.
+MAX_PENDING = 100
+
+
+def warble_event(message_id, fragment):
+    """The SSE frame for a new message: its id and its HTML, one `data:`
+    line per line of HTML (browsers join them back up)."""
+
+    data = "".join(f"data: {line}\n" for line in fragment.splitlines())
+    return f"id: {message_id}\nevent: warble\n{data}\n"
+
+
+class LocalSubscription:
+    """One open stream's queue of events in a LocalBroker."""
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.queue = queue.Queue(MAX_PENDING)
+
+    def get(self, timeout):
+        """The next event, or None if there is none within `timeout`
+        seconds."""
+
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """Delivers events to the streams open in this process."""
+
+    def __init__(self):
+        self.subscriptions = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = LocalSubscription(self, user_id)
+        with self.lock:
+            self.subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.subscriptions[subscription.user_id]
+
+    def publish(self, user_ids, event):
+        with self.lock:
+            subscriptions = [subscription
+                             for user_id in user_ids
+                             for subscription in
+                             self.subscriptions.get(user_id, ())]
+        for subscription in subscriptions:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                pass
+
+    def reset(self):
+        with self.lock:
+            self.subscriptions.clear()
+
+
+class RedisSubscription:
+    """One open stream's Redis pub/sub connection."""
+
+    def __init__(self, redis, user_id):
+        self.pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(f"warbler:timeline:{user_id}")
+
+    def get(self, timeout):
+        message = self.pubsub.get_message(timeout=timeout)
+        return message['data'] if message else None
+
+    def close(self):
+        self.pubsub.close()
+
+
+class RedisBroker:
+    """Delivers events to the streams open in every process, through
+    Redis."""
+
+    def __init__(self, url):
+        import redis
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def subscribe(self, user_id):
+        return RedisSubscription(self.redis, user_id)
+
+    def publish(self, user_ids, event):
+        pipe = self.redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.publish(f"warbler:timeline:{user_id}", event)
+        pipe.execute()
+
+    def reset(self):
+        pass
+
+
+class LiveTimelines:
+    """Front for the brokers; picks one on first use."""
+
+    def __init__(self):
+        self.broker = None
+
+    def _broker(self):
+        if self.broker is None:
+            url = current_app.config.get('LIVE_BROKER_URL')
+            if url:
+                self.broker = RedisBroker(url)
+            else:
+                self.broker = LocalBroker()
+        return self.broker
+
+    def publish(self, user_ids, message_id, fragment):
+        """Send a new message's fragment (rendered with CSRF_PLACEHOLDER
+        for the like form's token) to the streams of `user_ids`."""
+
+        if user_ids:
+            self._broker().publish(user_ids,
+                                   warble_event(message_id, fragment))
+
+    def stream(self, user_id, csrf_fields):
+        """An event-stream response of the new messages for `user_id`.
+
+        `csrf_fields` go into the like forms of the fragments. The response
+        reads nothing from the request, so it can be sent after the request
+        context is gone.
+        """
+
+        subscription = self._broker().subscribe(user_id)
+        keepalive = current_app.config.get('LIVE_KEEPALIVE_SECONDS',
+                                           DEFAULT_KEEPALIVE)
+
+        def events():
+            yield f"retry: {RETRY_MILLISECONDS}\n\n"
+            while True:
+                event = subscription.get(keepalive)
+                if event is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield event.replace(CSRF_PLACEHOLDER, csrf_fields)
+
+        response = current_app.response_class(events(),
+                                              mimetype='text/event-stream')
+        # Tell nginx and friends not to buffer the stream.
+        response.headers['X-Accel-Buffering'] = 'no'
+        # Called however the response ends: finished, or the client gone.
+        response.call_on_close(subscription.close)
+        return response
+
+    def reset(self):
+        if self.broker is not None:
+            self.broker.reset()
+
+
+live = LiveTimelines()
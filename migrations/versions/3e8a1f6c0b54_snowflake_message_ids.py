@@ -0,0 +1,131 @@
+"""time-ordered 64-bit message ids
+
+Messages get snowflake ids (see ids.py) instead of a sequence, so ordering
+by id is ordering by time:
+
+- messages.id, likes.msg_id and timelines.msg_id become BIGINT
+- existing messages are re-keyed to ids built from their timestamps
+- messages (user_id, id DESC) replaces (user_id, timestamp DESC, id DESC)
+- timelines drops its timestamp column and index; home timelines page
+  through the (user_id, msg_id) primary key
+
+Revision ID: 3e8a1f6c0b54
+Revises: 9c4e7d2a6b13
+Create Date: 2026-10-17 19:06:12.480913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e8a1f6c0b54'
+down_revision = '9c4e7d2a6b13'
+branch_labels = None
+depends_on = None
+
+# ids.EPOCH and ids.TIMESTAMP_SHIFT, copied so this migration keeps working
+# if ids.py changes
+EPOCH = 1262304000000
+TIMESTAMP_SHIFT = 22
+
+
+def drop_msg_id_foreign_keys():
+    op.drop_constraint('likes_msg_id_fkey', 'likes', type_='foreignkey')
+    op.drop_constraint('timelines_msg_id_fkey', 'timelines',
+                       type_='foreignkey')
+
+
+def create_msg_id_foreign_keys():
+    op.create_foreign_key('likes_msg_id_fkey', 'likes', 'messages',
+                          ['msg_id'], ['id'])
+    op.create_foreign_key('timelines_msg_id_fkey', 'timelines', 'messages',
+                          ['msg_id'], ['id'], ondelete='cascade')
+
+
+def rekey_messages(new_id):
+    """Renumber messages (and the rows pointing at them) to `new_id`, an SQL
+    expression over the old row that may use `n`, the row's 0-based position
+    in (timestamp, id) order.
+    """
+
+    op.execute(f"""
+        CREATE TEMPORARY TABLE message_ids AS
+        SELECT id AS old_id, {new_id} AS new_id
+        FROM (SELECT id,
+                     timestamp,
+                     row_number() OVER (ORDER BY timestamp, id) - 1 AS n
+              FROM messages) AS numbered
+    """)
+    for table, column in [('likes', 'msg_id'),
+                          ('timelines', 'msg_id'),
+                          ('messages', 'id')]:
+        op.execute(f"""
+            UPDATE {table} SET {column} = message_ids.new_id
+            FROM message_ids
+            WHERE {table}.{column} = message_ids.old_id
+        """)
+    op.execute("DROP TABLE message_ids")
+
+
+def upgrade():
+    drop_msg_id_foreign_keys()
+
+    op.alter_column('messages', 'id', type_=sa.BigInteger(),
+                    server_default=None)
+    op.execute("DROP SEQUENCE IF EXISTS messages_id_seq")
+    op.alter_column('likes', 'msg_id', type_=sa.BigInteger())
+    op.alter_column('timelines', 'msg_id', type_=sa.BigInteger())
+
+    # the row number fills the worker and sequence bits, so messages from
+    # the same millisecond still get distinct ids
+    rekey_messages(
+        f"((floor(extract(epoch FROM timestamp) * 1000)::bigint - {EPOCH})"
+        f" << {TIMESTAMP_SHIFT}) | (n & {(1 << TIMESTAMP_SHIFT) - 1})")
+
+    create_msg_id_foreign_keys()
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_user_id_timestamp')
+        batch_op.create_index('ix_messages_user_id_id', ['user_id', sa.text('id DESC')], unique=False)
+
+    with op.batch_alter_table('timelines', schema=None) as batch_op:
+        batch_op.drop_index('ix_timelines_user_id_timestamp')
+        batch_op.drop_column('timestamp')
+
+
+def downgrade():
+    with op.batch_alter_table('timelines', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('timestamp', sa.DateTime(), nullable=True))
+
+    op.execute("""
+        UPDATE timelines SET timestamp = messages.timestamp
+        FROM messages
+        WHERE timelines.msg_id = messages.id
+    """)
+
+    with op.batch_alter_table('timelines', schema=None) as batch_op:
+        batch_op.alter_column('timestamp', nullable=False)
+        batch_op.create_index('ix_timelines_user_id_timestamp', ['user_id', sa.text('timestamp DESC'), sa.text('msg_id DESC')], unique=False)
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_user_id_id')
+        batch_op.create_index('ix_messages_user_id_timestamp', ['user_id', sa.text('timestamp DESC'), sa.text('id DESC')], unique=False)
+
+    drop_msg_id_foreign_keys()
+
+    # number messages 1, 2, 3, ... in timestamp order so the ids fit back
+    # into an INTEGER column
+    rekey_messages("n + 1")
+
+    op.alter_column('timelines', 'msg_id', type_=sa.Integer())
+    op.alter_column('likes', 'msg_id', type_=sa.Integer())
+    op.alter_column('messages', 'id', type_=sa.Integer())
+
+    op.execute("CREATE SEQUENCE messages_id_seq OWNED BY messages.id")
+    op.execute("SELECT setval('messages_id_seq', "
+               "(SELECT coalesce(max(id), 0) + 1 FROM messages), false)")
+    op.alter_column('messages', 'id',
+                    server_default=sa.text("nextval('messages_id_seq')"))
+
+    create_msg_id_foreign_keys()
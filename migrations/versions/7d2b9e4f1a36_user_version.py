@@ -0,0 +1,26 @@
+"""users.version, for ETags of pages showing a user
+
+Revision ID: 7d2b9e4f1a36
+Revises: 3e8a1f6c0b54
+Create Date: 2026-10-17 20:14:47.301552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2b9e4f1a36'
+down_revision = '3e8a1f6c0b54'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,55 @@
+"""indexes for the hot query shapes
+
+- messages (user_id, timestamp DESC, id DESC): profile pages, User.messages
+- follows (user_following_id, user_being_followed_id): User.following
+- likes (msg_id): Message.users_liked
+- timelines (user_id, timestamp DESC, msg_id DESC): home timeline pages,
+  replacing the index without msg_id
+- timelines (msg_id): removing a deleted message from every timeline
+
+Revision ID: 9c4e7d2a6b13
+Revises: d7e3a0b6c942
+Create Date: 2026-10-17 17:52:31.104265
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4e7d2a6b13'
+down_revision = 'd7e3a0b6c942'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('follows', schema=None) as batch_op:
+        batch_op.create_index('ix_follows_user_following_id', ['user_following_id', 'user_being_followed_id'], unique=False)
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.create_index('ix_messages_user_id_timestamp', ['user_id', sa.text('timestamp DESC'), sa.text('id DESC')], unique=False)
+
+    with op.batch_alter_table('likes', schema=None) as batch_op:
+        batch_op.create_index('ix_likes_msg_id', ['msg_id'], unique=False)
+
+    with op.batch_alter_table('timelines', schema=None) as batch_op:
+        batch_op.drop_index('ix_timelines_user_id_timestamp')
+        batch_op.create_index('ix_timelines_user_id_timestamp', ['user_id', sa.text('timestamp DESC'), sa.text('msg_id DESC')], unique=False)
+        batch_op.create_index('ix_timelines_msg_id', ['msg_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('timelines', schema=None) as batch_op:
+        batch_op.drop_index('ix_timelines_msg_id')
+        batch_op.drop_index('ix_timelines_user_id_timestamp')
+        batch_op.create_index('ix_timelines_user_id_timestamp', ['user_id', sa.text('timestamp DESC')], unique=False)
+
+    with op.batch_alter_table('likes', schema=None) as batch_op:
+        batch_op.drop_index('ix_likes_msg_id')
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_user_id_timestamp')
+
+    with op.batch_alter_table('follows', schema=None) as batch_op:
+        batch_op.drop_index('ix_follows_user_following_id')
@@ -0,0 +1,46 @@
+"""users: trigram indexes for user search (PostgreSQL with pg_trgm only)
+
+Servers that don't ship pg_trgm are skipped; user search falls back to
+LIKE there (see search.py).
+
+Revision ID: a8c3f1d6e247
+Revises: f4b8d2c6a915
+Create Date: 2026-10-18 10:04:51.338172
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8c3f1d6e247'
+down_revision = 'f4b8d2c6a915'
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    'ix_users_username_trgm': 'username',
+    'ix_users_bio_trgm': 'bio',
+    'ix_users_location_trgm': 'location',
+}
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    available = bind.execute(sa.text(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"))
+    if available.scalar() is None:
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, column in INDEXES.items():
+        op.execute(f"CREATE INDEX IF NOT EXISTS {name} "
+                   f"ON users USING gin (lower({column}) gin_trgm_ops)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for name in INDEXES:
+            op.execute(f"DROP INDEX IF EXISTS {name}")
@@ -0,0 +1,39 @@
+"""suggestions and suggestion_versions, for "Who to follow"
+
+Revision ID: b6e1d9a3c47f
+Revises: 7d2b9e4f1a36
+Create Date: 2026-10-17 23:41:08.512907
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e1d9a3c47f'
+down_revision = '7d2b9e4f1a36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('suggestions',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.Column('suggested_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['suggested_id'], ['users.id'], ondelete='cascade'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='cascade'),
+    sa.PrimaryKeyConstraint('user_id', 'rank')
+    )
+    op.create_table('suggestion_versions',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='cascade'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('suggestion_versions')
+    op.drop_table('suggestions')
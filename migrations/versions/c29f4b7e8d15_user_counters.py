@@ -0,0 +1,50 @@
+"""users: message, following, follower and like counters
+
+Adds the counter columns if they are missing (databases created with
+db.create_all() after they existed have them), then recomputes every
+user's counts from `messages`, `follows` and `likes`, the way
+`User.reconcile_counters()` does.
+
+Revision ID: c29f4b7e8d15
+Revises: a4c81e5d2f07
+Create Date: 2026-10-17 19:13:05.904117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c29f4b7e8d15'
+down_revision = 'a4c81e5d2f07'
+branch_labels = None
+depends_on = None
+
+# counter column -> the (table, column) whose rows it counts
+COUNTERS = {
+    'messages_count': ('messages', 'user_id'),
+    'following_count': ('follows', 'user_following_id'),
+    'followers_count': ('follows', 'user_being_followed_id'),
+    'likes_count': ('likes', 'user_id'),
+}
+
+
+def upgrade():
+    existing = {column['name']
+                for column in sa.inspect(op.get_bind()).get_columns('users')}
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        for name in COUNTERS:
+            if name not in existing:
+                batch_op.add_column(sa.Column(name, sa.Integer(), server_default='0', nullable=False))
+
+    op.execute("UPDATE users SET " + ", ".join(
+        f"{name} = (SELECT count(*) FROM {table} "
+        f"WHERE {table}.{column} = users.id)"
+        for name, (table, column) in COUNTERS.items()))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        for name in reversed(list(COUNTERS)):
+            batch_op.drop_column(name)
@@ -0,0 +1,27 @@
+"""messages: full-text search index (PostgreSQL only)
+
+Revision ID: d7e3a0b6c942
+Revises: c29f4b7e8d15
+Create Date: 2026-10-17 19:13:31.660842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7e3a0b6c942'
+down_revision = 'c29f4b7e8d15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("CREATE INDEX IF NOT EXISTS ix_messages_text_search "
+                   "ON messages USING gin (to_tsvector('english', text))")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_messages_text_search")
@@ -0,0 +1,30 @@
+"""trending_counts, the persisted counters behind /trending
+
+Revision ID: e2a7c5f90d18
+Revises: b6e1d9a3c47f
+Create Date: 2026-10-18 00:26:52.847110
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a7c5f90d18'
+down_revision = 'b6e1d9a3c47f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('trending_counts',
+    sa.Column('kind', sa.Text(), nullable=False),
+    sa.Column('bucket', sa.Integer(), nullable=False),
+    sa.Column('item_id', sa.BigInteger(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('kind', 'bucket', 'item_id')
+    )
+
+
+def downgrade():
+    op.drop_table('trending_counts')
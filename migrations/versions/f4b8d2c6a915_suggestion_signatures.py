@@ -0,0 +1,34 @@
+"""suggestion_versions.signature, of the user's own follows and likes
+
+Replaces suggestion_versions.version (a User.version). The old versions
+can't be compared with signatures, so they're dropped: the next refresh
+recomputes everyone's suggestions.
+
+Revision ID: f4b8d2c6a915
+Revises: e2a7c5f90d18
+Create Date: 2026-10-18 09:12:37.204615
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4b8d2c6a915'
+down_revision = 'e2a7c5f90d18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("DELETE FROM suggestion_versions")
+    with op.batch_alter_table('suggestion_versions', schema=None) as batch_op:
+        batch_op.drop_column('version')
+        batch_op.add_column(sa.Column('signature', sa.BigInteger(), nullable=False))
+
+
+def downgrade():
+    op.execute("DELETE FROM suggestion_versions")
+    with op.batch_alter_table('suggestion_versions', schema=None) as batch_op:
+        batch_op.drop_column('signature')
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False))
@@ -1,12 +1,15 @@
 """SQLAlchemy models for Warbler."""
 
-from datetime import datetime
+from flask_migrate import Migrate
+from sqlalchemy import DDL, event, func, literal, select, text
+from sqlalchemy.dialects import postgresql, sqlite
 
-from flask_bcrypt import Bcrypt
-from flask_sqlalchemy import SQLAlchemy
+import database
+import ids
+from hashing import password_hasher
 
-bcrypt = Bcrypt()
-db = SQLAlchemy()
+db = database.RoutingSQLAlchemy()
+migrate = Migrate()
 
 
 class Follows(db.Model):
@@ -26,6 +29,20 @@ class Follows(db.Model):
         primary_key=True,
     )
 
+    # The primary key leads with the followed user, which serves
+    # `User.followers`; this serves `User.following`.
+    __table_args__ = (
+        db.Index('ix_follows_user_following_id',
+                 user_following_id, user_being_followed_id),
+    )
+
+    @classmethod
+    def exists(cls, followed_id, follower_id):
+        """Does `follower_id` follow `followed_id`? (a primary key lookup)"""
+
+        query = cls.query.filter_by(user_being_followed_id=followed_id,
+                                    user_following_id=follower_id)
+        return db.session.query(query.exists()).scalar()
 
 
 class User(db.Model):
@@ -74,9 +91,50 @@ class User(db.Model):
         nullable=False,
     )
 
+    # Denormalized counts shown in profile headers, kept up to date by the
+    # views that change them (see `adjust_counters`) so rendering a header
+    # doesn't load four collections. `reconcile_counters` repairs drift.
+
+    messages_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    following_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    followers_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    likes_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    # Bumped by every change to the row, counters included; pages showing
+    # the user derive their ETags from it (see `page_etag()` in app.py).
+    version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
     messages = db.relationship('Message',
                                cascade="all, delete",
-                               order_by='Message.timestamp.desc()')
+                               order_by='Message.id.desc()')
 
     followers = db.relationship(
         "User",
@@ -98,14 +156,91 @@ class User(db.Model):
     def is_followed_by(self, other_user):
         """Is this user followed by `other_user`?"""
 
-        found_user_list = [user for user in self.followers if user == other_user]
-        return len(found_user_list) == 1
+        return Follows.exists(followed_id=self.id, follower_id=other_user.id)
 
     def is_following(self, other_user):
-        """Is this user following `other_use`?"""
+        """Is this user following `other_user`?"""
+
+        return Follows.exists(followed_id=other_user.id, follower_id=self.id)
+
+    def follow(self, other_user):
+        """Start following `other_user` and count it on both users.
+
+        Returns False (and changes nothing) if already following.
+        """
+
+        if self.is_following(other_user):
+            return False
+
+        db.session.add(Follows(user_being_followed_id=other_user.id,
+                               user_following_id=self.id))
+        db.session.flush()
+        User.adjust_counters(self.id, following_count=1)
+        User.adjust_counters(other_user.id, followers_count=1)
+        return True
+
+    def unfollow(self, other_user):
+        """Stop following `other_user` and count it on both users.
+
+        Returns False (and changes nothing) if not following.
+        """
+
+        removed = (Follows.query
+                   .filter_by(user_being_followed_id=other_user.id,
+                              user_following_id=self.id)
+                   .delete(synchronize_session=False))
+        if not removed:
+            return False
+
+        User.adjust_counters(self.id, following_count=-1)
+        User.adjust_counters(other_user.id, followers_count=-1)
+        return True
+
+    @classmethod
+    def adjust_counters(cls, user_ids, **deltas):
+        """Add `deltas` to the counter columns of `user_ids`.
+
+        `user_ids` is an id, a list of ids or a subquery, e.g.
+        `User.adjust_counters(5, followers_count=1)`. The addition happens
+        in SQL so concurrent requests can't overwrite each other's counts.
+        """
+
+        if isinstance(user_ids, int):
+            user_ids = [user_ids]
+
+        values = {getattr(cls, name): getattr(cls, name) + delta
+                  for name, delta in deltas.items()}
+        values[cls.version] = cls.version + 1
+
+        (cls.query
+            .filter(cls.id.in_(user_ids))
+            .update(values, synchronize_session=False))
+
+    @classmethod
+    def reconcile_counters(cls):
+        """Recompute every user's counter columns from the `messages`,
+        `follows` and `likes` tables. Returns the number of users whose
+        counts had drifted.
+        """
 
-        found_user_list = [user for user in self.following if user == other_user]
-        return len(found_user_list) == 1
+        def count(column):
+            return (select(func.count())
+                    .where(column == cls.id)
+                    .scalar_subquery())
+
+        counts = {
+            cls.messages_count: count(Message.user_id),
+            cls.following_count: count(Follows.user_following_id),
+            cls.followers_count: count(Follows.user_being_followed_id),
+            cls.likes_count: count(Like.user_id),
+        }
+        drifted = db.or_(*[column != actual
+                           for column, actual in counts.items()])
+
+        return (cls.query
+                .filter(drifted)
+                .update({**counts, cls.version: cls.version + 1},
+                        synchronize_session=False))
 
     @classmethod
     def signup(cls, username, email, password, image_url):
@@ -114,7 +249,7 @@ class User(db.Model):
         Hashes password and adds user to system.
         """
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed_pwd = password_hasher.hash(password)
 
         user = User(
             username=username,
@@ -135,26 +270,60 @@ class User(db.Model):
         and, if it finds such a user, returns that user object.
 
         If can't find matching user (or if password is wrong), returns False.
+
+        Upgrades the user's hash if it was made with an outdated bcrypt
+        cost; commit afterwards to save it.
         """
 
         user = cls.query.filter_by(username=username).first()
 
-        if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
-            if is_auth:
-                return user
+        if user and user.check_password(password):
+            return user
 
         return False
 
+    def check_password(self, password):
+        """Does `password` match this user's? Rehashes it at the current
+        bcrypt cost if needed (commit to save the new hash).
+        """
+
+        if not password_hasher.check(self.password, password):
+            return False
+
+        if password_hasher.needs_rehash(self.password):
+            self.password = password_hasher.hash(password)
+
+        return True
+
+
+@event.listens_for(User, 'before_update')
+def _bump_user_version(mapper, connection, user):
+    """Bump `User.version` whenever a flush changes the row."""
+
+    if db.session.is_modified(user, include_collections=False):
+        user.version = User.version + 1
+
+
+def _message_timestamp(context):
+    """Default for `Message.timestamp`: the time encoded in the id."""
+
+    return ids.timestamp_of(context.get_current_parameters()['id'])
+
 
 class Message(db.Model):
-    """An individual message ("warble")."""
+    """An individual message ("warble").
+
+    Ids are time-ordered snowflake ids (see ids.py) handed out by the app,
+    so ordering by id is ordering by time.
+    """
 
     __tablename__ = 'messages'
 
     id = db.Column(
-        db.Integer,
+        db.BigInteger,
         primary_key=True,
+        autoincrement=False,
+        default=ids.next_id,
     )
 
     text = db.Column(
@@ -165,7 +334,7 @@ class Message(db.Model):
     timestamp = db.Column(
         db.DateTime,
         nullable=False,
-        default=datetime.utcnow(),
+        default=_message_timestamp,
     )
 
     user_id = db.Column(
@@ -174,6 +343,11 @@ class Message(db.Model):
         nullable=False,
     )
 
+    # A user's messages, newest first: `User.messages` and profile pages.
+    __table_args__ = (
+        db.Index('ix_messages_user_id_id', user_id, id.desc()),
+    )
+
     user = db.relationship('User')
     users_liked = db.relationship("User",
                                   secondary="likes",
@@ -183,13 +357,255 @@ class Message(db.Model):
         return f"Message: {self.id}, {self.text}, {self.user_id}"
 
 
+# Text search configuration used to index and query message text.
+MESSAGE_SEARCH_CONFIG = 'english'
+
+# Full-text index for message search (see search.py). SQLite has no
+# tsvector, so it is only created on PostgreSQL.
+message_search_index = DDL(
+    "CREATE INDEX IF NOT EXISTS ix_messages_text_search ON messages "
+    f"USING gin (to_tsvector('{MESSAGE_SEARCH_CONFIG}', text))")
+
+event.listen(Message.__table__,
+             'after_create',
+             message_search_index.execute_if(dialect='postgresql'))
+
+# Trigram indexes for user search (see search.py): {name: column}. They need
+# the pg_trgm extension, so they are only created on PostgreSQL servers that
+# ship it; elsewhere user search falls back to LIKE.
+USER_TRIGRAM_INDEXES = {
+    'ix_users_username_trgm': 'username',
+    'ix_users_bio_trgm': 'bio',
+    'ix_users_location_trgm': 'location',
+}
+
+user_trigram_indexes = [DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm")] + [
+    DDL(f"CREATE INDEX IF NOT EXISTS {name} "
+        f"ON users USING gin (lower({column}) gin_trgm_ops)")
+    for name, column in USER_TRIGRAM_INDEXES.items()]
+
+
+def _pg_trgm_available(ddl, target, bind, **kw):
+    return bind.dialect.name == 'postgresql' and bind.execute(
+        text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    ).scalar() is not None
+
+
+for ddl in user_trigram_indexes:
+    event.listen(User.__table__,
+                 'after_create',
+                 ddl.execute_if(callable_=_pg_trgm_available))
+
+
 class Like(db.Model):
     """ connection of a liked message and the user who liked it """
 
     __tablename__ = "likes"
 
     user_id = db.Column(db.Integer, db.ForeignKey(User.id), primary_key=True)
-    msg_id = db.Column(db.Integer, db.ForeignKey(Message.id), primary_key=True)
+    msg_id = db.Column(db.BigInteger, db.ForeignKey(Message.id), primary_key=True)
+
+    # The primary key serves a user's likes; this serves
+    # `Message.users_liked`.
+    __table_args__ = (
+        db.Index('ix_likes_msg_id', msg_id),
+    )
+
+    @classmethod
+    def message_ids_liked_by(cls, user_id, msg_ids):
+        """Which of `msg_ids` has user `user_id` liked?
+
+        Returns a set of message ids, from a single query on `likes`.
+        """
+
+        if not msg_ids:
+            return set()
+
+        rows = (db.session
+                .query(cls.msg_id)
+                .filter(cls.user_id == user_id, cls.msg_id.in_(msg_ids)))
+        return {msg_id for (msg_id,) in rows}
+
+    @classmethod
+    def add(cls, user_id, msg_id):
+        """Record that `user_id` likes `msg_id`, counting it on the user.
+
+        One INSERT ... ON CONFLICT DO NOTHING, which also inserts nothing if
+        the message doesn't exist. Returns True if the like is new, False
+        if it was already there, None if there is no such message.
+        """
+
+        insert = (postgresql.insert if db.engine.dialect.name == 'postgresql'
+                  else sqlite.insert)
+        message = select(literal(user_id), Message.id).where(
+            Message.id == msg_id)
+        added = db.session.execute(
+            insert(cls)
+            .from_select(['user_id', 'msg_id'], message)
+            .on_conflict_do_nothing())
+
+        if added.rowcount:
+            User.adjust_counters(user_id, likes_count=1)
+            return True
+
+        exists = Message.query.filter_by(id=msg_id).exists()
+        return False if db.session.query(exists).scalar() else None
+
+    @classmethod
+    def remove(cls, user_id, msg_id):
+        """Forget that `user_id` likes `msg_id`: a DELETE by primary key.
+
+        Returns False (and changes nothing) if they didn't.
+        """
+
+        removed = (cls.query
+                   .filter_by(user_id=user_id, msg_id=msg_id)
+                   .delete(synchronize_session=False))
+        if not removed:
+            return False
+
+        User.adjust_counters(user_id, likes_count=-1)
+        return True
+
+    @classmethod
+    def uncount(cls, msg_ids):
+        """Take the likes of `msg_ids` (a list of ids or a subquery) off
+        their likers' `likes_count`. Call before deleting the messages,
+        whose likes go with them.
+        """
+
+        liked = (select(func.count())
+                 .where(cls.user_id == User.id, cls.msg_id.in_(msg_ids))
+                 .scalar_subquery())
+        likers = select(cls.user_id).where(cls.msg_id.in_(msg_ids))
+
+        (User.query
+            .filter(User.id.in_(likers))
+            .update({User.likes_count: User.likes_count - liked,
+                     User.version: User.version + 1},
+                    synchronize_session=False))
+
+    @classmethod
+    def count_for(cls, msg_id):
+        """How many users like `msg_id` (counted on `ix_likes_msg_id`)."""
+
+        return (db.session
+                .query(func.count())
+                .filter(cls.msg_id == msg_id)
+                .scalar())
+
+
+class TimelineEntry(db.Model):
+    """A message materialized into a user's home timeline.
+
+    Rows are written when a message is posted (one per follower, plus the
+    author) so the home page is a single range read on the primary key.
+    """
+
+    __tablename__ = "timelines"
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    msg_id = db.Column(
+        db.BigInteger,
+        db.ForeignKey('messages.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    author_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        nullable=False,
+    )
+
+    __table_args__ = (
+        # removing a deleted message from every timeline
+        db.Index('ix_timelines_msg_id', msg_id),
+    )
+
+
+class Suggestion(db.Model):
+    """A user suggested to another in "Who to follow".
+
+    Written by the batch job in recommendations.py, best first by `rank`,
+    so a user's suggestions are a range read on the primary key.
+    """
+
+    __tablename__ = "suggestions"
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    rank = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    suggested_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        nullable=False,
+    )
+
+    score = db.Column(
+        db.Float,
+        nullable=False,
+    )
+
+
+class SuggestionVersion(db.Model):
+    """A digest of the follows and likes a user's suggestions were computed
+    from; users whose own follows or likes have changed since get new ones
+    in the next refresh (see recommendations.signatures)."""
+
+    __tablename__ = "suggestion_versions"
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    signature = db.Column(
+        db.BigInteger,
+        nullable=False,
+    )
+
+
+class TrendingCount(db.Model):
+    """Likes a message got, or followers a user gained, in one time bucket
+    (see trending.py)."""
+
+    __tablename__ = "trending_counts"
+
+    kind = db.Column(
+        db.Text,
+        primary_key=True,
+    )
+
+    # Seconds since the epoch divided by the bucket width
+    bucket = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    # A message id or a user id, depending on `kind`
+    item_id = db.Column(
+        db.BigInteger,
+        primary_key=True,
+    )
+
+    count = db.Column(
+        db.Integer,
+        nullable=False,
+    )
 
 
 def connect_db(app):
@@ -199,4 +615,7 @@ def connect_db(app):
     """
 
     db.app = app
+    database.init_app(app)
     db.init_app(app)
+    password_hasher.init_app(app)
+    migrate.init_app(app, db)
@@ -0,0 +1,80 @@
+"""Keyset (cursor) pagination for Warbler listings.
+
+Pages are fetched with `WHERE id < cursor_id` rather than OFFSET, so every
+page costs the same index range read no matter how deep into a listing the
+reader has scrolled. Message ids are time-ordered (see ids.py), so newest
+first is simply highest id first.
+
+Cursors travel in the `before` query string parameter:
+
+- message and user listings: `before=<id>`
+- ranked search results: `before=<score>,<id>`
+"""
+
+from bisect import bisect_left
+from collections import namedtuple
+
+MESSAGES_PER_PAGE = 50
+USERS_PER_PAGE = 30
+
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+
+class InvalidCursor(ValueError):
+    """The `before` parameter could not be parsed."""
+
+
+def encode_score_cursor(score, id):
+    """Cursor pointing just past the result with this score and id."""
+
+    return f"{score!r},{id}"
+
+
+def decode_score_cursor(cursor):
+    """Turn a `<score>,<id>` cursor into a (float, int) tuple."""
+
+    try:
+        score, id = cursor.split(',')
+        return float(score), int(id)
+    except ValueError:
+        raise InvalidCursor(cursor)
+
+
+def decode_id_cursor(cursor):
+    """Turn an `<id>` cursor into an int."""
+
+    try:
+        return int(cursor)
+    except ValueError:
+        raise InvalidCursor(cursor)
+
+
+def paginate_by_id(query, id_col, before=None, per_page=USERS_PER_PAGE):
+    """Return a Page of `query` ordered by `id_col` descending.
+
+    `before` is an id cursor string (or None for the first page).
+    """
+
+    if before:
+        query = query.filter(id_col < decode_id_cursor(before))
+
+    rows = query.order_by(id_col.desc()).limit(per_page + 1).all()
+
+    items = rows[:per_page]
+    next_cursor = str(items[-1].id) if len(rows) > per_page else None
+
+    return Page(items, next_cursor)
+
+
+def paginate_ids(ids, before=None, per_page=USERS_PER_PAGE):
+    """Return a Page of `ids`, highest first, like `paginate_by_id()` but
+    over a sorted (ascending) sequence of ids already in memory.
+    """
+
+    end = bisect_left(ids, decode_id_cursor(before)) if before else len(ids)
+    start = max(end - per_page, 0)
+
+    items = list(reversed(ids[start:end]))
+    next_cursor = str(items[-1]) if start > 0 else None
+
+    return Page(items, next_cursor)
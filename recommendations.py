@@ -0,0 +1,244 @@
+"""The "Who to follow" suggestions, computed in batches.
+
+Candidates for a user come from two signals:
+
+- friends of friends: users followed by the people they follow, scored by
+  how many of those people follow them, and
+- co-likes: users who liked the same messages, scored by how many messages
+  (times COLIKE_WEIGHT).
+
+Both are sparse matrix products over the whole `follows` and `likes`
+tables, F @ F and L @ L.T with scipy, done for a chunk of users at a time.
+Users already followed (and the user themselves) are left out, and the best
+SUGGESTIONS_PER_USER are stored in `suggestions` by rank, so serving them is
+a primary key range read however large the graph grows.
+
+`refresh()` (`flask refresh-suggestions`, run it from cron) recomputes the
+suggestions of new users and of users who have followed, unfollowed, liked
+or unliked anything since theirs were computed: each user's follows and
+likes are summed into a signature, stored in `suggestion_versions`, and
+compared at the next run. Being followed or liked leaves a user's
+signature alone, and so do changes in the follows of the people they
+follow; those only show up in a full refresh (`--full`).
+
+numpy and scipy are only needed by the batch job, not by the web app.
+"""
+
+from sqlalchemy import select
+
+import bulk_load
+from follow_graph import contains, follow_graph
+from models import db, Follows, Like, Suggestion, SuggestionVersion, User
+
+# Stored per user; more than are shown, so following a few of them leaves
+# the rest to show until the next refresh.
+SUGGESTIONS_PER_USER = 20
+
+# Shown on the home page.
+SHOWN = 5
+
+# A shared like counts for this much of a shared friend.
+COLIKE_WEIGHT = 0.5
+
+# Users whose suggestions are computed (and committed) together.
+CHUNK_USERS = 1000
+
+FETCH_SIZE = 100000
+
+SUGGESTION_COLUMNS = ['user_id', 'rank', 'suggested_id', 'score']
+
+# Keep a follow of user n and a like of message n apart in signatures.
+FOLLOW_SALT = 0x9E3779B97F4A7C15
+LIKE_SALT = 0x3C6EF372FE94F82A
+
+
+def suggestions_for(user_id, version=None, limit=SHOWN):
+    """The best `limit` suggestions for `user_id`, as Users, leaving out
+    anyone they have followed since the suggestions were computed (as of
+    their `User.version` `version`, if given; see follow_graph.py)."""
+
+    users = (User.query
+             .join(Suggestion, Suggestion.suggested_id == User.id)
+             .filter(Suggestion.user_id == user_id)
+             .order_by(Suggestion.rank)
+             .all())
+    following = follow_graph.following(user_id, version)
+    return [user for user in users if not contains(following, user.id)][:limit]
+
+
+def fetch_pairs(statement):
+    """The rows of a two-integer-column `statement` as an (n, 2) array,
+    fetched FETCH_SIZE rows at a time."""
+
+    import numpy as np
+
+    result = db.session.execute(
+        statement.execution_options(stream_results=True))
+    chunks = [np.array(rows, dtype=np.int64)
+              for rows in result.partitions(FETCH_SIZE)]
+    return np.concatenate(chunks) if chunks else np.empty((0, 2), np.int64)
+
+
+def positions(user_ids, ids):
+    """(rows, found): where each of `ids` is in the sorted `user_ids`, and
+    which of them are there at all (users may come and go mid-run)."""
+
+    import numpy as np
+
+    rows = np.searchsorted(user_ids, ids)
+    found = rows < len(user_ids)
+    found[found] = user_ids[rows[found]] == ids[found]
+    return rows, found
+
+
+def adjacency(num_rows, num_columns, rows, columns):
+    """A CSR matrix with a 1 at each (row, column)."""
+
+    import numpy as np
+    from scipy import sparse
+
+    return sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, columns)),
+        shape=(num_rows, num_columns))
+
+
+def mix(ids, salt):
+    """A well-spread 64-bit hash of each of `ids` (splitmix64)."""
+
+    import numpy as np
+
+    x = ids.astype(np.uint64) + np.uint64(salt)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def signatures(user_ids, follows, likes):
+    """A signature per user (in the order of `user_ids`) of whom they
+    follow and what they like: the sum of a hash of each, so it changes
+    when either does, whatever order the rows come in."""
+
+    import numpy as np
+
+    sums = np.zeros(len(user_ids), dtype=np.uint64)
+    for pairs, salt in ((follows, FOLLOW_SALT), (likes, LIKE_SALT)):
+        rows, found = positions(user_ids, pairs[:, 0])
+        np.add.at(sums, rows[found], mix(pairs[found, 1], salt))
+    # stored in a signed BIGINT
+    return sums.view(np.int64)
+
+
+def load_matrices(user_ids, follows, likes):
+    """The follow matrix F (follower x followed) and the like matrix L
+    (user x message), with users in the order of `user_ids`, from the
+    (follower, followed) and (user, message) pairs of `follows` and
+    `likes`."""
+
+    import numpy as np
+
+    num_users = len(user_ids)
+
+    followers, found = positions(user_ids, follows[:, 0])
+    followed, found_too = positions(user_ids, follows[:, 1])
+    found &= found_too
+    F = adjacency(num_users, num_users, followers[found], followed[found])
+
+    likers, found = positions(user_ids, likes[:, 0])
+    messages, message_columns = np.unique(likes[found, 1],
+                                          return_inverse=True)
+    L = adjacency(num_users, len(messages), likers[found], message_columns)
+
+    return F, L
+
+
+def top_suggestions(F, L, rows, per_user=SUGGESTIONS_PER_USER):
+    """Best candidates for the users at `rows` of F and L.
+
+    Returns arrays (row, rank, column, score): for each user, up to
+    `per_user` candidates ranked 0, 1, ... by score (ties by position).
+    """
+
+    import numpy as np
+    from scipy import sparse
+
+    following = F[rows]
+    scores = (following @ F + COLIKE_WEIGHT * (L[rows] @ L.T)).tocsr()
+
+    # never suggest someone already followed, or the user themself
+    themselves = adjacency(len(rows), F.shape[1], np.arange(len(rows)), rows)
+    scores = scores - scores.multiply((following + themselves) > 0)
+    scores.eliminate_zeros()
+
+    scores = scores.tocoo()
+    order = np.lexsort((scores.col, -scores.data, scores.row))
+    row = scores.row[order]
+    column = scores.col[order]
+    score = scores.data[order]
+
+    # position within the row's run of entries
+    rank = np.arange(len(row)) - np.searchsorted(row, row)
+    best = rank < per_user
+    return row[best], rank[best], column[best], score[best]
+
+
+def refresh(full=False, chunk_size=CHUNK_USERS, progress=None):
+    """Recompute stale suggestions (everyone's, if `full`).
+
+    Commits after each chunk of users; `progress(done, total)` is called
+    after each one. Returns the number of users whose suggestions were
+    recomputed.
+    """
+
+    import numpy as np
+
+    user_ids = np.array(
+        db.session.scalars(select(User.id).order_by(User.id)).all(),
+        dtype=np.int64)
+    follows = fetch_pairs(select(Follows.user_following_id,
+                                 Follows.user_being_followed_id))
+    likes = fetch_pairs(select(Like.user_id, Like.msg_id))
+    current = signatures(user_ids, follows, likes)
+
+    if full:
+        stale = np.arange(len(user_ids))
+    else:
+        computed = fetch_pairs(select(SuggestionVersion.user_id,
+                                      SuggestionVersion.signature))
+        # users never computed are stale whatever their signature
+        stale = np.ones(len(user_ids), dtype=bool)
+        rows, found = positions(user_ids, computed[:, 0])
+        stale[rows[found]] = current[rows[found]] != computed[found, 1]
+        stale = np.flatnonzero(stale)
+
+    if not len(stale):
+        return 0
+
+    F, L = load_matrices(user_ids, follows, likes)
+
+    for start in range(0, len(stale), chunk_size):
+        rows = stale[start:start + chunk_size]
+        row, rank, column, score = top_suggestions(F, L, rows)
+        chunk_ids = user_ids[rows].tolist()
+
+        (Suggestion.query
+            .filter(Suggestion.user_id.in_(chunk_ids))
+            .delete(synchronize_session=False))
+        (SuggestionVersion.query
+            .filter(SuggestionVersion.user_id.in_(chunk_ids))
+            .delete(synchronize_session=False))
+        db.session.execute(
+            SuggestionVersion.__table__.insert(),
+            [{'user_id': user_id, 'signature': signature}
+             for user_id, signature in zip(chunk_ids,
+                                           current[rows].tolist())])
+        bulk_load.load(Suggestion, SUGGESTION_COLUMNS,
+                       zip(user_ids[rows[row]].tolist(),
+                           rank.tolist(),
+                           user_ids[column].tolist(),
+                           score.tolist()))
+        db.session.commit()
+
+        if progress:
+            progress(start + len(rows), len(stale))
+
+    return len(stale)
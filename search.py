@@ -0,0 +1,313 @@
+"""Search for Warbler.
+
+Users
+-----
+
+User search matches the query against username, bio and location and ranks
+exact username matches first, then username prefixes, then everything else
+(by trigram similarity, where the database can do it).
+
+There are two interchangeable backends:
+
+- PostgresUserSearch runs the search in the database, using the pg_trgm
+  extension and the GIN trigram indexes on `users` (created with the table
+  and by the migrations, where the server ships pg_trgm; see models.py).
+- LikeUserSearch matches substrings with LIKE, ranking exact usernames,
+  then username prefixes, then other username matches, then bio and
+  location matches. It is used when the database has no trigram indexes
+  (SQLite, or PostgreSQL without pg_trgm), e.g. for test runs; on
+  PostgreSQL that is logged as a warning.
+
+Both read the `users` table on every search, so every process sees the same
+users.
+
+Views talk to `user_search`, which picks a backend on first use. The search
+box gets username suggestions from its `typeahead()` (see
+static/typeahead.js).
+
+Messages
+--------
+
+Message search is full-text: every word of the query must appear in the
+message, and results are ranked by relevance and paginated with
+`before=<score>,<id>` cursors.
+
+- PostgresMessageSearch uses a GIN index on the message text's tsvector
+  (created with the `messages` table, see models.py).
+- LikeMessageSearch matches each word with LIKE, for databases without
+  tsvector (SQLite).
+
+Views talk to `message_search`.
+"""
+
+import re
+
+from flask import current_app
+from sqlalchemy import Float, bindparam, cast, func, or_, text, tuple_
+from sqlalchemy.orm import joinedload
+
+from models import (
+    db, User, Message, MESSAGE_SEARCH_CONFIG, USER_TRIGRAM_INDEXES)
+from pagination import (
+    MESSAGES_PER_PAGE, Page, decode_score_cursor, encode_score_cursor)
+
+SEARCH_LIMIT = 50
+TYPEAHEAD_LIMIT = 8
+
+# Bio and location matches rank below username matches of the same quality.
+SECONDARY_FIELD_WEIGHT = 0.5
+
+
+def escape_like(value):
+    """Escape LIKE wildcards in `value`."""
+
+    return (value
+            .replace("\\", "\\\\")
+            .replace("%", "\\%")
+            .replace("_", "\\_"))
+
+
+def like(column, pattern):
+    """`column LIKE pattern`, with backslash escapes (the default on
+    PostgreSQL, but not on SQLite)."""
+
+    return column.like(pattern, escape="\\")
+
+
+def typeahead(query, limit=TYPEAHEAD_LIMIT):
+    """Users whose username starts with `query`, shortest first."""
+
+    username = func.lower(User.username)
+    return (User
+            .query
+            .filter(like(username, f"{escape_like(query.lower())}%"))
+            .order_by(func.length(User.username), User.username)
+            .limit(limit)
+            .all())
+
+
+class PostgresUserSearch:
+    """User search on PostgreSQL with pg_trgm."""
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Users matching `query`, best first."""
+
+        q = query.lower()
+        username = func.lower(User.username)
+        bio = func.lower(User.bio)
+        location = func.lower(User.location)
+        prefix = username.like(f"{escape_like(q)}%")
+
+        score = func.greatest(
+            func.similarity(username, q),
+            func.word_similarity(q, bio) * SECONDARY_FIELD_WEIGHT,
+            func.similarity(location, q) * SECONDARY_FIELD_WEIGHT,
+        )
+
+        return (User
+                .query
+                .filter(or_(prefix,
+                            username.op('%')(q),
+                            bio.op('%>')(q),
+                            location.op('%')(q)))
+                .order_by((username == q).desc(),
+                          prefix.desc(),
+                          score.desc(),
+                          User.id)
+                .limit(limit)
+                .all())
+
+    def typeahead(self, query, limit=TYPEAHEAD_LIMIT):
+        """Users whose username starts with `query`."""
+
+        return typeahead(query, limit)
+
+
+class LikeUserSearch:
+    """User search with substring matches, for databases without pg_trgm.
+    Unlike trigram search, misspellings don't match."""
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Users matching `query`, best first."""
+
+        q = query.lower()
+        pattern = f"%{escape_like(q)}%"
+        username = func.lower(User.username)
+        prefix = like(username, f"{escape_like(q)}%")
+        in_username = like(username, pattern)
+
+        return (User
+                .query
+                .filter(or_(in_username,
+                            like(func.lower(User.bio), pattern),
+                            like(func.lower(User.location), pattern)))
+                .order_by((username == q).desc(),
+                          prefix.desc(),
+                          in_username.desc(),
+                          func.length(User.username),
+                          User.id)
+                .limit(limit)
+                .all())
+
+    def typeahead(self, query, limit=TYPEAHEAD_LIMIT):
+        """Users whose username starts with `query`."""
+
+        return typeahead(query, limit)
+
+
+class UserSearch:
+    """Front for the user search backends; picks one on first use."""
+
+    def __init__(self):
+        self.backend = None
+
+    def _backend(self):
+        if self.backend is None:
+            if has_trigram_indexes():
+                self.backend = PostgresUserSearch()
+            else:
+                if db.engine.dialect.name == 'postgresql':
+                    current_app.logger.warning(
+                        "No trigram indexes on users (is pg_trgm "
+                        "installed?): user search falls back to LIKE")
+                self.backend = LikeUserSearch()
+        return self.backend
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        return self._backend().search(query, limit)
+
+    def typeahead(self, query, limit=TYPEAHEAD_LIMIT):
+        return self._backend().typeahead(query, limit)
+
+
+user_search = UserSearch()
+
+
+def has_trigram_indexes():
+    """Is the database PostgreSQL with every one of the trigram indexes
+    user search needs? (They can't exist without pg_trgm.)"""
+
+    if db.engine.dialect.name != 'postgresql':
+        return False
+
+    found = db.session.execute(
+        text("SELECT count(*) FROM pg_indexes "
+             "WHERE tablename = 'users' AND indexname IN :names")
+        .bindparams(bindparam('names', expanding=True)),
+        {'names': list(USER_TRIGRAM_INDEXES)})
+    return found.scalar() == len(USER_TRIGRAM_INDEXES)
+
+
+def words(text):
+    """Lowercased words of `text`."""
+
+    return re.findall(r"\w+", (text or "").lower())
+
+
+def messages_page(scored, per_page):
+    """Build a Page from (Message, score) pairs, best first, fetched with
+    one extra row to tell whether there is a next page."""
+
+    items = [message for message, _ in scored[:per_page]]
+    next_cursor = None
+    if len(scored) > per_page:
+        last, score = scored[per_page - 1]
+        next_cursor = encode_score_cursor(score, last.id)
+
+    return Page(items, next_cursor)
+
+
+class PostgresMessageSearch:
+    """Message search on PostgreSQL full-text search."""
+
+    def search(self, query, before=None, per_page=MESSAGES_PER_PAGE):
+        """A Page of messages containing every word of `query`, most
+        relevant first."""
+
+        tsquery = func.plainto_tsquery(MESSAGE_SEARCH_CONFIG, query)
+        document = func.to_tsvector(MESSAGE_SEARCH_CONFIG, Message.text)
+        # as double precision, so the rank survives the round trip through
+        # a cursor exactly
+        rank = cast(func.ts_rank(document, tsquery), Float(precision=53))
+
+        results = (db.session
+                   .query(Message, rank)
+                   .options(joinedload(Message.user))
+                   .filter(document.op('@@')(tsquery)))
+
+        if before:
+            results = results.filter(
+                tuple_(rank, Message.id) < decode_score_cursor(before))
+
+        scored = (results
+                  .order_by(rank.desc(), Message.id.desc())
+                  .limit(per_page + 1)
+                  .all())
+
+        return messages_page(scored, per_page)
+
+
+class LikeMessageSearch:
+    """Message search with plain `LIKE` matches, for databases without
+    tsvector (SQLite).
+
+    Every word of the query must appear somewhere in the message (words
+    aren't stemmed, and "warble" also matches "warbler"); results are ranked
+    by how often the words occur per character of text.
+    """
+
+    def search(self, query, before=None, per_page=MESSAGES_PER_PAGE):
+        """A Page of messages containing every word of `query`, most
+        relevant first."""
+
+        terms = sorted(set(words(query)))
+        if not terms:
+            return Page([], None)
+
+        lowered = func.lower(Message.text)
+        length = cast(func.length(lowered), Float(precision=53))
+        # occurrences of each term, from how much shorter the text gets
+        # with them taken out
+        occurrences = [(func.length(lowered)
+                        - func.length(func.replace(lowered, term, '')))
+                       / len(term)
+                       for term in terms]
+        rank = sum(occurrences[1:], occurrences[0]) / length
+
+        results = (db.session
+                   .query(Message, rank)
+                   .options(joinedload(Message.user))
+                   .filter(*[like(lowered, f"%{escape_like(term)}%")
+                             for term in terms]))
+
+        if before:
+            results = results.filter(
+                tuple_(rank, Message.id) < decode_score_cursor(before))
+
+        scored = (results
+                  .order_by(rank.desc(), Message.id.desc())
+                  .limit(per_page + 1)
+                  .all())
+
+        return messages_page(scored, per_page)
+
+
+class MessageSearch:
+    """Front for the message search backends; picks one on first use."""
+
+    def __init__(self):
+        self.backend = None
+
+    def _backend(self):
+        if self.backend is None:
+            if db.engine.dialect.name == 'postgresql':
+                self.backend = PostgresMessageSearch()
+            else:
+                self.backend = LikeMessageSearch()
+        return self.backend
+
+    def search(self, query, before=None, per_page=MESSAGES_PER_PAGE):
+        return self._backend().search(query, before, per_page)
+
+
+message_search = MessageSearch()
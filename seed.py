@@ -1,19 +1,160 @@
-"""Seed database with sample data from CSV Files."""
+"""Seed database with sample data.
 
+    python seed.py                  # the CSV files in generator/
+    python seed.py --users 1000000 --messages 100000000 --follows-per-user 50
+
+The second form generates a synthetic dataset on the fly (see
+generator/synthetic.py) instead of reading CSVs. Either way rows are streamed
+into the database a chunk at a time (see bulk_load.py).
+
+Home timelines are then built with at most timeline.TIMELINE_SIZE messages
+each, so the second form makes up to 800 million timeline rows (a million
+users times 800); scale --users down for a smaller database.
+"""
+
+import argparse
+import time
 from csv import DictReader
-from app import db
-from models import User, Message, Follows
+from datetime import datetime
+from itertools import chain
+
+from flask_migrate import stamp
+
+from app import create_app
+from bulk_load import CHUNK_SIZE, load, reset_id_sequence
+from generator import synthetic
+from ids import MAX_SEQUENCE, MAX_WORKER_ID, SEQUENCE_BITS, make_id
+from models import db, User, Message, Follows
+import timeline
+
+USERS_CSV_COLUMNS = ['email', 'username', 'image_url', 'password', 'bio',
+                     'header_image_url', 'location']
+
+
+def csv_rows(path, columns):
+    """Stream the `columns` of each row of the CSV at `path`, as tuples.
+
+    Files without an `id` column get their ids from the database, except
+    messages, whose ids are made from their timestamps.
+    """
+
+    with open(path) as f:
+        reader = DictReader(f)
+        if 'id' in reader.fieldnames:
+            columns = ['id', *columns]
+        yield columns
+        for row in reader:
+            yield tuple(row[column] for column in columns)
+
+
+def csv_message_rows(path):
+    """Messages from the CSV at `path`, with ids that sort by timestamp."""
+
+    rows = csv_rows(path, ['text', 'timestamp', 'user_id'])
+    columns = next(rows)
+    if 'id' in columns:
+        yield columns
+        yield from rows
+        return
+
+    yield ['id', *columns]
+    for i, (text, timestamp, user_id) in enumerate(rows):
+        # the row number stands in for the worker id and sequence, so rows
+        # from the same millisecond still get distinct ids
+        msg_id = make_id(datetime.fromisoformat(timestamp),
+                         sequence=i & MAX_SEQUENCE,
+                         worker_id=(i >> SEQUENCE_BITS) & MAX_WORKER_ID)
+        yield (msg_id, text, timestamp, user_id)
+
+
+def load_table(model, rows, chunk_size):
+    """Load `rows`, whose first item is the list of columns, into `model`."""
+
+    rows = iter(rows)
+    columns = next(rows)
+    started = time.monotonic()
+
+    def progress(total):
+        rate = total / max(time.monotonic() - started, 1e-9)
+        print(f"\r{model.__tablename__}: {total:,} rows ({rate:,.0f}/s)",
+              end="", flush=True)
+
+    load(model, columns, rows, chunk_size=chunk_size, progress=progress)
+    print()
+
+
+def synthetic_tables(num_users, num_messages, follows_per_user, seed=0):
+    """(model, rows) pairs for a generated dataset, for `seed_database()`."""
+
+    return [
+        (User, chain([synthetic.USERS_COLUMNS],
+                     synthetic.users(num_users, seed))),
+        (Message, chain([synthetic.MESSAGES_COLUMNS],
+                        synthetic.messages(num_messages, num_users,
+                                           seed=seed))),
+        (Follows, chain([synthetic.FOLLOWS_COLUMNS],
+                        synthetic.follows(num_users, follows_per_user,
+                                          seed=seed))),
+    ]
+
+
+def csv_tables():
+    """(model, rows) pairs for the CSVs in generator/."""
+
+    return [
+        (User, csv_rows('generator/users.csv', USERS_CSV_COLUMNS)),
+        (Message, csv_message_rows('generator/messages.csv')),
+        (Follows, csv_rows('generator/follows.csv',
+                           synthetic.FOLLOWS_COLUMNS)),
+    ]
+
+
+def seed_database(tables, chunk_size=CHUNK_SIZE):
+    """Recreate the database and fill it from `tables`. Call inside an app
+    context."""
+
+    db.drop_all()
+    db.create_all()
+
+    # create_all() builds the current schema, so record it as fully migrated
+    stamp()
+
+    for model, rows in tables:
+        load_table(model, rows, chunk_size)
+    reset_id_sequence(User)
+
+    # bulk loads skip the fan-out and counter updates done by the views, so
+    # build the home timelines and user counters from scratch. Following a
+    # user only backfills their latest messages, and timelines only keep
+    # their newest, so the rebuild does the same
+    print("Building timelines and counters...")
+    timeline.rebuild(per_author=timeline.BACKFILL_SIZE,
+                     per_reader=timeline.TIMELINE_SIZE)
+    User.reconcile_counters()
+    db.session.commit()
+
 
-db.drop_all()
-db.create_all()
+def main():
+    parser = argparse.ArgumentParser(description="Seed the Warbler database.")
+    parser.add_argument('--users', type=int,
+                        help="generate this many users instead of reading "
+                             "generator/*.csv")
+    parser.add_argument('--messages', type=int, default=0)
+    parser.add_argument('--follows-per-user', type=float, default=0)
+    parser.add_argument('--seed', type=int, default=0,
+                        help="random seed for generated data")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
 
-with open('generator/users.csv') as users:
-    db.session.bulk_insert_mappings(User, DictReader(users))
+    if args.users:
+        tables = synthetic_tables(args.users, args.messages,
+                                  args.follows_per_user, args.seed)
+    else:
+        tables = csv_tables()
 
-with open('generator/messages.csv') as messages:
-    db.session.bulk_insert_mappings(Message, DictReader(messages))
+    with create_app().app_context():
+        seed_database(tables, args.chunk_size)
 
-with open('generator/follows.csv') as follows:
-    db.session.bulk_insert_mappings(Follows, DictReader(follows))
 
-db.session.commit()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Run Warbler in one of two serving modes.
+
+    python serve.py sync --workers 8        # a fixed pool of worker threads
+    python serve.py gevent --connections 5000
+
+sync is how the app has always run (the dev server, gunicorn's sync and
+gthread workers): each request holds a thread from start to finish,
+including while it waits on PostgreSQL or on a slow client, so a handful
+of slow clients can occupy every worker.
+
+gevent runs each connection in a greenlet. The standard library is
+monkey-patched and psycopg2 gets a wait callback (psycogreen), so a request
+waiting on a socket or a query yields to the others and one process holds
+thousands of open connections. Queries still need a pooled database
+connection (see DATABASE_POOL_SIZE in database.py), and password hashing
+still runs in the hashing processes (see hashing.py), so neither blocks the
+event loop. Under gunicorn, use `-k gevent` and call `patch_for_gevent()`
+from a post_fork hook.
+
+gevent and psycogreen are only needed for the gevent mode.
+"""
+
+import argparse
+
+DEFAULT_WORKERS = 8
+DEFAULT_CONNECTIONS = 10000
+
+
+def patch_for_gevent():
+    """Make the standard library and psycopg2 cooperative. Call before
+    anything else is imported."""
+
+    from gevent import monkey
+    monkey.patch_all()
+
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+
+def serve_gevent(host, port, connections, config=None):
+    patch_for_gevent()
+
+    from gevent.pool import Pool
+    from gevent.pywsgi import WSGIServer
+
+    from app import create_app
+
+    server = WSGIServer((host, port), create_app(config),
+                        spawn=Pool(connections), log=None)
+    server.serve_forever()
+
+
+def serve_sync(host, port, workers, config=None):
+    # imported here, not at the top, so that the gevent mode can patch
+    # threading before anything imports it
+    from concurrent.futures import ThreadPoolExecutor
+
+    from werkzeug.serving import BaseWSGIServer
+
+    from app import create_app
+
+    class PooledWSGIServer(BaseWSGIServer):
+        """Handles connections in a fixed pool of threads."""
+
+        pool = ThreadPoolExecutor(workers)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.process_request_thread,
+                             request, client_address)
+
+        def process_request_thread(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    server = PooledWSGIServer(host, port, create_app(config))
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('mode', choices=['sync', 'gevent'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="worker threads (sync mode)")
+    parser.add_argument('--connections', type=int,
+                        default=DEFAULT_CONNECTIONS,
+                        help="most connections handled at once "
+                             "(gevent mode)")
+    args = parser.parse_args()
+
+    if args.mode == 'gevent':
+        serve_gevent(args.host, args.port, args.connections)
+    else:
+        serve_sync(args.host, args.port, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+// Infinite scroll: when the "next page" marker at the end of a listing
+// scrolls into view, fetch the next page as an HTML fragment and put it
+// in the marker's place. The fragment ends with its own marker if there
+// are more pages.
+
+let nextPageObserver = new IntersectionObserver(handleNextPageVisible);
+
+async function handleNextPageVisible(entries){
+  for (let entry of entries){
+    if (!entry.isIntersecting){
+      continue;
+    }
+    nextPageObserver.unobserve(entry.target);
+    let $marker = $(entry.target);
+    let page_html = await $.get($marker.data("next"), {fragment: 1});
+    $marker.replaceWith(page_html);
+    observeNextPage();
+  }
+}
+
+function observeNextPage(){
+  $(".next-page").each((i, marker) => nextPageObserver.observe(marker));
+}
+
+observeNextPage();
@@ -1,23 +1,15 @@
-$likeForm = $(".not-liked")
-$unlikeForm = $(".liked")
-
-
 async function handleLikeSubmit(evt){
   evt.preventDefault();
   let $form = $(evt.target);
   let messageId = $form.attr("id");
-  let data = $form.serialize();
-  if ($form.hasClass("liked")){
-    await $.post(`/messages/${messageId}/unlike`, data=data)
-  }
-  else{
-    await $.post(`/messages/${messageId}/like`, data=data)
-  }
+  await $.ajax({
+    url: `/api/v1/messages/${messageId}/like`,
+    method: $form.hasClass("liked") ? "DELETE" : "PUT",
+    headers: {"X-CSRFToken": $form.find("input[name=csrf_token]").val()},
+  });
   $form.children().children("i").toggleClass(["fas", "far"])
   $form.toggleClass(["liked", "not-liked"])
 }
 
-$likeForm.on("submit", handleLikeSubmit)
-$unlikeForm.on("submit", handleLikeSubmit)
-
-
+// delegated, so forms in pages loaded by infinite_scroll.js work too
+$(document).on("submit", ".liked, .not-liked", handleLikeSubmit)
@@ -0,0 +1,14 @@
+// Live home timeline: new warbles from the people you follow arrive over
+// Server-Sent Events (see live.py) and go on top of the list, so there's
+// no need to reload the page. The browser reconnects dropped streams.
+
+let $homeMessages = $("ul#messages[data-page='home']");
+
+function handleNewWarble(evt){
+  $homeMessages.prepend(evt.data);
+}
+
+if ($homeMessages.length && window.EventSource){
+  let timelineStream = new EventSource("/timeline/stream");
+  timelineStream.addEventListener("warble", handleNewWarble);
+}
@@ -0,0 +1,8 @@
+// "Who to follow" in the home page aside: fetched as an HTML fragment
+// once the page is up, so the timeline never waits for it.
+
+let $suggestions = $("#suggestions");
+
+if ($suggestions.length){
+  $suggestions.load($suggestions.data("url"));
+}
@@ -0,0 +1,27 @@
+// Username suggestions for the search box, from /users/typeahead, shown
+// as the options of its <datalist>. Picking one searches for that user,
+// whom the search ranks first.
+
+const TYPEAHEAD_DELAY_MS = 150;
+
+let $search = $("#search");
+let $searchUsers = $("#search-users");
+let typeaheadTimer;
+
+async function showTypeahead(){
+  let q = $search.val().trim();
+  if (!q){
+    $searchUsers.empty();
+    return;
+  }
+  let users = await $.getJSON("/users/typeahead", {q});
+  // skip answers that came back after the box changed again
+  if ($search.val().trim() !== q) return;
+  $searchUsers.empty().append(
+    users.map(user => $("<option>").attr("value", user.username)));
+}
+
+$search.on("input", function(){
+  clearTimeout(typeaheadTimer);
+  typeaheadTimer = setTimeout(showTypeahead, TYPEAHEAD_DELAY_MS);
+});
@@ -0,0 +1,150 @@
+"""JSON API tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_api.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Like, Follows
+
+from app import create_app, CURR_USER_KEY
+from test_query_counts import capture_queries
+
+# Run test modules in parallel by giving each its own database
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL',
+                                   "postgresql:///warbler-test")
+
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+    # Don't have WTForms use CSRF at all, since it's a pain to test
+    'WTF_CSRF_ENABLED': False,
+})
+
+
+def setUpModule():
+    with app.app_context():
+        db.create_all()
+
+
+class ApiTestCase(TestCase):
+    """Test /api/v1."""
+
+    def setUp(self):
+        """Create a reader and an author with a warble."""
+
+        Follows.query.delete()
+        Like.query.delete()
+        User.query.delete()
+        Message.query.delete()
+
+        reader = User(email="reader@test.com",
+                      username="reader",
+                      password="HASHED_PASSWORD")
+        author = User(email="author@test.com",
+                      username="author",
+                      password="HASHED_PASSWORD")
+        db.session.add_all([reader, author])
+        db.session.commit()
+
+        msg = Message(text="API warble")
+        author.messages.append(msg)
+        db.session.commit()
+
+        self.reader_id = reader.id
+        self.author_id = author.id
+        self.msg_id = msg.id
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.reader_id
+
+    def tearDown(self):
+        """ Rollback transactions and remove the likes, which other test
+        modules don't clean up before deleting users """
+        db.session.rollback()
+        Like.query.delete()
+        db.session.commit()
+
+    def test_requires_login(self):
+        """ Are anonymous requests refused? """
+        resp = app.test_client().get("/api/v1/timeline")
+        self.assertEqual(resp.status_code, 401)
+        self.assertEqual(resp.json, {"error": "Log in first."})
+
+    def test_follow_and_timeline(self):
+        """ Does following bring the author's warbles into the timeline? """
+        self.assertEqual(self.client.get("/api/v1/timeline").json,
+                         {"messages": [], "next": None})
+
+        url = f"/api/v1/users/{self.author_id}/follow"
+        for _ in range(2):
+            resp = self.client.put(url)
+            self.assertEqual(resp.status_code, 204)
+            self.assertEqual(resp.get_data(), b"")
+        self.assertEqual(User.query.get(self.author_id).followers_count, 1)
+
+        messages = self.client.get("/api/v1/timeline").json["messages"]
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0]["id"], str(self.msg_id))
+        self.assertEqual(messages[0]["text"], "API warble")
+        self.assertEqual(messages[0]["user"]["username"], "author")
+        self.assertFalse(messages[0]["liked"])
+
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.get("/api/v1/timeline").json["messages"],
+                         [])
+        self.assertEqual(User.query.get(self.author_id).followers_count, 0)
+
+        self.assertEqual(self.client.put("/api/v1/users/0/follow").status_code,
+                         404)
+
+        resp = self.client.put(f"/api/v1/users/{self.reader_id}/follow")
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json, {"error": "You can't follow yourself."})
+
+    def test_like(self):
+        """ Are likes idempotent and counted once? """
+        url = f"/api/v1/messages/{self.msg_id}/like"
+        for _ in range(2):
+            self.assertEqual(self.client.put(url).status_code, 204)
+        self.assertIsNotNone(Like.query.get((self.reader_id, self.msg_id)))
+        self.assertEqual(User.query.get(self.reader_id).likes_count, 1)
+
+        for _ in range(2):
+            self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertIsNone(Like.query.get((self.reader_id, self.msg_id)))
+        self.assertEqual(User.query.get(self.reader_id).likes_count, 0)
+
+        resp = self.client.put("/api/v1/messages/1/like")
+        self.assertEqual(resp.status_code, 404)
+        self.assertIn("error", resp.json)
+
+    def test_csrf(self):
+        """ Are writes without a CSRF token refused? """
+        app.config['WTF_CSRF_ENABLED'] = True
+        try:
+            resp = self.client.put(f"/api/v1/messages/{self.msg_id}/like")
+        finally:
+            app.config['WTF_CSRF_ENABLED'] = False
+        self.assertEqual(resp.status_code, 400)
+        self.assertIsNone(Like.query.get((self.reader_id, self.msg_id)))
+
+    def test_form_like_endpoints(self):
+        """ Do /messages/<id>/like and /unlike answer with the like count,
+        without loading the user or the message? """
+        for _ in range(2):
+            with capture_queries() as statements:
+                resp = self.client.post(f"/messages/{self.msg_id}/like")
+            self.assertEqual(resp.json, {"liked": True, "likes": 1})
+            self.assertFalse(any('FROM users' in statement
+                                 for statement, _ in statements))
+        self.assertEqual(User.query.get(self.reader_id).likes_count, 1)
+
+        resp = self.client.post(f"/messages/{self.msg_id}/unlike")
+        self.assertEqual(resp.json, {"liked": False, "likes": 0})
+        self.assertEqual(User.query.get(self.reader_id).likes_count, 0)
+
+        self.assertEqual(self.client.post("/messages/1/like").status_code,
+                         404)
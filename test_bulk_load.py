@@ -0,0 +1,172 @@
+"""Synthetic data and bulk load tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_bulk_load.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, TimelineEntry
+
+from app import create_app
+from bulk_load import chunked, load, reset_id_sequence
+from generator import synthetic
+import ids
+import timeline
+
+# Run test modules in parallel by giving each its own database
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL',
+                                   "postgresql:///warbler-test")
+
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+})
+
+
+def setUpModule():
+    with app.app_context():
+        db.create_all()
+
+
+class SyntheticDataTestCase(TestCase):
+    """Generated rows must be valid and repeatable."""
+
+    def test_users(self):
+        rows = list(synthetic.users(50, seed=1))
+
+        self.assertEqual([row[0] for row in rows], list(range(1, 51)))
+        self.assertEqual(len({row[1] for row in rows}), 50)
+        self.assertEqual(len({row[2] for row in rows}), 50)
+        self.assertEqual(rows, list(synthetic.users(50, seed=1)))
+
+    def test_messages(self):
+        rows = list(synthetic.messages(500, 20, seed=1))
+        msg_ids = [row[0] for row in rows]
+
+        self.assertEqual(msg_ids, sorted(set(msg_ids)))
+        for msg_id, text, timestamp, user_id in rows:
+            self.assertLessEqual(len(text), synthetic.MAX_WARBLE_LENGTH)
+            self.assertIn(user_id, range(1, 21))
+            self.assertEqual(ids.timestamp_of(msg_id),
+                             timestamp.replace(
+                                 microsecond=timestamp.microsecond // 1000
+                                 * 1000))
+
+    def test_follows(self):
+        rows = list(synthetic.follows(100, 10, seed=1))
+
+        self.assertEqual(len(rows), len(set(rows)))
+        for followed, follower in rows:
+            self.assertNotEqual(followed, follower)
+            self.assertIn(followed, range(1, 101))
+            self.assertIn(follower, range(1, 101))
+
+        # low user ids are the popular ones
+        followers = [followed for followed, follower in rows]
+        self.assertGreater(followers.count(1), followers.count(100))
+
+    def test_chunked(self):
+        self.assertEqual(list(chunked(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(chunked([], 2)), [])
+
+
+class BulkLoadTestCase(TestCase):
+    """Loading streams of rows into the database."""
+
+    def setUp(self):
+        TimelineEntry.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_load(self):
+        """Rows land in the tables, chunk by chunk, and sequences move on."""
+
+        totals = []
+        num_users = load(User, synthetic.USERS_COLUMNS,
+                         synthetic.users(30), chunk_size=7,
+                         progress=totals.append)
+        load(Message, synthetic.MESSAGES_COLUMNS,
+             synthetic.messages(200, 30))
+        load(Follows, synthetic.FOLLOWS_COLUMNS,
+             synthetic.follows(30, 5))
+        reset_id_sequence(User)
+
+        self.assertEqual(num_users, 30)
+        self.assertEqual(totals, [7, 14, 21, 28, 30])
+        self.assertEqual(User.query.count(), 30)
+        self.assertEqual(Message.query.count(), 200)
+        self.assertEqual(Follows.query.count(),
+                         len(list(synthetic.follows(30, 5))))
+
+        user = User.signup("newuser", "new@example.com", "password", None)
+        db.session.commit()
+        self.assertEqual(user.id, 31)
+
+    def test_rebuild_per_author(self):
+        """A bounded rebuild pushes only each author's latest messages."""
+
+        load(User, synthetic.USERS_COLUMNS, synthetic.users(2))
+        load(Message, synthetic.MESSAGES_COLUMNS,
+             synthetic.messages(10, 1))
+        load(Follows, synthetic.FOLLOWS_COLUMNS, [(1, 2)])
+
+        timeline.rebuild(per_author=3)
+        db.session.commit()
+
+        latest = [msg.id for msg in
+                  Message.query.order_by(Message.id.desc()).limit(3)]
+        for user_id in (1, 2):
+            page = timeline.home_timeline(user_id)
+            self.assertEqual([msg.id for msg in page.items], latest)
+
+    def test_rebuild_per_reader(self):
+        """A bounded rebuild keeps only each timeline's latest messages."""
+
+        load(User, synthetic.USERS_COLUMNS, synthetic.users(3))
+        load(Message, synthetic.MESSAGES_COLUMNS,
+             synthetic.messages(12, 2))
+        load(Follows, synthetic.FOLLOWS_COLUMNS, [(1, 3), (2, 3)])
+
+        timeline.rebuild(per_reader=5)
+        db.session.commit()
+
+        latest = [msg.id for msg in
+                  Message.query.order_by(Message.id.desc()).limit(5)]
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=3).count(), 5)
+        page = timeline.home_timeline(3)
+        self.assertEqual([msg.id for msg in page.items], latest)
+        for user_id in (1, 2):
+            self.assertLessEqual(
+                TimelineEntry.query.filter_by(user_id=user_id).count(), 5)
+
+    def test_trim(self):
+        """Trimming keeps each timeline's newest messages."""
+
+        load(User, synthetic.USERS_COLUMNS, synthetic.users(2))
+        load(Message, synthetic.MESSAGES_COLUMNS,
+             synthetic.messages(10, 1))
+        load(Follows, synthetic.FOLLOWS_COLUMNS, [(1, 2)])
+        timeline.rebuild()
+
+        # only the timelines asked for
+        self.assertEqual(timeline.trim([2], size=4), 6)
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=1).count(),
+                         10)
+
+        self.assertEqual(timeline.trim(size=4), 6)
+        db.session.commit()
+
+        latest = [msg.id for msg in
+                  Message.query.order_by(Message.id.desc()).limit(4)]
+        for user_id in (1, 2):
+            self.assertEqual(
+                TimelineEntry.query.filter_by(user_id=user_id).count(), 4)
+            page = timeline.home_timeline(user_id)
+            self.assertEqual([msg.id for msg in page.items], latest)
@@ -0,0 +1,117 @@
+"""Database routing tests: pool settings and read replicas."""
+
+# run these tests like:
+#
+#    python -m unittest test_database.py
+
+
+import os
+from unittest import TestCase
+
+from sqlalchemy import event
+
+from models import db, User, Message, Like, Follows
+
+from app import create_app, CURR_USER_KEY
+from database import engine_options, replica_binds
+
+# Run test modules in parallel by giving each its own database
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL',
+                                   "postgresql:///warbler-test")
+
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+    # Don't have WTForms use CSRF at all, since it's a pain to test
+    'WTF_CSRF_ENABLED': False,
+})
+
+
+def setUpModule():
+    with app.app_context():
+        db.create_all()
+
+
+# The test database stands in for a replica of itself: what matters is
+# which engine the statements go through.
+REPLICA_URL = TEST_DATABASE_URL
+
+
+class SettingsTestCase(TestCase):
+    def test_engine_options(self):
+        self.assertEqual(engine_options({}), {})
+        self.assertEqual(
+            engine_options({'DATABASE_POOL_SIZE': '20',
+                            'DATABASE_POOL_RECYCLE': '1800',
+                            'DATABASE_POOL_PRE_PING': 'true',
+                            'UNRELATED': 'x'}),
+            {'pool_size': 20, 'pool_recycle': 1800, 'pool_pre_ping': True})
+
+    def test_replica_binds(self):
+        self.assertEqual(replica_binds(None), {})
+        self.assertEqual(replica_binds("postgresql://a/w, postgresql://b/w"),
+                         {'replica0': "postgresql://a/w",
+                          'replica1': "postgresql://b/w"})
+
+
+class ReplicaRoutingTestCase(TestCase):
+    def setUp(self):
+        Follows.query.delete()
+        Like.query.delete()
+        User.query.delete()
+        Message.query.delete()
+
+        reader = User(email="reader@test.com", username="reader",
+                      password="HASHED_PASSWORD")
+        author = User(email="author@test.com", username="author",
+                      password="HASHED_PASSWORD")
+        db.session.add_all([reader, author])
+        db.session.commit()
+        self.reader_id = reader.id
+        self.author_id = author.id
+
+        self.binds = app.config['SQLALCHEMY_BINDS']
+        app.config['SQLALCHEMY_BINDS'] = {'replica0': REPLICA_URL}
+        app.config['READ_YOUR_WRITES_SECONDS'] = 60
+
+        self.replica_statements = []
+        self.replica = db.get_engine(app, bind='replica0')
+        event.listen(self.replica, "before_cursor_execute",
+                     self.on_replica)
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.reader_id
+
+    def tearDown(self):
+        event.remove(self.replica, "before_cursor_execute", self.on_replica)
+        app.config['SQLALCHEMY_BINDS'] = self.binds
+        db.session.rollback()
+
+    def on_replica(self, conn, cursor, statement, *args):
+        self.replica_statements.append(statement)
+
+    def test_read_only_views_use_replica(self):
+        resp = self.client.get(f"/users/{self.author_id}")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(self.replica_statements)
+
+    def test_other_views_use_primary(self):
+        resp = self.client.get("/users/profile")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.replica_statements, [])
+
+    def test_reads_stick_to_primary_after_write(self):
+        resp = self.client.post(f"/users/follow/{self.author_id}")
+        self.assertEqual(resp.status_code, 302)
+
+        resp = self.client.get(f"/users/{self.reader_id}/following")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("@author", resp.get_data(as_text=True))
+        self.assertEqual(self.replica_statements, [])
+
+        app.config['READ_YOUR_WRITES_SECONDS'] = 0
+        self.client.post(f"/users/stop-following/{self.author_id}")
+        self.client.get(f"/users/{self.reader_id}/following")
+        self.assertTrue(self.replica_statements)
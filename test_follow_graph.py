@@ -0,0 +1,273 @@
+"""Follow graph tests: sorted id arrays, the graph and paged follow lists."""
+
+# run these tests like:
+#
+#    python -m unittest test_follow_graph.py
+
+
+import os
+from array import array
+from unittest import TestCase
+
+from models import db, User, Message, Like, Follows
+
+from app import create_app, CURR_USER_KEY
+from follow_graph import (
+    FollowGraph, contains, follow_graph, with_id, without_id)
+from pagination import USERS_PER_PAGE, paginate_ids
+from test_query_counts import capture_queries
+
+# Run test modules in parallel by giving each its own database
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL',
+                                   "postgresql:///warbler-test")
+
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+    # Don't have WTForms use CSRF at all, since it's a pain to test
+    'WTF_CSRF_ENABLED': False,
+})
+
+
+def setUpModule():
+    with app.app_context():
+        db.create_all()
+
+
+class SortedIdsTestCase(TestCase):
+    def test_contains(self):
+        ids = array('i', [2, 5])
+
+        self.assertTrue(contains(ids, 5))
+        self.assertFalse(contains(ids, 3))
+        self.assertFalse(contains(ids, 6))
+        self.assertFalse(contains(array('i'), 1))
+
+    def test_with_and_without(self):
+        ids = array('i', [2, 5])
+
+        self.assertEqual(list(with_id(ids, 3)), [2, 3, 5])
+        self.assertEqual(list(with_id(ids, 5)), [2, 5])
+        self.assertEqual(list(without_id(ids, 2)), [5])
+        self.assertEqual(list(without_id(ids, 4)), [2, 5])
+        # copies, never changes in place
+        self.assertEqual(list(ids), [2, 5])
+
+    def test_paginate_ids(self):
+        ids = array('i', range(1, 8))
+
+        page = paginate_ids(ids, per_page=3)
+        self.assertEqual(page.items, [7, 6, 5])
+        self.assertEqual(page.next_cursor, "5")
+
+        page = paginate_ids(ids, before="2", per_page=3)
+        self.assertEqual(page.items, [1])
+        self.assertIsNone(page.next_cursor)
+
+
+class FollowGraphTestCase(TestCase):
+    def setUp(self):
+        Follows.query.delete()
+        Like.query.delete()
+        User.query.delete()
+        Message.query.delete()
+
+        users = [User(email=f"{name}@test.com", username=name,
+                      password="HASHED_PASSWORD")
+                 for name in ("ann", "bob", "cat", "dan")]
+        db.session.add_all(users)
+        db.session.commit()
+        self.ann, self.bob, self.cat, self.dan = [u.id for u in users]
+
+        # ann <-> bob, ann -> cat, bob -> cat, cat -> dan
+        for follower, followed in [(self.ann, self.bob),
+                                   (self.bob, self.ann),
+                                   (self.ann, self.cat),
+                                   (self.bob, self.cat),
+                                   (self.cat, self.dan)]:
+            db.session.add(Follows(user_following_id=follower,
+                                   user_being_followed_id=followed))
+        db.session.commit()
+
+        follow_graph.reset()
+        self.ctx = app.test_request_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        self.ctx.pop()
+        db.session.rollback()
+        follow_graph.ttl = app.config.get('FOLLOW_GRAPH_TTL', 60)
+
+    def test_lists(self):
+        self.assertEqual(list(follow_graph.following(self.ann)),
+                         sorted([self.bob, self.cat]))
+        self.assertEqual(list(follow_graph.followers(self.cat)),
+                         sorted([self.ann, self.bob]))
+        self.assertEqual(
+            follow_graph.following_ids_among(self.cat, [self.ann, self.dan]),
+            {self.dan})
+
+    def test_loaded_once(self):
+        follow_graph.following(self.ann)
+
+        with capture_queries() as statements:
+            follow_graph.following(self.ann)
+            follow_graph.following_ids_among(self.ann, [self.bob, self.dan])
+        self.assertEqual(statements, [])
+
+    def test_reloads_when_stale(self):
+        follow_graph.following(self.dan)
+        db.session.add(Follows(user_following_id=self.dan,
+                               user_being_followed_id=self.ann))
+        db.session.commit()
+
+        self.assertEqual(list(follow_graph.following(self.dan)), [])
+        follow_graph.ttl = 0
+        self.assertEqual(list(follow_graph.following(self.dan)), [self.ann])
+
+    def test_reloads_at_new_version(self):
+        """A list asked for at another version of its owner is loaded
+        again, however recently it was loaded."""
+
+        follow_graph.following(self.dan, 1)
+        db.session.add(Follows(user_following_id=self.dan,
+                               user_being_followed_id=self.ann))
+        db.session.commit()
+
+        self.assertEqual(list(follow_graph.following(self.dan, 1)), [])
+        self.assertEqual(list(follow_graph.following(self.dan, 2)),
+                         [self.ann])
+        with capture_queries() as statements:
+            follow_graph.following(self.dan, 2)
+        self.assertEqual(statements, [])
+
+    def test_updates(self):
+        follow_graph.following(self.dan)
+        follow_graph.followers(self.ann)
+
+        with capture_queries() as statements:
+            follow_graph.add(self.dan, self.ann)
+            self.assertEqual(list(follow_graph.following(self.dan)),
+                             [self.ann])
+            self.assertIn(self.dan, follow_graph.followers(self.ann))
+
+            follow_graph.remove(self.dan, self.ann)
+            self.assertEqual(list(follow_graph.following(self.dan)), [])
+        self.assertEqual(statements, [])
+
+    def test_change_during_load_not_cached(self):
+        """A list that changes while it loads may have been read from before
+        the change; it isn't cached."""
+
+        graph = FollowGraph()
+        load = graph._load
+
+        def racing_load(direction, user_id):
+            ids = load(direction, user_id)
+            # another request's follow commits and updates the graph
+            db.session.add(Follows(user_following_id=self.dan,
+                                   user_being_followed_id=self.ann))
+            db.session.commit()
+            graph.add(self.dan, self.ann)
+            return ids
+
+        graph._load = racing_load
+        self.assertEqual(list(graph.following(self.dan)), [])
+        graph._load = load
+        self.assertEqual(list(graph.following(self.dan)), [self.ann])
+
+    def test_remove_user(self):
+        follow_graph.following(self.ann)
+        follow_graph.followers(self.bob)
+
+        follow_graph.remove_user(self.bob)
+
+        self.assertEqual(list(follow_graph.following(self.ann)), [self.cat])
+        self.assertNotIn(('followers', self.bob), follow_graph.entries)
+
+
+class FollowListViewsTestCase(TestCase):
+    def setUp(self):
+        Follows.query.delete()
+        Like.query.delete()
+        User.query.delete()
+        Message.query.delete()
+
+        self.reader = User(email="reader@test.com", username="reader",
+                           password="HASHED_PASSWORD")
+        db.session.add(self.reader)
+        db.session.commit()
+        self.reader_id = self.reader.id
+
+        unfollowed = User(email="unfollowed@test.com", username="unfollowed",
+                          password="HASHED_PASSWORD")
+        db.session.add(unfollowed)
+        db.session.commit()
+        self.user_id = unfollowed.id
+
+        self.followed_ids = []
+        for i in range(3):
+            user = User(email=f"user{i}@test.com", username=f"user{i}",
+                        password="HASHED_PASSWORD")
+            db.session.add(user)
+            db.session.commit()
+            db.session.add(Follows(user_following_id=self.reader_id,
+                                   user_being_followed_id=user.id))
+            self.followed_ids.append(user.id)
+        db.session.commit()
+        follow_graph.reset()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.reader_id
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_following_paged(self):
+        resp = self.client.get(f"/users/{self.reader_id}/following")
+        html = resp.get_data(as_text=True)
+
+        self.assertEqual(resp.status_code, 200)
+        for i in range(3):
+            self.assertIn(f"@user{i}", html)
+        self.assertLess(len(self.followed_ids), USERS_PER_PAGE)
+        self.assertNotIn("next-page", html)
+
+        resp = self.client.get(f"/users/{self.reader_id}/following"
+                               f"?before={self.followed_ids[1]}&fragment=1")
+        html = resp.get_data(as_text=True)
+        self.assertIn("@user0", html)
+        self.assertNotIn("@user1", html)
+
+    def test_follow_updates_lists(self):
+        with app.app_context():
+            follow_graph.followers(self.followed_ids[0])
+
+        self.client.post(f"/users/stop-following/{self.followed_ids[0]}")
+
+        resp = self.client.get(f"/users/{self.followed_ids[0]}/followers")
+        self.assertNotIn("@reader", resp.get_data(as_text=True))
+
+    def test_follow_seen_by_other_processes(self):
+        """ After a follow, does a process that didn't handle it (with its
+        own graph) show it, to the follower and on the followed user's
+        followers page, once past the read-your-writes window? """
+        other_process = FollowGraph()
+        with app.test_request_context():
+            reader = User.query.get(self.reader_id)
+            followed = User.query.get(self.user_id)
+            other_process.following(self.reader_id, reader.version)
+            other_process.followers(self.user_id, followed.version)
+
+        resp = self.client.post(f"/users/follow/{self.user_id}")
+        self.assertEqual(resp.status_code, 302)
+
+        with app.test_request_context():
+            reader = User.query.get(self.reader_id)
+            followed = User.query.get(self.user_id)
+            self.assertTrue(contains(
+                other_process.following(self.reader_id, reader.version),
+                self.user_id))
+            self.assertTrue(contains(
+                other_process.followers(self.user_id, followed.version),
+                self.reader_id))
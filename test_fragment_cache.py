@@ -0,0 +1,156 @@
+"""Message fragment cache tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_fragment_cache.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Like, Follows
+
+from app import create_app, CURR_USER_KEY
+from fragment_cache import (
+    CSRF_PLACEHOLDER, FragmentCache, MemoryFragmentBackend, fragment_cache)
+import timeline
+
+# Run test modules in parallel by giving each its own database
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL',
+                                   "postgresql:///warbler-test")
+
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+    # Don't have WTForms use CSRF at all, since it's a pain to test
+    'WTF_CSRF_ENABLED': False,
+})
+
+
+def setUpModule():
+    with app.app_context():
+        db.create_all()
+
+
+class FragmentCacheTestCase(TestCase):
+    """Test rendering timelines from cached fragments."""
+
+    def setUp(self):
+        """Create a reader following an author with a warble."""
+
+        Follows.query.delete()
+        Like.query.delete()
+        User.query.delete()
+        Message.query.delete()
+
+        reader = User.signup(username="reader",
+                             email="reader@test.com",
+                             password="password",
+                             image_url=None)
+        author = User.signup(username="author",
+                             email="author@test.com",
+                             password="password",
+                             image_url=None)
+        db.session.commit()
+
+        reader.following.append(author)
+        msg = Message(text="Cached warble")
+        author.messages.append(msg)
+        db.session.commit()
+        timeline.rebuild()
+        db.session.commit()
+
+        self.reader_id = reader.id
+        self.author_id = author.id
+        self.msg_id = msg.id
+        self.client = app.test_client()
+        fragment_cache.reset()
+
+    def tearDown(self):
+        """ Rollback transactions and remove the likes, which other test
+        modules don't clean up before deleting users """
+        db.session.rollback()
+        Like.query.delete()
+        db.session.commit()
+
+    def get(self, url, user_id):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = user_id
+            resp = c.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return resp.get_data(as_text=True)
+
+    def test_cache_hits(self):
+        """ Is a fragment rendered once, and kept per like state? """
+        html = self.get("/", self.reader_id)
+        self.assertIn("Cached warble", html)
+        self.assertIn('class="form-group not-liked"', html)
+        self.assertNotIn(CSRF_PLACEHOLDER, html)
+        self.assertEqual((fragment_cache.hits, fragment_cache.misses), (0, 1))
+
+        self.assertEqual(self.get("/", self.reader_id), html)
+        self.assertEqual((fragment_cache.hits, fragment_cache.misses), (1, 1))
+
+        # the author sees the same warble without a like button
+        html = self.get("/", self.author_id)
+        self.assertNotIn('class="form-group not-liked"', html)
+        self.assertEqual(fragment_cache.misses, 2)
+
+        db.session.add(Like(user_id=self.reader_id, msg_id=self.msg_id))
+        db.session.commit()
+        html = self.get("/", self.reader_id)
+        self.assertIn('class="form-group liked"', html)
+
+    def test_profile_edit_invalidates(self):
+        """ Do timelines show the author's new name after a profile edit? """
+        self.get("/", self.reader_id)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.author_id
+            c.post("/users/profile",
+                   data={"username": "renamed",
+                         "email": "author@test.com",
+                         "bio": "New name",
+                         "password": "password"})
+
+        html = self.get("/", self.reader_id)
+        self.assertIn("@renamed", html)
+        self.assertNotIn("@author", html)
+
+    def test_profile_edit_seen_by_every_process(self):
+        """ Does a cache the edit never went through (another process's)
+        miss the author's old name too? """
+        other_process = FragmentCache()
+
+        def render(cache):
+            with app.test_request_context():
+                msg = Message.query.get(self.msg_id)
+                [html] = cache.render_messages(
+                    [msg], {msg.id: "anon"},
+                    lambda message: f"@{message.user.username}")
+                return html
+
+        self.assertEqual(render(fragment_cache), "@author")
+        self.assertEqual(render(other_process), "@author")
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.author_id
+            c.post("/users/profile",
+                   data={"username": "renamed",
+                         "email": "author@test.com",
+                         "bio": "New name",
+                         "password": "password"})
+
+        self.assertEqual(render(fragment_cache), "@renamed")
+        self.assertEqual(render(other_process), "@renamed")
+
+    def test_lru_eviction(self):
+        """ Does the memory backend evict the least recently used entry? """
+        backend = MemoryFragmentBackend(size=2)
+        backend.set_many({"a": "A", "b": "B"})
+        backend.get_many(["a"])
+        backend.set_many({"c": "C"})
+        self.assertEqual(backend.get_many(["a", "b", "c"]),
+                         {"a": "A", "c": "C"})
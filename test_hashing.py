@@ -0,0 +1,118 @@
+"""Password hashing tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_hashing.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Like, Follows
+
+from app import create_app
+from hashing import HashingBusy, PasswordHasher, password_hasher, rounds_of
+
+# Run test modules in parallel by giving each its own database
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL',
+                                   "postgresql:///warbler-test")
+
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+    # Don't have WTForms use CSRF at all, since it's a pain to test
+    'WTF_CSRF_ENABLED': False,
+})
+
+
+def setUpModule():
+    with app.app_context():
+        db.create_all()
+
+
+class PasswordHasherTestCase(TestCase):
+    """Test the hashing service."""
+
+    def test_hash_and_check(self):
+        """ Do hashes check out, in-process and in the worker pool? """
+        for workers in [0, 1]:
+            hasher = PasswordHasher(rounds=4, workers=workers)
+            try:
+                hashed = hasher.hash("correct horse")
+                self.assertEqual(rounds_of(hashed), 4)
+                self.assertTrue(hasher.check(hashed, "correct horse"))
+                self.assertFalse(hasher.check(hashed, "battery staple"))
+            finally:
+                hasher.shutdown()
+
+            stats = hasher.stats()
+            self.assertEqual(stats['hash']['calls'], 1)
+            self.assertEqual(stats['check']['calls'], 2)
+            self.assertGreater(stats['check']['max_seconds'], 0)
+
+    def test_timeout(self):
+        """ Does a hash the pool can't get to in time raise HashingBusy? """
+        hasher = PasswordHasher(rounds=4, workers=1, timeout=0.001)
+        try:
+            with self.assertRaises(HashingBusy):
+                hasher.hash("correct horse")
+        finally:
+            hasher.shutdown()
+
+    def test_long_passwords(self):
+        """ Are passwords past bcrypt's 72 byte limit accepted? """
+        hasher = PasswordHasher(rounds=4)
+        hashed = hasher.hash("x" * 100)
+        self.assertTrue(hasher.check(hashed, "x" * 100))
+
+
+class RehashTestCase(TestCase):
+    """Test upgrading hashes on login."""
+
+    def setUp(self):
+        Follows.query.delete()
+        Like.query.delete()
+        User.query.delete()
+        Message.query.delete()
+
+        self.rounds = password_hasher.rounds
+        password_hasher.rounds = 4
+        User.signup(username="testuser",
+                    email="test@test.com",
+                    password="testuser",
+                    image_url=None)
+        db.session.commit()
+
+    def tearDown(self):
+        password_hasher.rounds = self.rounds
+        db.session.rollback()
+
+    def test_rehash_on_login(self):
+        """ Does logging in upgrade a hash made at an outdated cost? """
+        password_hasher.rounds = 5
+
+        resp = app.test_client().post(
+            "/login", data={"username": "testuser", "password": "testuser"})
+        self.assertEqual(resp.status_code, 302)
+
+        db.session.expire_all()
+        user = User.query.filter_by(username="testuser").one()
+        self.assertEqual(rounds_of(user.password), 5)
+        self.assertTrue(User.authenticate("testuser", "testuser"))
+
+    def test_login_when_busy(self):
+        """ Does a login the pool can't check in time get a 503 asking to
+        try again? """
+        workers, timeout = password_hasher.workers, password_hasher.timeout
+        password_hasher.shutdown()
+        password_hasher.workers, password_hasher.timeout = 1, 0
+        try:
+            resp = app.test_client().post(
+                "/login", data={"username": "testuser", "password": "testuser"})
+        finally:
+            password_hasher.shutdown()
+            password_hasher.workers = workers
+            password_hasher.timeout = timeout
+
+        self.assertEqual(resp.status_code, 503)
+        self.assertIn("Retry-After", resp.headers)
+        self.assertIn("please try again", resp.get_data(as_text=True))
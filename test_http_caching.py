@@ -0,0 +1,107 @@
+"""HTTP caching tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_http_caching.py
+
+
+import os
+import re
+from unittest import TestCase
+
+from models import db, User, Message, Like, Follows
+
+from app import create_app, CURR_USER_KEY
+
+# Run test modules in parallel by giving each its own database
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL',
+                                   "postgresql:///warbler-test")
+
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+    # Don't have WTForms use CSRF at all, since it's a pain to test
+    'WTF_CSRF_ENABLED': False,
+})
+
+
+def setUpModule():
+    with app.app_context():
+        db.create_all()
+
+
+class HttpCachingTestCase(TestCase):
+    """Test ETags, 304s and Cache-Control policies."""
+
+    def setUp(self):
+        """Create a user with a warble."""
+
+        Follows.query.delete()
+        Like.query.delete()
+        User.query.delete()
+        Message.query.delete()
+
+        u = User.signup(username="testuser",
+                        email="test@test.com",
+                        password="testuser",
+                        image_url=None)
+        msg = Message(text="Cacheable warble")
+        u.messages.append(msg)
+        db.session.commit()
+
+        self.user_id = u.id
+        self.msg_id = msg.id
+        self.client = app.test_client()
+
+    def tearDown(self):
+        """ Rollback transactions """
+        db.session.rollback()
+
+    def test_conditional_get(self):
+        """ Is an unchanged page answered with 304, and a changed one
+        re-rendered? """
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            for url in [f"/users/{self.user_id}", f"/messages/{self.msg_id}",
+                        "/"]:
+                resp = c.get(url)
+                etag = resp.headers["ETag"]
+                self.assertEqual(resp.status_code, 200)
+                self.assertIn("private", resp.headers["Cache-Control"])
+                self.assertIn("no-cache", resp.headers["Cache-Control"])
+
+                resp = c.get(url, headers={"If-None-Match": etag})
+                self.assertEqual(resp.status_code, 304, url)
+                self.assertEqual(resp.get_data(), b"")
+
+            etag = c.get(f"/users/{self.user_id}").headers["ETag"]
+            c.post("/users/profile",
+                   data={"username": "renamed",
+                         "email": "test@test.com",
+                         "bio": "New name",
+                         "password": "testuser"})
+            resp = c.get(f"/users/{self.user_id}",
+                         headers={"If-None-Match": etag})
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("@renamed", resp.get_data(as_text=True))
+
+    def test_no_store_by_default(self):
+        """ Are pages without a caching policy still not stored? """
+        resp = self.client.get("/login")
+        self.assertIn("no-store", resp.headers["Cache-Control"])
+
+    def test_hashed_assets(self):
+        """ Are assets linked by content hash and cached for good? """
+        html = self.client.get("/login").get_data(as_text=True)
+        url = re.search(r'src="(/assets/like\.[0-9a-f]+\.js)"', html).group(1)
+
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("immutable", resp.headers["Cache-Control"])
+        self.assertIn("max-age=31536000", resp.headers["Cache-Control"])
+        resp.close()
+
+        self.assertEqual(
+            self.client.get("/assets/like.0123456789.js").status_code, 404)
+        self.assertEqual(self.client.get("/assets/like.js").status_code, 404)
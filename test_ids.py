@@ -0,0 +1,155 @@
+"""Snowflake id tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_ids.py
+
+
+import os
+from datetime import datetime, timezone
+from unittest import TestCase
+from unittest.mock import patch
+
+from flask import Flask
+from sqlalchemy import text
+
+from models import db
+
+from app import create_app
+import ids
+from ids import (
+    IdGenerator, MAX_SEQUENCE, check_worker_id_config, lease_held,
+    lease_worker_id, make_id, timestamp_of)
+
+# Run test modules in parallel by giving each its own database
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL',
+                                   "postgresql:///warbler-test")
+
+app = create_app({'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL})
+
+
+class FakeClock:
+    """A clock that only moves when told to."""
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class IdGeneratorTestCase(TestCase):
+    """Test id generation."""
+
+    def test_ids_increase(self):
+        """ Are ids strictly increasing within and across milliseconds? """
+        clock = FakeClock(1700000000.0)
+        generator = IdGenerator(7, clock)
+
+        ids = [generator.next_id() for _ in range(MAX_SEQUENCE + 10)]
+        clock.now += 1
+        ids.append(generator.next_id())
+
+        self.assertEqual(ids, sorted(set(ids)))
+
+    def test_clock_going_backwards(self):
+        """ Does a clock step backwards keep ids increasing? """
+        clock = FakeClock(1700000000.0)
+        generator = IdGenerator(0, clock)
+
+        first = generator.next_id()
+        clock.now -= 5
+        self.assertGreater(generator.next_id(), first)
+
+    def test_timestamps(self):
+        """ Do ids round-trip to the time they were made for? """
+        when = datetime(2021, 6, 1, 12, 30, 15, 250000)
+        self.assertEqual(timestamp_of(make_id(when, sequence=3)), when)
+        self.assertLess(make_id(when), make_id(when, sequence=1))
+
+        utc = when.replace(tzinfo=timezone.utc)
+        generator = IdGenerator(1, utc.timestamp)
+        self.assertEqual(timestamp_of(generator.next_id()), when)
+
+    def test_worker_ids(self):
+        """ Are out of range worker ids and pre-epoch times rejected? """
+        with self.assertRaises(ValueError):
+            IdGenerator(1024)
+        with self.assertRaises(ValueError):
+            make_id(datetime(2001, 1, 1))
+
+
+class WorkerIdTestCase(TestCase):
+    """Test how processes get their worker ids."""
+
+    def test_leases(self):
+        """ Do live processes lease different worker ids, and does an id
+        free up when its holder goes away? """
+        with app.app_context():
+            first, first_connection = lease_worker_id(db.engine)
+            second, second_connection = lease_worker_id(db.engine)
+            self.assertNotEqual(first, second)
+
+            first_connection.close()
+            again, again_connection = lease_worker_id(db.engine)
+            self.assertEqual(again, first)
+
+            again_connection.close()
+            second_connection.close()
+
+    def test_lost_lease(self):
+        """ Is a lease whose connection dropped noticed at the next check,
+        and a new one taken before any more ids are handed out? """
+        with patch.dict(os.environ), app.app_context():
+            os.environ.pop('WARBLER_WORKER_ID', None)
+            ids._forget_generator()
+            try:
+                first_id = ids.next_id()
+                lease = ids._lease
+                self.assertTrue(lease_held(lease, ids._generator.worker_id))
+
+                cursor = lease.cursor()
+                cursor.execute("SELECT pg_backend_pid()")
+                pid = cursor.fetchone()[0]
+                lease.commit()
+                db.session.execute(text("SELECT pg_terminate_backend(:pid)"),
+                                   {"pid": pid})
+                db.session.commit()
+                self.assertFalse(lease_held(lease, ids._generator.worker_id))
+
+                # not due a check yet
+                ids.next_id()
+                self.assertIs(ids._lease, lease)
+
+                ids._lease_checked_at -= ids.LEASE_CHECK_SECONDS
+                self.assertGreater(ids.next_id(), first_id)
+                self.assertIsNot(ids._lease, lease)
+                self.assertTrue(lease_held(ids._lease,
+                                           ids._generator.worker_id))
+            finally:
+                if ids._lease is not None:
+                    ids._lease.close()
+                ids._generator = ids._lease = None
+                ids._inherited_leases.clear()
+
+    def test_no_pid_ids_in_production(self):
+        """ Does an app that can't lease worker ids refuse to start without
+        WARBLER_WORKER_ID, outside debug and testing? """
+
+        def check(url, **config):
+            app = Flask(__name__)
+            app.config.update(SQLALCHEMY_DATABASE_URI=url, **config)
+            check_worker_id_config(app)
+
+        with patch.dict(os.environ):
+            os.environ.pop('WARBLER_WORKER_ID', None)
+            with self.assertRaises(RuntimeError):
+                check("sqlite://")
+            check("sqlite://", TESTING=True)
+            check(TEST_DATABASE_URL)
+
+            os.environ['WARBLER_WORKER_ID'] = "5"
+            check("sqlite://")
+            os.environ['WARBLER_WORKER_ID'] = "1024"
+            with self.assertRaises(RuntimeError):
+                check("sqlite://")
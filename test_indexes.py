@@ -0,0 +1,136 @@
+"""Index tests: the hot queries must be answerable from an index."""
+
+# run these tests like:
+#
+#    python -m unittest test_indexes.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Like, Follows
+
+from app import create_app, CURR_USER_KEY
+from test_query_counts import capture_queries
+import timeline
+
+# Run test modules in parallel by giving each its own database
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL',
+                                   "postgresql:///warbler-test")
+
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+    # Don't have WTForms use CSRF at all, since it's a pain to test
+    'WTF_CSRF_ENABLED': False,
+})
+
+
+def setUpModule():
+    with app.app_context():
+        db.create_all()
+
+
+# Requests whose queries must never need a sequential scan: the views
+# behind them run on every page load or every write. Placeholders are
+# filled in from the data created in setUp.
+HOT_REQUESTS = [
+    ("GET", "/"),
+    ("GET", "/users"),
+    ("GET", "/users/{author_id}"),
+    ("GET", "/users/{reader_id}/likes"),
+    ("GET", "/users/{reader_id}/following"),
+    ("GET", "/users/{author_id}/followers"),
+    ("GET", "/messages/{message_id}"),
+    ("POST", "/users/stop-following/{author_id}"),
+    ("POST", "/users/follow/{author_id}"),
+    ("POST", "/messages/{message_id}/delete"),
+]
+
+
+def explain(statement, parameters):
+    """PostgreSQL's plan for `statement`, with sequential scans disabled.
+
+    With enable_seqscan off the planner still falls back to a sequential
+    scan when no index can answer the query, so any "Seq Scan" left in the
+    plan means a missing index.
+    """
+
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SET enable_seqscan = off")
+        cursor.execute("EXPLAIN " + statement, parameters)
+        return "\n".join(line for (line,) in cursor.fetchall())
+    finally:
+        connection.rollback()
+        connection.close()
+
+
+class IndexTestCase(TestCase):
+    """EXPLAIN every query run by the hot requests."""
+
+    def setUp(self):
+        """Create a reader following an author who has liked warbles."""
+
+        Follows.query.delete()
+        Like.query.delete()
+        User.query.delete()
+        Message.query.delete()
+
+        reader = User(email="reader@test.com",
+                      username="reader",
+                      password="HASHED_PASSWORD")
+        author = User(email="author@test.com",
+                      username="author",
+                      password="HASHED_PASSWORD")
+        db.session.add_all([reader, author])
+        db.session.commit()
+
+        reader.following.append(author)
+        author.following.append(reader)
+        for i in range(3):
+            author.messages.append(Message(text=f"warble {i}"))
+        db.session.commit()
+
+        for message in author.messages:
+            db.session.add(Like(user_id=reader.id, msg_id=message.id))
+        timeline.rebuild()
+        db.session.commit()
+
+        self.ids = {
+            "reader_id": reader.id,
+            "author_id": author.id,
+            "message_id": author.messages[0].id,
+        }
+        self.client = app.test_client()
+
+    def tearDown(self):
+        """ Rollback transactions and remove the likes, which other test
+        modules don't clean up before deleting users """
+        db.session.rollback()
+        Like.query.delete()
+        db.session.commit()
+
+    def test_hot_queries_use_indexes(self):
+        """ Does any hot query fall back to a sequential scan? """
+        for method, url in HOT_REQUESTS:
+            url = url.format(**self.ids)
+            # messages can only be deleted by their author
+            user_id = (self.ids["author_id"] if url.endswith("/delete")
+                       else self.ids["reader_id"])
+
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = user_id
+
+                with capture_queries() as statements:
+                    resp = c.open(url, method=method)
+            self.assertIn(resp.status_code, (200, 302), url)
+
+            for statement, parameters in statements:
+                if not statement.lstrip().upper().startswith(
+                        ("SELECT", "UPDATE", "DELETE", "INSERT")):
+                    continue
+                plan = explain(statement, parameters)
+                self.assertNotIn("Seq Scan", plan,
+                                 f"{method} {url}\n{statement}\n{plan}")
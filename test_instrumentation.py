@@ -0,0 +1,118 @@
+"""Request instrumentation tests: Server-Timing and /metrics."""
+
+# run these tests like:
+#
+#    python -m unittest test_instrumentation.py
+
+
+import os
+import re
+from unittest import TestCase
+
+from models import db, User, Message, Like, Follows
+
+from app import create_app, CURR_USER_KEY
+from instrumentation import Histogram, metrics
+from test_query_counts import capture_queries
+import timeline
+
+# Run test modules in parallel by giving each its own database
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL',
+                                   "postgresql:///warbler-test")
+
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+    # Don't have WTForms use CSRF at all, since it's a pain to test
+    'WTF_CSRF_ENABLED': False,
+})
+
+
+def setUpModule():
+    with app.app_context():
+        db.create_all()
+
+
+class HistogramTestCase(TestCase):
+    def test_lines(self):
+        histogram = Histogram('h', "Help.", ('route',), (1, 5))
+        for value in (0, 1, 3, 9):
+            histogram.observe(('home',), value)
+
+        self.assertEqual(list(histogram.lines()), [
+            '# HELP h Help.',
+            '# TYPE h histogram',
+            'h_bucket{route="home",le="1"} 2',
+            'h_bucket{route="home",le="5"} 3',
+            'h_bucket{route="home",le="+Inf"} 4',
+            'h_sum{route="home"} 13',
+            'h_count{route="home"} 4',
+        ])
+
+
+class InstrumentationTestCase(TestCase):
+    def setUp(self):
+        Follows.query.delete()
+        Like.query.delete()
+        User.query.delete()
+        Message.query.delete()
+
+        self.user = User(email="user@test.com", username="user",
+                         password="HASHED_PASSWORD")
+        db.session.add(self.user)
+        db.session.commit()
+        for i in range(3):
+            message = Message(text=f"warble {i}", user_id=self.user.id)
+            db.session.add(message)
+        db.session.commit()
+        timeline.rebuild()
+        db.session.commit()
+
+        self.user_id = self.user.id
+        metrics.reset()
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+    def tearDown(self):
+        db.session.rollback()
+        app.config['METRICS_TOKEN'] = None
+
+    def test_server_timing(self):
+        """The header reports the request's queries, objects and times."""
+
+        with capture_queries() as statements:
+            resp = self.client.get("/")
+
+        timing = resp.headers['Server-Timing']
+        self.assertIn(f'desc="{len(statements)} queries"', timing)
+        # the user and their three messages
+        self.assertIn('orm;desc="4 objects"', timing)
+        self.assertRegex(timing, r'tpl;dur=\d+\.\d')
+        self.assertRegex(timing, r'app;dur=\d+\.\d')
+
+    def test_metrics(self):
+        """/metrics has per-route counts and histograms."""
+
+        self.client.get("/")
+        self.client.get("/")
+        self.client.get(f"/users/{self.user_id}")
+
+        text = self.client.get("/metrics").get_data(as_text=True)
+
+        self.assertIn('warbler_requests_total{endpoint="views.homepage",'
+                      'method="GET",status="200"} 2', text)
+        self.assertIn('warbler_request_duration_seconds_count'
+                      '{endpoint="views.users_show",method="GET"} 1', text)
+        statements = re.search(
+            r'warbler_request_sql_statements_sum'
+            r'\{endpoint="views.homepage",method="GET"\} (\d+)', text)
+        self.assertGreater(int(statements.group(1)), 0)
+        self.assertIn('warbler_fragment_cache_misses_total', text)
+
+    def test_metrics_token(self):
+        app.config['METRICS_TOKEN'] = "s3cret"
+
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        resp = self.client.get("/metrics",
+                               headers={'Authorization': "Bearer s3cret"})
+        self.assertEqual(resp.status_code, 200)
@@ -0,0 +1,130 @@
+"""Live timeline tests: the local broker and /timeline/stream."""
+
+# run these tests like:
+#
+#    python -m unittest test_live.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Like, Follows
+
+from app import create_app, CURR_USER_KEY
+from live import LocalBroker, live
+
+# Run test modules in parallel by giving each its own database
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL',
+                                   "postgresql:///warbler-test")
+
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+    # Don't have WTForms use CSRF at all, since it's a pain to test
+    'WTF_CSRF_ENABLED': False,
+    # so reading an idle stream doesn't hold the tests up
+    'LIVE_KEEPALIVE_SECONDS': 0.05,
+})
+
+
+def setUpModule():
+    with app.app_context():
+        db.create_all()
+
+
+class LocalBrokerTestCase(TestCase):
+    def test_publish(self):
+        broker = LocalBroker()
+        first_tab = broker.subscribe(1)
+        second_tab = broker.subscribe(1)
+        other_user = broker.subscribe(2)
+
+        broker.publish([1, 3], "event")
+
+        self.assertEqual(first_tab.get(0), "event")
+        self.assertEqual(second_tab.get(0), "event")
+        self.assertIsNone(other_user.get(0))
+
+    def test_close(self):
+        broker = LocalBroker()
+        first_tab = broker.subscribe(1)
+        second_tab = broker.subscribe(1)
+
+        first_tab.close()
+        broker.publish([1], "event")
+        self.assertIsNone(first_tab.get(0))
+        self.assertEqual(second_tab.get(0), "event")
+
+        second_tab.close()
+        self.assertEqual(dict(broker.subscriptions), {})
+
+
+class TimelineStreamTestCase(TestCase):
+    def setUp(self):
+        Follows.query.delete()
+        Like.query.delete()
+        User.query.delete()
+        Message.query.delete()
+
+        author = User(email="author@test.com", username="author",
+                      password="HASHED_PASSWORD")
+        follower = User(email="follower@test.com", username="follower",
+                        password="HASHED_PASSWORD")
+        stranger = User(email="stranger@test.com", username="stranger",
+                        password="HASHED_PASSWORD")
+        db.session.add_all([author, follower, stranger])
+        db.session.commit()
+        db.session.add(Follows(user_being_followed_id=author.id,
+                               user_following_id=follower.id))
+        db.session.commit()
+
+        self.author_id = author.id
+        self.follower_id = follower.id
+        self.stranger_id = stranger.id
+        live.reset()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def client_for(self, user_id):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+        return client
+
+    def open_stream(self, user_id):
+        """The stream's response and an iterator over its chunks, with the
+        opening `retry:` chunk already read."""
+
+        resp = self.client_for(user_id).get("/timeline/stream",
+                                            buffered=False)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.mimetype, "text/event-stream")
+        chunks = iter(resp.response)
+        self.assertTrue(next(chunks).startswith(b"retry:"))
+        return resp, chunks
+
+    def test_followers_get_new_messages(self):
+        follower_resp, follower_stream = self.open_stream(self.follower_id)
+        stranger_resp, stranger_stream = self.open_stream(self.stranger_id)
+
+        resp = self.client_for(self.author_id).post(
+            "/messages/new", data={"text": "Hello, followers"})
+        self.assertEqual(resp.status_code, 200)
+
+        message = Message.query.one()
+        event = next(follower_stream).decode()
+        self.assertIn(f"id: {message.id}\nevent: warble\n", event)
+        self.assertIn("Hello, followers", event)
+        # followers get a like button, with their own CSRF fields
+        self.assertIn('class="form-group not-liked"', event)
+        self.assertNotIn("<!--csrf-->", event)
+
+        self.assertEqual(next(stranger_stream), b": keepalive\n\n")
+
+        follower_resp.close()
+        stranger_resp.close()
+        self.assertEqual(dict(live.broker.subscriptions), {})
+
+    def test_stream_needs_login(self):
+        resp = app.test_client().get("/timeline/stream")
+        self.assertEqual(resp.status_code, 401)
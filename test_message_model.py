@@ -2,22 +2,30 @@
 
 
 import os
+from datetime import datetime, timedelta
 from unittest import TestCase
 from sqlalchemy.exc import IntegrityError
 from models import db, User, Message, Follows, Like
+from ids import timestamp_of
 
 
-os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+from app import create_app
 
-# Now we can import app
+# Run test modules in parallel by giving each its own database
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL',
+                                   "postgresql:///warbler-test")
 
-from app import app
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+})
 
-# Create our tables (we do this here, so we only create the tables
+
+# Create our tables (we do this in setUpModule, so we only create the tables
 # once for all tests --- in each test, we'll delete the data
 # and create fresh new clean test data
-
-db.create_all()
+def setUpModule():
+    with app.app_context():
+        db.create_all()
 
 
 class UserModelTestCase(TestCase):
@@ -55,6 +63,24 @@ class UserModelTestCase(TestCase):
         self.assertEqual(f"{m}",
                          f"Message: {m.id}, testText, {self.user.id}")
 
+    def test_message_ids_and_timestamps(self):
+        """ Do new messages get increasing ids and their own timestamps? """
+
+        first = Message(text='first', user_id=self.user.id)
+        db.session.add(first)
+        db.session.commit()
+        second = Message(text='second', user_id=self.user.id)
+        db.session.add(second)
+        db.session.commit()
+
+        self.assertGreater(second.id, first.id)
+        self.assertGreaterEqual(second.timestamp, first.timestamp)
+        self.assertEqual(first.timestamp, timestamp_of(first.id))
+        self.assertLess(datetime.utcnow() - second.timestamp,
+                        timedelta(minutes=1))
+        self.assertEqual([m.text for m in self.user.messages],
+                         ['second', 'first'])
+
     def test_message_like(self):
         """ Does the like relationship work? """
 
@@ -8,28 +8,27 @@
 import os
 from unittest import TestCase
 
-from models import db, connect_db, Message, User, Like
+from models import db, connect_db, Message, User, Like, Follows
 
-# BEFORE we import our app, let's set an environmental variable
-# to use a different database for tests (we need to do this
-# before we import our app, since that will have already
-# connected to the database
+from app import create_app, CURR_USER_KEY
 
-os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+# Run test modules in parallel by giving each its own database
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL',
+                                   "postgresql:///warbler-test")
 
-# Now we can import app
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+    # Don't have WTForms use CSRF at all, since it's a pain to test
+    'WTF_CSRF_ENABLED': False,
+})
 
-from app import app, CURR_USER_KEY
 
-# Create our tables (we do this here, so we only create the tables
+# Create our tables (we do this in setUpModule, so we only create the tables
 # once for all tests --- in each test, we'll delete the data
 # and create fresh new clean test data
-
-db.create_all()
-
-# Don't have WTForms use CSRF at all, since it's a pain to test
-
-app.config['WTF_CSRF_ENABLED'] = False
+def setUpModule():
+    with app.app_context():
+        db.create_all()
 
 
 class MessageViewTestCase(TestCase):
@@ -37,17 +36,26 @@ class MessageViewTestCase(TestCase):
 
     def setUp(self):
         """Create test client, add sample data."""
+        Follows.query.delete()
         Like.query.delete()
         User.query.delete()
         Message.query.delete()
 
         self.client = app.test_client()
-        # store id instead
-        self.testuser = User.signup(username="testuser",
-                                    email="test@test.com",
-                                    password="testuser",
-                                    image_url=None)
+        testuser = User.signup(username="testuser",
+                               email="test@test.com",
+                               password="testuser",
+                               image_url=None)
+
+        db.session.commit()
+        # store the id: the user is detached once a request ends the session
+        self.testuser_id = testuser.id
 
+    def tearDown(self):
+        """ Rollback transactions and remove the likes, which other test
+        modules don't clean up before deleting users """
+        db.session.rollback()
+        Like.query.delete()
         db.session.commit()
 
     def test_add_message(self):
@@ -58,7 +66,7 @@ class MessageViewTestCase(TestCase):
 
         with self.client as c:
             with c.session_transaction() as sess:
-                sess[CURR_USER_KEY] = self.testuser.id
+                sess[CURR_USER_KEY] = self.testuser_id
 
             # Now, that session setting is saved, so we can have
             # the rest of ours test
@@ -77,7 +85,7 @@ class MessageViewTestCase(TestCase):
         """ Can the message page be shown?"""
         with self.client as c:
             with c.session_transaction() as sess:
-                sess[CURR_USER_KEY] = self.testuser.id
+                sess[CURR_USER_KEY] = self.testuser_id
 
             c.post("/messages/new", data={"text": "Hello"})
             # find the exact message
@@ -97,7 +105,7 @@ class MessageViewTestCase(TestCase):
         success and fail case """
         with self.client as c:
             with c.session_transaction() as sess:
-                sess[CURR_USER_KEY] = self.testuser.id
+                sess[CURR_USER_KEY] = self.testuser_id
 
             c.post("/messages/new", data={"text": "Hello"})
             m = Message.query.one()
@@ -122,24 +130,70 @@ class MessageViewTestCase(TestCase):
             html = resp.get_data(as_text=True)
             self.assertIn("Access unauthorized.", html)
 
-    def test_like_and_unlike_warble(self):
-        """ Can a user like the warble?"""
+    def test_delete_liked_message(self):
+        """ Deleting a message takes its likes off the likers' counts """
+        u2 = User.signup(username="testuser2",
+                         email="test2@test.com",
+                         password="testuser2",
+                         image_url=None)
+        db.session.commit()
+        u2_id = u2.id
+
         with self.client as c:
             with c.session_transaction() as sess:
-                sess[CURR_USER_KEY] = self.testuser.id
-
+                sess[CURR_USER_KEY] = self.testuser_id
             c.post("/messages/new", data={"text": "Hello"})
-            m = Message.query.one()
-            self.assertEqual(Like.query.count(), 0)
+            m_id = Message.query.one().id
 
-            # Test /like view
-            resp = c.post( f"/messages/{m.id}/like", follow_redirects=True)
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = u2_id
+            c.post(f"/messages/{m_id}/like")
+            self.assertEqual(User.query.get(u2_id).likes_count, 1)
+
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+            c.post(f"/messages/{m_id}/delete")
+
+        self.assertEqual(Like.query.count(), 0)
+        self.assertEqual(User.query.get(u2_id).likes_count, 0)
+        self.assertEqual(User.reconcile_counters(), 0)
+
+    def test_like_and_unlike_warble(self):
+        """ Do /like and /unlike answer with the like state and count, and
+        are they idempotent? """
+        u2 = User.signup(username="testuser2",
+                         email="test2@test.com",
+                         password="testuser2",
+                         image_url=None)
+        db.session.commit()
+        m = Message(text="Likeable", user_id=u2.id)
+        db.session.add(m)
+        db.session.commit()
+        m_id = m.id
+
+        # not logged in
+        resp = self.client.post(f"/messages/{m_id}/like")
+        self.assertEqual(resp.status_code, 401)
+        self.assertEqual(resp.json, {"error": "Access unauthorized."})
+        self.assertEqual(Like.query.count(), 0)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            for _ in range(2):
+                resp = c.post(f"/messages/{m_id}/like")
+                self.assertEqual(resp.status_code, 200)
+                self.assertEqual(resp.json, {"liked": True, "likes": 1})
             self.assertEqual(Like.query.count(), 1)
-            self.assertEqual(resp.status_code, 200)
 
-            # Test /unlike view
-            resp = c.post( f"/messages/{m.id}/unlike", follow_redirects=True)
+            for _ in range(2):
+                resp = c.post(f"/messages/{m_id}/unlike")
+                self.assertEqual(resp.status_code, 200)
+                self.assertEqual(resp.json, {"liked": False, "likes": 0})
             self.assertEqual(Like.query.count(), 0)
-            self.assertEqual(resp.status_code, 200)
 
-            # junk id, own warble, like already liked
\ No newline at end of file
+            # no such warble
+            resp = c.post("/messages/66666666/like")
+            self.assertEqual(resp.status_code, 404)
+            self.assertEqual(Like.query.count(), 0)
@@ -0,0 +1,147 @@
+"""Query-count tests: listing pages must not issue a query per row."""
+
+# run these tests like:
+#
+#    python -m unittest test_query_counts.py
+
+
+import os
+from contextlib import contextmanager
+from unittest import TestCase
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from models import db, User, Message, Like, Follows
+
+from app import create_app, CURR_USER_KEY
+import timeline
+
+# Run test modules in parallel by giving each its own database
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL',
+                                   "postgresql:///warbler-test")
+
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+    # Don't have WTForms use CSRF at all, since it's a pain to test
+    'WTF_CSRF_ENABLED': False,
+})
+
+
+def setUpModule():
+    with app.app_context():
+        db.create_all()
+
+
+NUM_AUTHORS = 10
+MESSAGES_PER_AUTHOR = 3
+
+
+@contextmanager
+def capture_queries():
+    """Capture the SQL statements run inside the `with` block.
+
+    Yields a list that collects a (statement, parameters) pair for each.
+    """
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, *args):
+        statements.append((statement, parameters))
+
+    # every engine: each test module's app has its own
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+
+
+class QueryCountTestCase(TestCase):
+    """Each listing page runs a fixed number of queries, however many
+    messages or authors it shows."""
+
+    def setUp(self):
+        """Create a reader following several authors, each with warbles,
+        some of them liked by the reader."""
+
+        Follows.query.delete()
+        Like.query.delete()
+        User.query.delete()
+        Message.query.delete()
+
+        reader = User(email="reader@test.com",
+                      username="reader",
+                      password="HASHED_PASSWORD")
+        db.session.add(reader)
+
+        authors = [User(email=f"author{i}@test.com",
+                        username=f"author{i}",
+                        password="HASHED_PASSWORD")
+                   for i in range(NUM_AUTHORS)]
+        db.session.add_all(authors)
+        db.session.commit()
+
+        for author in authors:
+            reader.following.append(author)
+            for i in range(MESSAGES_PER_AUTHOR):
+                author.messages.append(Message(text=f"{author.username} {i}"))
+        db.session.commit()
+
+        for author in authors:
+            db.session.add(Like(user_id=reader.id,
+                                msg_id=author.messages[0].id))
+        timeline.rebuild()
+        db.session.commit()
+
+        self.reader_id = reader.id
+        self.author_id = authors[0].id
+        self.message_id = authors[0].messages[0].id
+        self.client = app.test_client()
+
+    def tearDown(self):
+        """ Rollback transactions and remove the likes, which other test
+        modules don't clean up before deleting users """
+        db.session.rollback()
+        Like.query.delete()
+        db.session.commit()
+
+    def assert_max_queries(self, url, max_queries):
+        """GET `url` as the reader and check how many queries it ran."""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.reader_id
+
+            with capture_queries() as statements:
+                resp = c.get(url)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertLessEqual(len(statements), max_queries,
+                             "\n\n".join(sql for sql, _ in statements))
+
+    def test_home_queries(self):
+        """ Home timeline: user, timeline page, like state """
+        self.assert_max_queries("/", 3)
+
+    def test_users_show_queries(self):
+        """ Profile: viewer, profile user, message page, like state,
+        follow state for the header """
+        self.assert_max_queries(f"/users/{self.author_id}", 5)
+
+    def test_likes_show_queries(self):
+        """ Likes page: viewer, profile user, liked page, like state """
+        self.assert_max_queries(f"/users/{self.reader_id}/likes", 4)
+
+    def test_messages_show_queries(self):
+        """ Single message: viewer, message with author, like state,
+        follow state """
+        self.assert_max_queries(f"/messages/{self.message_id}", 4)
+
+    def test_users_index_queries(self):
+        """ User grid: viewer, user page, follow state """
+        self.assert_max_queries("/users", 3)
+
+    def test_following_queries(self):
+        """ Following grid: viewer, profile user, following, follow state """
+        self.assert_max_queries(f"/users/{self.reader_id}/following", 4)
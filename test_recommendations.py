@@ -0,0 +1,132 @@
+"""Recommendation tests: the batch job and "Who to follow"."""
+
+# run these tests like:
+#
+#    python -m unittest test_recommendations.py
+
+
+import os
+from unittest import TestCase
+
+from models import (
+    db, User, Message, Like, Follows, Suggestion, SuggestionVersion)
+
+from app import create_app, CURR_USER_KEY
+from follow_graph import follow_graph
+import recommendations
+
+# Run test modules in parallel by giving each its own database
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL',
+                                   "postgresql:///warbler-test")
+
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+    # Don't have WTForms use CSRF at all, since it's a pain to test
+    'WTF_CSRF_ENABLED': False,
+})
+
+
+def setUpModule():
+    with app.app_context():
+        db.create_all()
+
+
+class RecommendationsTestCase(TestCase):
+    def setUp(self):
+        Follows.query.delete()
+        Like.query.delete()
+        User.query.delete()
+        Message.query.delete()
+
+        users = {name: User(email=f"{name}@test.com", username=name,
+                            password="HASHED_PASSWORD")
+                 for name in ("ann", "bob", "cat", "dan", "eve")}
+        db.session.add_all(users.values())
+        db.session.commit()
+
+        # ann -> bob -> cat, and ann -> eve -> cat: cat is a friend of two
+        # of ann's friends. ann and dan like the same message.
+        for follower, followed in [("ann", "bob"), ("bob", "cat"),
+                                   ("ann", "eve"), ("eve", "cat")]:
+            db.session.add(Follows(user_following_id=users[follower].id,
+                                   user_being_followed_id=users[followed].id))
+        message = Message(text="Likeable", user_id=users["eve"].id)
+        db.session.add(message)
+        db.session.commit()
+        for name in ("ann", "dan"):
+            db.session.add(Like(user_id=users[name].id, msg_id=message.id))
+        db.session.commit()
+
+        self.ids = {name: user.id for name, user in users.items()}
+        follow_graph.reset()
+
+    def tearDown(self):
+        """ Rollback transactions and remove the likes, which other test
+        modules don't clean up before deleting users """
+        db.session.rollback()
+        Like.query.delete()
+        db.session.commit()
+
+    def suggested(self, name):
+        """{username: score} suggested to `name`, in rank order."""
+
+        rows = (db.session
+                .query(User.username, Suggestion.score)
+                .join(Suggestion, Suggestion.suggested_id == User.id)
+                .filter(Suggestion.user_id == self.ids[name])
+                .order_by(Suggestion.rank))
+        return dict(rows.all())
+
+    def test_refresh(self):
+        self.assertEqual(recommendations.refresh(), 5)
+
+        self.assertEqual(list(self.suggested("ann").items()),
+                         [("cat", 2.0), ("dan", 0.5)])
+        self.assertEqual(self.suggested("dan"), {"ann": 0.5})
+        # already following everyone they could be suggested
+        self.assertEqual(self.suggested("eve"), {})
+
+    def test_refresh_is_incremental(self):
+        recommendations.refresh()
+        self.assertEqual(recommendations.refresh(), 0)
+
+        with app.test_request_context():
+            ann = User.query.get(self.ids["ann"])
+            ann.follow(User.query.get(self.ids["cat"]))
+            db.session.commit()
+
+        # only ann's own follows changed: being followed doesn't make cat
+        # stale
+        self.assertEqual(recommendations.refresh(), 1)
+        self.assertEqual(self.suggested("ann"), {"dan": 0.5})
+        self.assertEqual(recommendations.refresh(), 0)
+
+        # nor does being liked, but liking does
+        before = SuggestionVersion.query.get(self.ids["dan"]).signature
+        with app.test_request_context():
+            message = Message(text="Mine", user_id=self.ids["bob"])
+            db.session.add(message)
+            db.session.commit()
+            db.session.add(Like(user_id=self.ids["dan"], msg_id=message.id))
+            db.session.commit()
+        self.assertEqual(recommendations.refresh(), 1)
+        self.assertNotEqual(
+            SuggestionVersion.query.get(self.ids["dan"]).signature, before)
+
+    def test_suggestions_page(self):
+        recommendations.refresh()
+
+        client = app.test_client()
+        self.assertEqual(client.get("/users/suggestions").status_code, 401)
+
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.ids["ann"]
+        html = client.get("/users/suggestions").get_data(as_text=True)
+        self.assertIn("Who to follow", html)
+        self.assertLess(html.index("@cat"), html.index("@dan"))
+
+        # followed since the refresh: no longer suggested
+        client.post(f"/users/follow/{self.ids['cat']}")
+        html = client.get("/users/suggestions").get_data(as_text=True)
+        self.assertNotIn("@cat", html)
+        self.assertIn("@dan", html)
@@ -0,0 +1,143 @@
+"""Search tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_search.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Like, Follows
+
+from app import create_app, CURR_USER_KEY
+from search import LikeMessageSearch, LikeUserSearch, message_search
+
+# Run test modules in parallel by giving each its own database
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL',
+                                   "postgresql:///warbler-test")
+
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+    # Don't have WTForms use CSRF at all, since it's a pain to test
+    'WTF_CSRF_ENABLED': False,
+})
+
+
+def setUpModule():
+    with app.app_context():
+        db.create_all()
+
+
+TEXTS = [
+    "Birds of a feather warble together",
+    "The early bird catches the worm",
+    "Warble warble warble all day long",
+    "Nothing to see here",
+    "A warble about nothing",
+]
+
+
+class MessageSearchTestCase(TestCase):
+    """Test /messages/search and the search backends."""
+
+    def setUp(self):
+        """Create a user with a few warbles."""
+
+        Follows.query.delete()
+        Like.query.delete()
+        User.query.delete()
+        Message.query.delete()
+
+        u = User.signup(username="testuser",
+                        email="test@test.com",
+                        password="testuser",
+                        image_url=None)
+        u.messages.extend(Message(text=text) for text in TEXTS)
+        db.session.commit()
+
+        self.user_id = u.id
+        self.client = app.test_client()
+
+    def tearDown(self):
+        """ Rollback transactions """
+        db.session.rollback()
+
+    def search_texts(self, backend, query, per_page=50):
+        """Page through every result of `query` on `backend`."""
+
+        texts = []
+        page = backend.search(query, per_page=per_page)
+        texts.extend(message.text for message in page.items)
+        while page.next_cursor:
+            page = backend.search(query, before=page.next_cursor,
+                                  per_page=per_page)
+            texts.extend(message.text for message in page.items)
+        return texts
+
+    def test_search_view(self):
+        """ Does /messages/search find and rank warbles? """
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            resp = c.get("/messages/search?q=warble")
+            html = resp.get_data(as_text=True)
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("Warble warble warble", html)
+            self.assertIn("Birds of a feather", html)
+            self.assertIn("A warble about nothing", html)
+            self.assertNotIn("The early bird", html)
+            self.assertLess(html.index("Warble warble warble"),
+                            html.index("Birds of a feather"))
+
+            resp = c.get("/messages/search?q=zebra")
+            self.assertIn("Sorry, no warbles found", resp.get_data(as_text=True))
+
+    def test_search_pages(self):
+        """ Do search cursors page through every result exactly once? """
+        for backend in [message_search, LikeMessageSearch()]:
+            texts = self.search_texts(backend, "warble", per_page=1)
+            self.assertEqual(len(texts), 3)
+            self.assertEqual(set(texts), {TEXTS[0], TEXTS[2], TEXTS[4]})
+
+    def test_like_search(self):
+        """ Does the LIKE backend require every word, rank by how often
+        they occur and see new warbles straight away? """
+        backend = LikeMessageSearch()
+        self.assertEqual(self.search_texts(backend, "warble NOTHING"),
+                         [TEXTS[4]])
+        self.assertEqual(self.search_texts(backend, "warble")[0], TEXTS[2])
+
+        # posted by another process: no index to tell about it
+        u = User.query.get(self.user_id)
+        msg = Message(text="Nothing beats a good warble")
+        u.messages.append(msg)
+        db.session.commit()
+        self.assertEqual(set(self.search_texts(backend, "warble nothing")),
+                         {TEXTS[4], "Nothing beats a good warble"})
+
+        db.session.delete(msg)
+        db.session.commit()
+        self.assertEqual(self.search_texts(backend, "warble nothing"),
+                         [TEXTS[4]])
+        self.assertEqual(self.search_texts(backend, ""), [])
+        self.assertEqual(self.search_texts(backend, "100%"), [])
+
+    def test_like_user_search(self):
+        """ Does the LIKE user backend rank username matches first? """
+        u = User.query.get(self.user_id)
+        u.bio = "Just a test"
+        for username, bio in [("tester", None), ("bob", "Testing, testing")]:
+            User.signup(username=username,
+                        email=f"{username}@test.com",
+                        password="password",
+                        image_url=None).bio = bio
+        db.session.commit()
+
+        backend = LikeUserSearch()
+        self.assertEqual([user.username for user in backend.search("TEST")],
+                         ["tester", "testuser", "bob"])
+        self.assertEqual([user.username for user in backend.typeahead("te")],
+                         ["tester", "testuser"])
+        self.assertEqual(backend.search("t_st"), [])
@@ -0,0 +1,194 @@
+"""Trending tests: windowed counters, persistence and /trending."""
+
+# run these tests like:
+#
+#    python -m unittest test_trending.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Like, Follows, TrendingCount
+
+from app import create_app, CURR_USER_KEY
+from trending import (
+    MESSAGE_LIKES, USER_FOLLOWERS, Trending, WindowedCounter, trending)
+
+# Run test modules in parallel by giving each its own database
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL',
+                                   "postgresql:///warbler-test")
+
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+    # Don't have WTForms use CSRF at all, since it's a pain to test
+    'WTF_CSRF_ENABLED': False,
+})
+
+
+def setUpModule():
+    with app.app_context():
+        db.create_all()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_800_000_000
+
+    def __call__(self):
+        return self.now
+
+
+class WindowedCounterTestCase(TestCase):
+    def test_window(self):
+        counter = WindowedCounter(buckets=3)
+        counter.add(10, "a", 1)
+        counter.add(11, "b", 1)
+        counter.add(11, "b", 1)
+        counter.add(12, "a", 1)
+        counter.add(12, "a", 1)
+
+        self.assertEqual(counter.top(5, 12), [("a", 3), ("b", 2)])
+        # bucket 10 has left the window
+        self.assertEqual(dict(counter.top(5, 13)), {"a": 2, "b": 2})
+        self.assertEqual(counter.top(1, 14), [("a", 2)])
+        self.assertEqual(counter.top(5, 15), [])
+
+    def test_take_back(self):
+        counter = WindowedCounter(buckets=3)
+        counter.add(10, "a", 1)
+        counter.add(10, "b", 1)
+        counter.add(11, "a", -1)
+
+        self.assertEqual(counter.top(5, 11), [("b", 1)])
+
+
+class TrendingTestCase(TestCase):
+    def setUp(self):
+        Follows.query.delete()
+        Like.query.delete()
+        User.query.delete()
+        Message.query.delete()
+        TrendingCount.query.delete()
+        db.session.commit()
+
+        users = [User(email=f"user{i}@test.com", username=f"user{i}",
+                      password="HASHED_PASSWORD")
+                 for i in range(4)]
+        db.session.add_all(users)
+        db.session.commit()
+        self.user_ids = [user.id for user in users]
+
+        quiet = Message(text="Quiet warble", user_id=self.user_ids[0])
+        popular = Message(text="Popular warble", user_id=self.user_ids[0])
+        db.session.add_all([quiet, popular])
+        db.session.commit()
+        self.quiet_id = quiet.id
+        self.popular_id = popular.id
+
+        trending.reset()
+        self.clock = trending.clock = FakeClock()
+
+    def tearDown(self):
+        """ Rollback transactions and remove the likes, which other test
+        modules don't clean up before deleting users """
+        db.session.rollback()
+        Like.query.delete()
+        db.session.commit()
+        trending.reset()
+
+    def client_for(self, user_id):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+        return client
+
+    def like(self, user_id, message_id):
+        resp = self.client_for(user_id).post(f"/messages/{message_id}/like")
+        self.assertEqual(resp.status_code, 200)
+
+    def test_likes_and_follows_counted(self):
+        for user_id in self.user_ids[1:]:
+            self.like(user_id, self.popular_id)
+        self.like(self.user_ids[1], self.quiet_id)
+        # liking again changes nothing
+        self.like(self.user_ids[1], self.quiet_id)
+        self.client_for(self.user_ids[2]).post(
+            f"/users/follow/{self.user_ids[3]}")
+
+        with app.test_request_context():
+            self.assertEqual(trending.top(MESSAGE_LIKES),
+                             [(self.popular_id, 3), (self.quiet_id, 1)])
+            self.assertEqual(trending.top(USER_FOLLOWERS),
+                             [(self.user_ids[3], 1)])
+
+        self.client_for(self.user_ids[1]).post(
+            f"/messages/{self.quiet_id}/unlike")
+        with app.test_request_context():
+            self.assertEqual(trending.top(MESSAGE_LIKES),
+                             [(self.popular_id, 3)])
+
+    def test_page(self):
+        self.like(self.user_ids[1], self.quiet_id)
+        for user_id in self.user_ids[1:]:
+            self.like(user_id, self.popular_id)
+
+        html = self.client_for(self.user_ids[1]).get(
+            "/trending").get_data(as_text=True)
+
+        self.assertLess(html.index("Popular warble"),
+                        html.index("Quiet warble"))
+
+    def test_sync(self):
+        """Counts reach the table and other processes at the next sync,
+        and leave both when they age out."""
+
+        for user_id in self.user_ids[1:]:
+            self.like(user_id, self.popular_id)
+
+        with app.test_request_context():
+            # only the first like is saved yet: counters sync on first use
+            other_process = Trending()
+            other_process.clock = self.clock
+            self.assertEqual(other_process.top(MESSAGE_LIKES),
+                             [(self.popular_id, 1)])
+
+            self.clock.now += 60
+            trending.sync_if_due()
+            self.assertEqual(TrendingCount.query.one().count, 3)
+
+            other_process.sync()
+            self.assertEqual(other_process.top(MESSAGE_LIKES),
+                             [(self.popular_id, 3)])
+
+            self.clock.now += 2 * 60 * 60
+            trending.sync()
+            self.assertEqual(trending.top(MESSAGE_LIKES), [])
+            self.assertEqual(TrendingCount.query.count(), 0)
+
+    def test_sync_counts_once(self):
+        """Reloading after a sync doesn't count saved likes again."""
+
+        self.like(self.user_ids[1], self.popular_id)
+        self.like(self.user_ids[2], self.popular_id)
+
+        with app.test_request_context():
+            trending.sync()
+            trending.sync()
+            self.assertEqual(trending.top(MESSAGE_LIKES),
+                             [(self.popular_id, 2)])
+
+    def test_sync_leaves_session_alone(self):
+        """A sync neither commits nor rolls back the request's session."""
+
+        self.like(self.user_ids[1], self.popular_id)
+
+        with app.test_request_context():
+            db.session.add(Message(text="Unsaved warble",
+                                   user_id=self.user_ids[1]))
+            db.session.flush()
+            trending.sync()
+            self.assertEqual(TrendingCount.query.one().count, 1)
+            db.session.rollback()
+
+        self.assertIsNone(
+            Message.query.filter_by(text="Unsaved warble").one_or_none())
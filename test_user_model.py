@@ -10,22 +10,23 @@ from unittest import TestCase
 from sqlalchemy.exc import IntegrityError
 from models import db, User, Message, Follows
 
-# BEFORE we import our app, let's set an environmental variable
-# to use a different database for tests (we need to do this
-# before we import our app, since that will have already
-# connected to the database
+from app import create_app
 
-os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+# Run test modules in parallel by giving each its own database
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL',
+                                   "postgresql:///warbler-test")
 
-# Now we can import app
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+})
 
-from app import app
 
-# Create our tables (we do this here, so we only create the tables
+# Create our tables (we do this in setUpModule, so we only create the tables
 # once for all tests --- in each test, we'll delete the data
 # and create fresh new clean test data
-
-db.create_all()
+def setUpModule():
+    with app.app_context():
+        db.create_all()
 
 
 class UserModelTestCase(TestCase):
@@ -101,6 +102,44 @@ class UserModelTestCase(TestCase):
         self.assertEqual(u2.is_followed_by(u1), False)
         self.assertEqual(u1.is_followed_by(u2), False)
 
+    def test_user_counters(self):
+        """ Do adjust_counters and reconcile_counters keep counts right? """
+
+        u1 = User(
+            email="test1@test.com",
+            username="testuser1",
+            password="HASHED_PASSWORD"
+        )
+
+        u2 = User(
+            email="test2@test.com",
+            username="testuser2",
+            password="HASHED_PASSWORD"
+        )
+
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        self.assertEqual(u1.followers_count, 0)
+
+        User.adjust_counters([u1.id, u2.id], followers_count=2)
+        db.session.commit()
+        self.assertEqual(u1.followers_count, 2)
+        self.assertEqual(u2.followers_count, 2)
+
+        # the real data: u1 follows u2 and has one warble
+        db.session.add(Follows(user_being_followed_id=u2.id,
+                               user_following_id=u1.id))
+        db.session.add(Message(text="counted", user_id=u1.id))
+        db.session.commit()
+
+        self.assertEqual(User.reconcile_counters(), 2)
+        db.session.commit()
+        self.assertEqual(u1.followers_count, 0)
+        self.assertEqual(u1.following_count, 1)
+        self.assertEqual(u1.messages_count, 1)
+        self.assertEqual(u2.followers_count, 1)
+        self.assertEqual(User.reconcile_counters(), 0)
+
     def test_user_register(self):
         """ Can we create new users?"""
 
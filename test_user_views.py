@@ -6,31 +6,33 @@
 
 
 import os
+import re
+from html import unescape
 from unittest import TestCase
 
 from models import db, connect_db, User, Like, Message, Follows
+from pagination import MESSAGES_PER_PAGE
 
-# BEFORE we import our app, let's set an environmental variable
-# to use a different database for tests (we need to do this
-# before we import our app, since that will have already
-# connected to the database
+from app import create_app, CURR_USER_KEY
 
-os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+# Run test modules in parallel by giving each its own database
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL',
+                                   "postgresql:///warbler-test")
 
-# Now we can import app
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+    # Don't have WTForms use CSRF at all, since it's a pain to test
+    'WTF_CSRF_ENABLED': False,
+})
 
-from app import app, CURR_USER_KEY
 
-# Create our tables (we do this here, so we only create the tables
+# Create our tables (we do this in setUpModule, so we only create the tables
 # once for all tests --- in each test, we'll delete the data
 # and create fresh new clean test data
-
-db.drop_all()
-db.create_all()
-
-# Don't have WTForms use CSRF at all, since it's a pain to test
-
-app.config['WTF_CSRF_ENABLED'] = False
+def setUpModule():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
 
 
 class UserViewTestCase(TestCase):
@@ -120,6 +122,13 @@ class UserViewTestCase(TestCase):
         self.assertEqual(resp.status_code, 200)
         self.assertIn('id="users-index"', html)
 
+    def test_view_users_anonymous(self):
+        """ Test /users when not logged in """
+        resp = self.client.get("/users")
+        html = resp.get_data(as_text=True)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("@testuser", html)
+
     def test_view_userid(self):
         """ Test /users/{user_id} """
         with self.client as c:
@@ -181,6 +190,20 @@ class UserViewTestCase(TestCase):
         self.assertIn('id="following"', html)
         self.assertIn("testuser2", html)
 
+    def test_view_follow_self(self):
+        """ Test following yourself is refused, as in the API """
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+            resp = c.post(f"/users/follow/{self.user_id}",
+                          follow_redirects=True)
+
+        self.assertIn("You can&#39;t follow yourself.",
+                      resp.get_data(as_text=True))
+        self.assertEqual(Follows.query.count(), 0)
+        u = User.query.get(self.user_id)
+        self.assertEqual((u.following_count, u.followers_count), (0, 0))
+
     def test_view_stop_following(self):
         """ Test stop following """
         with self.client as c:
@@ -289,3 +312,167 @@ class UserViewTestCase(TestCase):
         self.assertIsNone(User.query.get(self.user_id))
         self.assertEqual(resp.status_code, 200)
         self.assertIn("Join Warbler today.", html)
+
+    def test_delete_user_with_liked_message(self):
+        """ Deleting a user takes their message's likes off the likers'
+        counts """
+        u = User.query.get(self.user_id)
+        m = Message(text="Soon gone")
+        u.messages.append(m)
+        u2 = User.signup(username="testuser2",
+                         email="test2@test.com",
+                         password="testuser2",
+                         image_url=None)
+        db.session.commit()
+        u2_id = u2.id
+        Like.add(u2_id, m.id)
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+            c.post("/users/delete")
+
+        self.assertIsNone(User.query.get(self.user_id))
+        self.assertEqual(User.query.get(u2_id).likes_count, 0)
+        self.assertEqual(User.reconcile_counters(), 0)
+
+    def test_home_timeline_follow_and_unfollow(self):
+        """ Following backfills the home timeline, new warbles fan out
+        to followers and unfollowing prunes them again """
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+        # helper
+        u2 = User.signup(username="testuser2",
+                         email="test2@test.com",
+                         password="testuser2",
+                         image_url=None)
+        u2.messages.append(Message(text="Warble before follow"))
+        db.session.commit()
+        u2_id = u2.id
+
+        resp = c.get("/")
+        self.assertNotIn("Warble before follow", resp.get_data(as_text=True))
+
+        c.post(f"/users/follow/{u2_id}")
+        resp = c.get("/")
+        self.assertIn("Warble before follow", resp.get_data(as_text=True))
+
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = u2_id
+        c.post("/messages/new", data={"text": "Warble after follow"})
+
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+        resp = c.get("/")
+        self.assertIn("Warble after follow", resp.get_data(as_text=True))
+
+        c.post(f"/users/stop-following/{u2_id}")
+        resp = c.get("/")
+        html = resp.get_data(as_text=True)
+        self.assertNotIn("Warble before follow", html)
+        self.assertNotIn("Warble after follow", html)
+
+    def test_view_userid_paginated(self):
+        """ Test /users/{user_id} pages through messages with a cursor """
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+        u = User.query.get(self.user_id)
+        for i in range(MESSAGES_PER_PAGE + 5):
+            u.messages.append(Message(text=f"warble number {i}."))
+        db.session.commit()
+
+        resp = c.get(f"/users/{self.user_id}")
+        html = resp.get_data(as_text=True)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(f"warble number {MESSAGES_PER_PAGE + 4}.", html)
+        self.assertNotIn("warble number 0.", html)
+        self.assertIn('class="list-group-item next-page"', html)
+
+        next_url = re.search(r'data-next="([^"]+)"', html).group(1)
+        resp = c.get(unescape(next_url) + "&fragment=1")
+        html = resp.get_data(as_text=True)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn('id="user-details"', html)
+        self.assertIn("warble number 0.", html)
+        self.assertNotIn(f"warble number {MESSAGES_PER_PAGE + 4}.", html)
+        self.assertNotIn("next-page", html)
+
+        resp = c.get(f"/users/{self.user_id}?before=garbage")
+        self.assertEqual(resp.status_code, 400)
+
+    def test_home_like_state(self):
+        """ Liked warbles on the home page render as liked """
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+        # helper
+        u2 = User.signup(username="testuser2",
+                         email="test2@test.com",
+                         password="testuser2",
+                         image_url=None)
+        liked = Message(text="Liked warble")
+        not_liked = Message(text="Other warble")
+        u2.messages.extend([liked, not_liked])
+        db.session.commit()
+        liked_id = liked.id
+        not_liked_id = not_liked.id
+        db.session.add(Like(user_id=self.user_id, msg_id=liked_id))
+        db.session.commit()
+
+        c.post(f"/users/follow/{u2.id}")
+        resp = c.get("/")
+        html = resp.get_data(as_text=True)
+        self.assertIn(f'<form class="form-group liked" id="{liked_id}">', html)
+        self.assertIn(f'<form class="form-group not-liked" id="{not_liked_id}">',
+                      html)
+
+    def test_view_users_search(self):
+        """ Test /users?q= ranks username matches first and also matches
+        bios and locations, case-insensitively """
+        for username, bio, location in [
+                ("warblefan", "I like birds", "Oakland"),
+                ("bob", "Professional warbler", "Berkeley"),
+                ("alice", "Nothing to see here", "Warbleton")]:
+            u = User.signup(username=username,
+                            email=f"{username}@test.com",
+                            password="password",
+                            image_url=None)
+            u.bio = bio
+            u.location = location
+        db.session.commit()
+
+        resp = self.client.get("/users?q=WARBLE")
+        html = resp.get_data(as_text=True)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("@warblefan", html)
+        self.assertIn("@bob", html)
+        self.assertIn("@alice", html)
+        self.assertNotIn("@testuser", html)
+        self.assertLess(html.index("@warblefan"), html.index("@bob"))
+
+        resp = self.client.get("/users?q=zzzzzz")
+        self.assertIn("Sorry, no users found", resp.get_data(as_text=True))
+
+    def test_view_users_typeahead(self):
+        """ Test /users/typeahead returns prefix matches as JSON """
+        u2 = User.signup(username="testuser2",
+                         email="test2@test.com",
+                         password="testuser2",
+                         image_url=None)
+        db.session.commit()
+
+        resp = self.client.get("/users/typeahead?q=TestU")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([u["username"] for u in resp.json],
+                         ["testuser", "testuser2"])
+
+        resp = self.client.get("/users/typeahead?q=nobody")
+        self.assertEqual(resp.json, [])
+
+        # the search box asks for them
+        html = self.client.get("/users").get_data(as_text=True)
+        self.assertIn('list="search-users"', html)
+        self.assertRegex(html, r'/assets/typeahead\.[0-9a-f]+\.js')
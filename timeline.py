@@ -0,0 +1,177 @@
+"""Materialized home timelines for Warbler (fan-out on write).
+
+Instead of collecting everyone a user follows and scanning their messages
+on every page view, each new message is pushed into the `timelines` table
+once per reader when it is posted. Reading a home timeline is then a single
+indexed range read on the (user_id, msg_id) primary key; message ids are
+time-ordered, so that is newest first.
+
+Timelines only keep their newest TIMELINE_SIZE messages: `trim()` (`flask
+trim-timelines`, run it from cron) drops the older ones, so the table grows
+with the number of readers rather than messages times followers. Pushing a
+message stays one insert per reader; a follow's backfill trims that one
+reader's timeline straight away.
+"""
+
+from sqlalchemy import and_, func, literal, select, tuple_
+from sqlalchemy.orm import joinedload
+
+from models import db, Follows, Message, TimelineEntry
+from pagination import MESSAGES_PER_PAGE, paginate_by_id
+
+# How many of a user's most recent messages get copied into a new
+# follower's timeline when the follow happens.
+BACKFILL_SIZE = 100
+
+# How many messages each home timeline keeps (see `trim()`).
+TIMELINE_SIZE = 800
+
+TIMELINE_COLUMNS = ['user_id', 'msg_id', 'author_id']
+
+timelines = TimelineEntry.__table__
+
+
+def fan_out(message):
+    """Push `message` into its author's timeline and each follower's.
+
+    Call after the message has been flushed (so it has an id).
+    """
+
+    followers = (select(Follows.user_following_id,
+                        literal(message.id),
+                        literal(message.user_id))
+                 .where(Follows.user_being_followed_id == message.user_id))
+    author = select(literal(message.user_id),
+                    literal(message.id),
+                    literal(message.user_id))
+
+    db.session.execute(
+        timelines.insert().from_select(TIMELINE_COLUMNS,
+                                       followers.union_all(author)))
+
+
+def backfill(follower_id, followed_id, limit=BACKFILL_SIZE):
+    """Copy the most recent messages of `followed_id` into the timeline of
+    `follower_id`. Messages already in the timeline are skipped.
+    """
+
+    already_there = (select(TimelineEntry.msg_id)
+                     .where(and_(TimelineEntry.user_id == follower_id,
+                                 TimelineEntry.msg_id == Message.id))
+                     .exists())
+    recent = (select(literal(follower_id),
+                     Message.id,
+                     Message.user_id)
+              .where(Message.user_id == followed_id)
+              .where(~already_there)
+              .order_by(Message.id.desc())
+              .limit(limit))
+
+    db.session.execute(
+        timelines.insert().from_select(TIMELINE_COLUMNS, recent))
+    trim([follower_id])
+
+
+def trim(user_ids=None, size=TIMELINE_SIZE):
+    """Drop all but the newest `size` messages from the timelines of
+    `user_ids` (by default everyone's). Returns how many were dropped."""
+
+    rank = (func.row_number()
+            .over(partition_by=TimelineEntry.user_id,
+                  order_by=TimelineEntry.msg_id.desc())
+            .label('rank'))
+    ranked = select(TimelineEntry.user_id, TimelineEntry.msg_id, rank)
+    if user_ids is not None:
+        ranked = ranked.where(TimelineEntry.user_id.in_(user_ids))
+    ranked = ranked.subquery()
+    old = (select(ranked.c.user_id, ranked.c.msg_id)
+           .where(ranked.c.rank > size))
+
+    return (TimelineEntry
+            .query
+            .filter(tuple_(TimelineEntry.user_id,
+                           TimelineEntry.msg_id).in_(old))
+            .delete(synchronize_session=False))
+
+
+def prune(follower_id, followed_id):
+    """Remove every message by `followed_id` from `follower_id`'s timeline."""
+
+    (TimelineEntry
+        .query
+        .filter_by(user_id=follower_id, author_id=followed_id)
+        .delete(synchronize_session=False))
+
+
+def remove_message(message_id):
+    """Remove a message from every timeline it was pushed into."""
+
+    (TimelineEntry
+        .query
+        .filter_by(msg_id=message_id)
+        .delete(synchronize_session=False))
+
+
+def home_timeline(user_id, before=None):
+    """Return a Page of messages from `user_id`'s home timeline, newest
+    first, starting after the `before` cursor (see pagination.py).
+    """
+
+    query = (Message
+             .query
+             .join(TimelineEntry, TimelineEntry.msg_id == Message.id)
+             .filter(TimelineEntry.user_id == user_id)
+             .options(joinedload(Message.user)))
+
+    return paginate_by_id(query, TimelineEntry.msg_id, before=before,
+                          per_page=MESSAGES_PER_PAGE)
+
+
+def rebuild(per_author=None, per_reader=None):
+    """Rebuild every timeline from the `messages` and `follows` tables.
+
+    Used after bulk loads (see seed.py), which bypass `fan_out()`. With
+    `per_author`, only each author's most recent `per_author` messages are
+    pushed, like `backfill()` does; with `per_reader`, each timeline keeps
+    only its newest `per_reader`, like `trim()` does. On big synthetic
+    datasets a popular author's whole history times their followers is far
+    too many rows, and so is every reader's share of each author they follow.
+    """
+
+    TimelineEntry.query.delete(synchronize_session=False)
+
+    messages = select(Message.id, Message.user_id)
+    if per_author is not None:
+        rank = (func.row_number()
+                .over(partition_by=Message.user_id,
+                      order_by=Message.id.desc())
+                .label('rank'))
+        ranked = select(Message.id, Message.user_id, rank).subquery()
+        messages = (select(ranked.c.id, ranked.c.user_id)
+                    .where(ranked.c.rank <= per_author))
+    messages = messages.subquery()
+
+    followers = (select(Follows.user_following_id.label('user_id'),
+                        messages.c.id.label('msg_id'),
+                        messages.c.user_id.label('author_id'))
+                 .join(Follows,
+                       Follows.user_being_followed_id == messages.c.user_id))
+    authors = select(messages.c.user_id,
+                     messages.c.id,
+                     messages.c.user_id)
+    entries = followers.union_all(authors)
+
+    if per_reader is not None:
+        entries = entries.subquery()
+        rank = (func.row_number()
+                .over(partition_by=entries.c.user_id,
+                      order_by=entries.c.msg_id.desc())
+                .label('rank'))
+        ranked = select(entries, rank).subquery()
+        entries = (select(ranked.c.user_id,
+                          ranked.c.msg_id,
+                          ranked.c.author_id)
+                   .where(ranked.c.rank <= per_reader))
+
+    db.session.execute(
+        timelines.insert().from_select(TIMELINE_COLUMNS, entries))
@@ -0,0 +1,205 @@
+"""Trending warbles and hot users, from windowed counters.
+
+`/trending` ranks messages by the likes they got and users by the
+followers they gained over the last TRENDING_BUCKETS buckets of
+TRENDING_BUCKET_SECONDS each (an hour, by default). The views that like,
+unlike, follow and unfollow bump the counters, so the ranking never scans
+`likes` or `follows`.
+
+Counts live in memory, one `WindowedCounter` per ranking: a dict of counts
+per time bucket plus running totals over the window, from which buckets
+drop off as they age out. Every TRENDING_SYNC_SECONDS `sync()` adds the
+counts recorded since the last one to `trending_counts` (a row per kind,
+bucket and id), removes buckets that have aged out, and reloads the window
+from the table, so a restarted process starts from the current trends and
+every process sees the others' counts. Syncs run in the request that finds
+one due, on a connection and transaction of their own (always the primary
+database), so they never commit or roll back the request's session.
+"""
+
+import threading
+import time
+from collections import Counter
+from heapq import nlargest
+from operator import itemgetter
+
+from flask import current_app
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, TrendingCount
+
+DEFAULT_BUCKET_SECONDS = 5 * 60
+DEFAULT_BUCKETS = 12
+DEFAULT_SYNC_SECONDS = 30
+
+# The rankings (`TrendingCount.kind`).
+MESSAGE_LIKES = 'message-likes'
+USER_FOLLOWERS = 'user-followers'
+KINDS = (MESSAGE_LIKES, USER_FOLLOWERS)
+
+# How many of each /trending shows
+SHOWN = {MESSAGE_LIKES: 20, USER_FOLLOWERS: 10}
+
+
+class WindowedCounter:
+    """Counts per id over a sliding window of time buckets."""
+
+    def __init__(self, buckets):
+        self.size = buckets
+        self.buckets = {}
+        self.totals = Counter()
+
+    def add(self, bucket, id, delta):
+        """Count `delta` for `id` in `bucket` (an unlike or unfollow is -1).
+        Buckets that have left the window drop off."""
+
+        self.expire(bucket)
+        self.buckets.setdefault(bucket, Counter())[id] += delta
+        self.totals[id] += delta
+
+    def expire(self, bucket):
+        """Drop the buckets that are out of the window ending at `bucket`."""
+
+        old = [b for b in self.buckets if b <= bucket - self.size]
+        for b in old:
+            self.totals.subtract(self.buckets.pop(b))
+        if old:
+            # keep only ids still counted in the window
+            self.totals = +self.totals
+
+    def top(self, count, bucket):
+        """The `count` ids with the highest totals in the window ending at
+        `bucket`, as (id, total) pairs, highest first."""
+
+        self.expire(bucket)
+        return nlargest(count,
+                        ((id, total) for id, total in self.totals.items()
+                         if total > 0),
+                        key=itemgetter(1))
+
+
+class Trending:
+    """The trending counters of this process, loaded on first use."""
+
+    def __init__(self):
+        self.counters = None
+        self.pending = Counter()
+        self.synced_at = None
+        self.lock = threading.Lock()
+        self.clock = time.time
+
+    def _configure(self):
+        if self.counters is None:
+            config = current_app.config
+            self.bucket_seconds = config.get('TRENDING_BUCKET_SECONDS',
+                                             DEFAULT_BUCKET_SECONDS)
+            self.size = config.get('TRENDING_BUCKETS', DEFAULT_BUCKETS)
+            self.sync_seconds = config.get('TRENDING_SYNC_SECONDS',
+                                           DEFAULT_SYNC_SECONDS)
+            self.counters = {kind: WindowedCounter(self.size)
+                             for kind in KINDS}
+
+    def bucket(self):
+        return int(self.clock() // self.bucket_seconds)
+
+    def record(self, kind, id, delta=1):
+        """Count a like (or follow) of `id`; call after committing it."""
+
+        self._configure()
+        bucket = self.bucket()
+        with self.lock:
+            self.counters[kind].add(bucket, id, delta)
+            self.pending[kind, bucket, id] += delta
+        self.sync_if_due()
+
+    def record_like(self, message_id, delta=1):
+        self.record(MESSAGE_LIKES, message_id, delta)
+
+    def record_follow(self, user_id, delta=1):
+        self.record(USER_FOLLOWERS, user_id, delta)
+
+    def top(self, kind, count=None):
+        """[(id, count)] of the `count` top ids of `kind`, highest first
+        (by default as many as /trending shows)."""
+
+        if count is None:
+            count = SHOWN[kind]
+        self._configure()
+        self.sync_if_due()
+        bucket = self.bucket()
+        with self.lock:
+            return self.counters[kind].top(count, bucket)
+
+    def sync_if_due(self):
+        """Sync if it's time. A failed sync is logged rather than failing
+        the request, whose own work is already committed; its counts are
+        saved with the next one."""
+
+        if (self.synced_at is None
+                or self.clock() - self.synced_at >= self.sync_seconds):
+            try:
+                self.sync()
+            except Exception:
+                current_app.logger.exception("Trending sync failed")
+
+    def sync(self):
+        """Save the counts recorded since the last sync to
+        `trending_counts`, then reload the window from it."""
+
+        self._configure()
+        self.synced_at = self.clock()
+        oldest = self.bucket() - self.size + 1
+
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+        try:
+            with db.engine.begin() as connection:
+                self._save(connection, pending, oldest)
+                rows = connection.execute(
+                    select(TrendingCount.kind, TrendingCount.bucket,
+                           TrendingCount.item_id, TrendingCount.count)
+                    .where(TrendingCount.bucket >= oldest)).all()
+        except Exception:
+            with self.lock:
+                self.pending.update(pending)
+            raise
+
+        counters = {kind: WindowedCounter(self.size) for kind in KINDS}
+        for kind, bucket, id, count in rows:
+            counters[kind].add(bucket, id, count)
+        with self.lock:
+            # counts recorded while this ran aren't in `rows` yet
+            for (kind, bucket, id), delta in self.pending.items():
+                counters[kind].add(bucket, id, delta)
+            self.counters = counters
+
+    def _save(self, connection, pending, oldest):
+        rows = [{'kind': kind, 'bucket': bucket, 'item_id': id,
+                 'count': delta}
+                for (kind, bucket, id), delta in pending.items()
+                if delta and bucket >= oldest]
+        if rows:
+            insert = (postgresql.insert
+                      if connection.dialect.name == 'postgresql'
+                      else sqlite.insert)(TrendingCount)
+            connection.execute(
+                insert.on_conflict_do_update(
+                    index_elements=['kind', 'bucket', 'item_id'],
+                    set_={'count': TrendingCount.count
+                          + insert.excluded['count']}),
+                rows)
+
+        connection.execute(
+            delete(TrendingCount).where(TrendingCount.bucket < oldest))
+
+    def reset(self):
+        """Forget everything, in memory only."""
+
+        with self.lock:
+            self.counters = None
+            self.pending = Counter()
+            self.synced_at = None
+
+
+trending = Trending()